@@ -13,15 +13,50 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
+import math
+import threading
 import torch
-from typing import Tuple
+import numpy as np
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from pathlib import Path
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    LogitsProcessorList,
+    StoppingCriteriaList,
+)
 
 from sparktts.utils.file import load_config
+from sparktts.utils.fast_load import hf_load_kwargs
+from sparktts.utils.prompt_cache import PromptCache
+from sparktts.utils.prefix_cache import PrefixKVCache
+from sparktts.utils.quantization import check_quantize, quantize_llm
+from sparktts.utils.generation_budget import (
+    STATUS_BUDGET_CAP,
+    STATUS_EOS,
+    STATUS_STOPPED,
+    GenerationBudget,
+    GenerationStats,
+    RunawayStoppingCriteria,
+)
+from sparktts.utils.voice_pack import VoicePack
+from sparktts.utils.streaming import StopFlagCriteria, TokenIdStreamer
 from sparktts.models.audio_tokenizer import BiCodecTokenizer
-from sparktts.utils.token_parser import LEVELS_MAP, GENDER_MAP, TASK_TOKEN_MAP
+from sparktts.models.audio_lm_decoder import (
+    AudioGrammar,
+    AudioGrammarLogitsProcessor,
+    AudioLMDecoder,
+)
+from sparktts.utils.token_parser import (
+    LEVELS_MAP,
+    GENDER_MAP,
+    AudioTokenMap,
+    PromptBuilder,
+)
+
+MODES = ("clone", "control")
+# vocoder contexts of `inference_stream(low_latency=True)`, in tokens (20 ms each)
+LOW_LATENCY_STREAM = {"prenet_context": 8, "decoder_context": 8, "crossfade": 4}
 
 
 class SparkTTS:
@@ -29,13 +64,63 @@ class SparkTTS:
     Spark-TTS for text-to-speech generation.
     """
 
-    def __init__(self, model_dir: Path, device = torch.device("cuda:0")):
+    def __init__(
+        self,
+        model_dir: Path,
+        device = torch.device("cuda:0"),
+        prompt_cache: PromptCache = None,
+        prompt_cache_dir: Path = None,
+        voice_pack: Path = None,
+        prefix_cache: PrefixKVCache = None,
+        budget: GenerationBudget = None,
+        restrict_vocab: bool = False,
+        constrained: bool = True,
+        quantize: str = None,
+        compile_vocoder: str = None,
+        modes: Iterable[str] = MODES,
+        lazy: bool = False,
+        fast_load: bool = False,
+        bicodec_dtype: Optional[torch.dtype] = None,
+    ):
         """
         Initializes the SparkTTS model with the provided configurations and device.
 
         Args:
             model_dir (Path): Directory containing the model and config files.
             device: The device (CPU/GPU) to run the model on. Can be a string ('cpu', 'cuda:0') or torch.device object.
+            prompt_cache (PromptCache, optional): Cache of reference audio tokens. A 64 MB
+                in-memory cache is created when not given.
+            prompt_cache_dir (Path, optional): On-disk store for the default prompt cache.
+            voice_pack (Path, optional): Precomputed voice pack, see `cli/build_voice_pack.py`.
+            prefix_cache (PrefixKVCache, optional): Cache of LLM key/values of previous
+                prompts, reused for the longest shared token prefix of a new prompt.
+                Only the task token and prompt transcript can be shared between texts,
+                so it helps voices with long transcripts. Default is None (off).
+            budget (GenerationBudget, optional): Cap on generated tokens estimated from
+                the text. Defaults to 3x the expected semantic tokens.
+            restrict_vocab (bool, optional): Decode with an LM head sliced to the audio
+                vocabulary instead of the full text vocabulary. Default is False.
+            constrained (bool, optional): Restrict every decode step to the tokens the
+                output grammar allows and insert structural tokens without sampling,
+                see `AudioGrammar`. Default is True.
+            quantize (str, optional): "int8" applies dynamic int8 quantization to the
+                Linear layers of the LLM and of the audio tokenizer, see
+                `sparktts.utils.quantization`. CPU only. Default is None.
+            compile_vocoder (str, optional): "inductor" or "torchscript" to vocode with
+                semantic lengths padded to a few compiled buckets, see `BucketedVocoder`.
+                Call `warmup` to compile them at startup. Default is None (eager).
+            modes (Iterable[str], optional): Inference modes to serve, "clone" and/or
+                "control". Without "clone", wav2vec2 and the BiCodec encoder side are
+                never loaded. Default is both.
+            lazy (bool, optional): Load the audio tokenizer models on first use instead of
+                at construction; `warmup` loads them up front. Default is False.
+            fast_load (bool, optional): Build the models with parameters on the meta
+                device and assign memory-mapped checkpoint weights instead of running
+                random init and copying the checkpoint, see `sparktts.utils.fast_load`.
+                Needs `accelerate` with transformers 4.x. Default is False.
+            bicodec_dtype (torch.dtype, optional): Compute dtype of a BiCodec inference
+                checkpoint from cli/export_bicodec.py, see `BiCodecTokenizer`. Default
+                is None, the storage dtype of the export.
         """
         # 处理设备参数
         if isinstance(device, str):
@@ -54,21 +139,199 @@ class SparkTTS:
         self.model_dir = model_dir
         self.configs = load_config(f"{model_dir}/config.yaml")
         self.sample_rate = self.configs["sample_rate"]
+        if prompt_cache is None:
+            prompt_cache = PromptCache(cache_dir=prompt_cache_dir)
+        self.prompt_cache = prompt_cache
+        self.voice_pack = VoicePack(voice_pack) if voice_pack is not None else None
+        self.prefix_cache = prefix_cache
+        self.budget = budget if budget is not None else GenerationBudget()
+        self.generation_stats = GenerationStats()
+        self.last_status: List[str] = []
+        self.restrict_vocab = restrict_vocab
+        self.constrained = constrained
+        check_quantize(quantize, self.device)
+        self.quantize = quantize
+        self.compile_vocoder = compile_vocoder
+        self.modes = set(modes)
+        if not self.modes or not self.modes <= set(MODES):
+            raise ValueError(f"Unsupported modes: {modes}, expected a subset of {MODES}")
+        self.lazy = lazy
+        self.fast_load = fast_load
+        self.bicodec_dtype = bicodec_dtype
         self._initialize_inference()
 
     def _initialize_inference(self):
         """Initializes the tokenizer, model, and audio tokenizer for inference."""
         self.tokenizer = AutoTokenizer.from_pretrained(f"{self.model_dir}/LLM")
-        self.model = AutoModelForCausalLM.from_pretrained(f"{self.model_dir}/LLM")
-        self.audio_tokenizer = BiCodecTokenizer(self.model_dir, device=self.device)
+        # batched generation continues from the last prompt token of every row
+        self.tokenizer.padding_side = "left"
+        self.model = AutoModelForCausalLM.from_pretrained(
+            f"{self.model_dir}/LLM", **hf_load_kwargs(self.fast_load)
+        )
+        self.token_map = AudioTokenMap(self.tokenizer, self.model.config.vocab_size)
+        self.prompt_builder = PromptBuilder(self.tokenizer, self.token_map)
+        self.audio_tokenizer = BiCodecTokenizer(
+            self.model_dir,
+            device=self.device,
+            quantize=self.quantize,
+            compile_vocoder=self.compile_vocoder,
+            decode_only="clone" not in self.modes,
+            lazy=self.lazy,
+            fast_load=self.fast_load,
+            bicodec_dtype=self.bicodec_dtype,
+        )
+        self.num_global_tokens = self.audio_tokenizer.num_global_tokens
         self.model.to(self.device)
+        self.semantic_mask = torch.from_numpy(self.token_map.semantic_lut >= 0)
+        self.decoder = (
+            AudioLMDecoder(self.model, self.token_map, self.tokenizer)
+            if self.restrict_vocab
+            else None
+        )
+        if self.quantize == "int8":
+            # the restricted head keeps its own float copy of the sliced rows
+            quantize_llm(self.model, include_lm_head=self.decoder is None)
+        self.grammar = (
+            AudioGrammar(self.tokenizer, self.token_map, self.num_global_tokens)
+            if self.constrained
+            else None
+        )
+
+    def _generate(self, input_ids: torch.Tensor, prefix_length: int = 0, **kwargs) -> torch.Tensor:
+        """Sample with the restricted audio head if enabled, else with `model.generate`.
+
+        Single prompts are seeded with the prefix cache, and the key/values of their
+        first `prefix_length` ids, the part other texts can share, are stored back
+        after generation.
+        """
+        use_prefix_cache = self.prefix_cache is not None and input_ids.shape[0] == 1
+        if use_prefix_cache:
+            kwargs["past_key_values"], _ = self.prefix_cache.lookup(input_ids)
+            kwargs["return_dict_in_generate"] = True
+
+        if self.decoder is not None:
+            outputs = self.decoder.generate(input_ids=input_ids, grammar=self.grammar, **kwargs)
+        else:
+            if self.grammar is not None:
+                kwargs["logits_processor"] = LogitsProcessorList(
+                    [AudioGrammarLogitsProcessor(self.grammar, self.tokenizer.pad_token_id)]
+                )
+            outputs = self.model.generate(input_ids=input_ids, do_sample=True, **kwargs)
+
+        if use_prefix_cache:
+            self.prefix_cache.put(input_ids, outputs.past_key_values, prefix_length)
+            return outputs.sequences
+        return outputs
+
+    def _prefix_length(self, prompt_text: str, voice_id: str, control: bool) -> int:
+        """Leading prompt ids shared with other texts of the same voice, see `_generate`."""
+        if control or self.prefix_cache is None:
+            return 0
+        if prompt_text is None and voice_id is not None and self.voice_pack is not None:
+            prompt_text = self.voice_pack.transcript(voice_id)
+        return self.prompt_builder.shared_prefix_length(prompt_text)
+
+    def _generation_cap(self, text: str, control: bool) -> int:
+        """Token cap of one text; controllable mode also generates the global tokens."""
+        # structural tokens and EOS
+        extra_tokens = self.num_global_tokens + 4 if control else 2
+        return self.budget.cap(text, extra_tokens)
+
+    def _decode_rows(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        max_new_tokens: List[int],
+        stopping_criteria: List = (),
+        **kwargs,
+    ) -> List[torch.Tensor]:
+        """
+        Generates for a batch of prompts under per-row token caps and loop detection.
+
+        The stop reason of every row is stored in `last_status` and counted in
+        `generation_stats`.
+
+        Return:
+            List[torch.Tensor]: New ids of each row, cut at EOS or at the start of a
+                detected loop.
+        """
+        runaway = RunawayStoppingCriteria(input_ids.shape[1], max_new_tokens, self.semantic_mask)
+        generated_ids = self._generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=max(max_new_tokens),
+            stopping_criteria=StoppingCriteriaList([runaway, *stopping_criteria]),
+            **kwargs,
+        )
+        generated_ids = generated_ids[:, input_ids.shape[1] :]
+
+        rows, statuses = [], []
+        for row, output_ids in enumerate(generated_ids):
+            eos = (output_ids == self.tokenizer.eos_token_id).nonzero()
+            if len(eos) > 0:
+                status, output_ids = STATUS_EOS, output_ids[: eos[0, 0]]
+            elif runaway.status[row] is not None:
+                status = runaway.status[row]
+                if runaway.loop_start[row] is not None:
+                    output_ids = output_ids[: runaway.loop_start[row]]
+            elif len(output_ids) >= max_new_tokens[row]:
+                status = STATUS_BUDGET_CAP
+            else:
+                status = STATUS_STOPPED
+            rows.append(output_ids)
+            statuses.append(status)
+
+        self.last_status = statuses
+        self.generation_stats.update(statuses)
+        return rows
+
+    def tokenize_prompt(self, prompt_speech_path: Path) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Tokenize reference audio through the prompt cache.
+
+        Args:
+            prompt_speech_path (Path): Path to the audio file used as a prompt.
+
+        Return:
+            Tuple[torch.Tensor, torch.Tensor]: global tokens; semantic tokens
+        """
+        global_token_ids, semantic_token_ids = self.prompt_cache.get_or_tokenize(
+            prompt_speech_path,
+            self.model_dir,
+            self.audio_tokenizer.tokenize,
+            self.audio_tokenizer.cache_config,
+        )
+        return global_token_ids.to(self.device), semantic_token_ids.to(self.device)
+
+    @torch.no_grad()
+    def warmup(self, batch_sizes: Sequence[int] = (1,)):
+        """
+        Pay one-off startup costs before the first request: loads the audio tokenizer
+        models of the enabled modes, compiles every vocoder bucket for the given batch
+        sizes (if `compile_vocoder` is set) and runs one LLM forward pass.
+        """
+        self.audio_tokenizer.warmup(batch_sizes)
+        input_ids = self.tokenizer("warmup", return_tensors="pt").input_ids
+        self.model(input_ids.to(self.device))
+
+    def unload_tokenizer(self):
+        """
+        Free wav2vec2 on low-memory hosts, e.g. after building the voices to serve.
+        It is loaded again by the next prompt audio that misses the prompt cache.
+        """
+        self.audio_tokenizer.unload_feature_extractor()
+
+    def load_voice_pack(self, pack_path: Path):
+        """Load a precomputed voice pack so voices can be selected by `voice_id`."""
+        self.voice_pack = VoicePack(pack_path)
 
     def process_prompt(
         self,
         text: str,
         prompt_speech_path: Path,
         prompt_text: str = None,
-    ) -> Tuple[str, torch.Tensor]:
+        voice_id: str = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
         """
         Process input for voice cloning.
 
@@ -76,49 +339,29 @@ class SparkTTS:
             text (str): The text input to be converted to speech.
             prompt_speech_path (Path): Path to the audio file used as a prompt.
             prompt_text (str, optional): Transcript of the prompt audio.
+            voice_id (str, optional): Voice from the loaded voice pack, used instead
+                of `prompt_speech_path`. Its transcript is used if `prompt_text` is None.
 
         Return:
-            Tuple[str, torch.Tensor]: Input prompt; global tokens
+            Tuple[torch.Tensor, torch.Tensor]: Input prompt ids (1, seq_len); global tokens
         """
-
-        global_token_ids, semantic_token_ids = self.audio_tokenizer.tokenize(
-            prompt_speech_path
-        )
-        global_tokens = "".join(
-            [f"<|bicodec_global_{i}|>" for i in global_token_ids.squeeze()]
-        )
-
-        # Prepare the input tokens for the model
-        if prompt_text is not None:
-            semantic_tokens = "".join(
-                [f"<|bicodec_semantic_{i}|>" for i in semantic_token_ids.squeeze()]
-            )
-            inputs = [
-                TASK_TOKEN_MAP["tts"],
-                "<|start_content|>",
-                prompt_text,
-                text,
-                "<|end_content|>",
-                "<|start_global_token|>",
-                global_tokens,
-                "<|end_global_token|>",
-                "<|start_semantic_token|>",
-                semantic_tokens,
-            ]
+        if "clone" not in self.modes:
+            raise ValueError("Voice cloning is disabled, see `modes`")
+
+        if voice_id is not None:
+            assert self.voice_pack is not None, "voice_id requires a loaded voice pack"
+            global_token_ids, semantic_token_ids = self.voice_pack.get(voice_id)
+            global_token_ids = global_token_ids.to(self.device)
+            if prompt_text is None:
+                prompt_text = self.voice_pack.transcript(voice_id)
         else:
-            inputs = [
-                TASK_TOKEN_MAP["tts"],
-                "<|start_content|>",
-                text,
-                "<|end_content|>",
-                "<|start_global_token|>",
-                global_tokens,
-                "<|end_global_token|>",
-            ]
-
-        inputs = "".join(inputs)
+            global_token_ids, semantic_token_ids = self.tokenize_prompt(prompt_speech_path)
+        # Prepare the input tokens for the model
+        input_ids = self.prompt_builder.tts_prompt(
+            text, global_token_ids.cpu(), semantic_token_ids.cpu(), prompt_text
+        )
 
-        return inputs, global_token_ids
+        return input_ids, global_token_ids
 
     def process_prompt_control(
         self,
@@ -126,7 +369,7 @@ class SparkTTS:
         pitch: str,
         speed: str,
         text: str,
-    ):
+    ) -> torch.Tensor:
         """
         Process input for voice creation.
 
@@ -137,35 +380,15 @@ class SparkTTS:
             text (str): The text input to be converted to speech.
 
         Return:
-            str: Input prompt
+            torch.Tensor: Input prompt ids (1, seq_len)
         """
+        if "control" not in self.modes:
+            raise ValueError("Controllable generation is disabled, see `modes`")
         assert gender in GENDER_MAP.keys()
         assert pitch in LEVELS_MAP.keys()
         assert speed in LEVELS_MAP.keys()
 
-        gender_id = GENDER_MAP[gender]
-        pitch_level_id = LEVELS_MAP[pitch]
-        speed_level_id = LEVELS_MAP[speed]
-
-        pitch_label_tokens = f"<|pitch_label_{pitch_level_id}|>"
-        speed_label_tokens = f"<|speed_label_{speed_level_id}|>"
-        gender_tokens = f"<|gender_{gender_id}|>"
-
-        attribte_tokens = "".join(
-            [gender_tokens, pitch_label_tokens, speed_label_tokens]
-        )
-
-        control_tts_inputs = [
-            TASK_TOKEN_MAP["controllable_tts"],
-            "<|start_content|>",
-            text,
-            "<|end_content|>",
-            "<|start_style_label|>",
-            attribte_tokens,
-            "<|end_style_label|>",
-        ]
-
-        return "".join(control_tts_inputs)
+        return self.prompt_builder.control_prompt(gender, pitch, speed, text)
 
     @torch.no_grad()
     def inference(
@@ -176,6 +399,7 @@ class SparkTTS:
         gender: str = None,
         pitch: str = None,
         speed: str = None,
+        voice_id: str = None,
         temperature: float = 0.8,
         top_k: float = 50,
         top_p: float = 0.95,
@@ -190,6 +414,7 @@ class SparkTTS:
             gender (str): female | male.
             pitch (str): very_low | low | moderate | high | very_high
             speed (str): very_low | low | moderate | high | very_high
+            voice_id (str, optional): Voice from the loaded voice pack, replaces the prompt audio.
             temperature (float, optional): Sampling temperature for controlling randomness. Default is 0.8.
             top_k (float, optional): Top-k sampling parameter. Default is 50.
             top_p (float, optional): Top-p (nucleus) sampling parameter. Default is 0.95.
@@ -202,42 +427,27 @@ class SparkTTS:
 
         else:
             prompt, global_token_ids = self.process_prompt(
-                text, prompt_speech_path, prompt_text
+                text, prompt_speech_path, prompt_text, voice_id
             )
-        model_inputs = self.tokenizer([prompt], return_tensors="pt").to(self.device)
+        input_ids = prompt.to(self.device)
 
         # Generate speech using the model
-        generated_ids = self.model.generate(
-            **model_inputs,
-            max_new_tokens=3000,
-            do_sample=True,
+        (generated_ids,) = self._decode_rows(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=[self._generation_cap(text, gender is not None)],
+            prefix_length=self._prefix_length(prompt_text, voice_id, gender is not None),
             top_k=top_k,
             top_p=top_p,
             temperature=temperature,
         )
 
-        # Trim the output tokens to remove the input tokens
-        generated_ids = [
-            output_ids[len(input_ids) :]
-            for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-        ]
-
-        # Decode the generated tokens into text
-        predicts = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-
-        # Extract semantic token IDs from the generated text
-        pred_semantic_ids = (
-            torch.tensor([int(token) for token in re.findall(r"bicodec_semantic_(\d+)", predicts)])
-            .long()
-            .unsqueeze(0)
-        )
+        # Map the generated vocab ids to semantic token IDs
+        pred_semantic_ids = self.token_map.semantic_ids(generated_ids).unsqueeze(0)
 
         if gender is not None:
             global_token_ids = (
-                torch.tensor([int(token) for token in re.findall(r"bicodec_global_(\d+)", predicts)])
-                .long()
-                .unsqueeze(0)
-                .unsqueeze(0)
+                self.token_map.global_ids(generated_ids).unsqueeze(0).unsqueeze(0)
             )
 
         # Convert semantic tokens back to waveform
@@ -246,4 +456,273 @@ class SparkTTS:
             pred_semantic_ids.to(self.device),
         )
 
-        return wav
\ No newline at end of file
+        return wav
+
+    def _build_prompt(self, text: str, voice: Dict[str, Any]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Build the LLM prompt of one item; global tokens are None in control mode."""
+        if voice.get("gender") is not None:
+            prompt = self.process_prompt_control(
+                voice["gender"], voice.get("pitch"), voice.get("speed"), text
+            )
+            return prompt, None
+        return self.process_prompt(
+            text,
+            voice.get("prompt_speech_path"),
+            voice.get("prompt_text"),
+            voice.get("voice_id"),
+        )
+
+    @torch.no_grad()
+    def inference_batch(
+        self,
+        texts: List[str],
+        voices: Union[Dict[str, Any], List[Dict[str, Any]]],
+        batch_size: int = 8,
+        bucket_width: int = 64,
+        max_new_tokens: int = None,
+        temperature: float = 0.8,
+        top_k: float = 50,
+        top_p: float = 0.95,
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Generates speech for many texts with batched LLM generation.
+
+        Prompts are left-padded and grouped into buckets of similar length, one
+        `generate` call per bucket. Each row is cut at its own EOS, and all rows
+        are vocoded by a single batched detokenize. `last_status` holds the stop
+        reason of every text, in input order.
+
+        Args:
+            texts (List[str]): Texts to be converted to speech.
+            voices: One voice per text, or a single voice shared by all texts. A voice is a
+                dict with the keyword arguments of `inference`: `prompt_speech_path` /
+                `prompt_text`, `voice_id`, or `gender` / `pitch` / `speed`.
+            batch_size (int, optional): Maximum rows per `generate` call. Default is 8.
+            bucket_width (int, optional): Maximum prompt length spread, in tokens, within
+                one bucket. Default is 64.
+            max_new_tokens (int, optional): Token cap of every row. By default each row is
+                capped by `budget` from its own text.
+            temperature (float, optional): Sampling temperature. Default is 0.8.
+            top_k (float, optional): Top-k sampling parameter. Default is 50.
+            top_p (float, optional): Top-p (nucleus) sampling parameter. Default is 0.95.
+
+        Returns:
+            List[Optional[np.ndarray]]: Waveform of each text, in input order. Items whose
+                generation produced no semantic tokens are None.
+        """
+        if isinstance(voices, dict):
+            voices = [voices] * len(texts)
+        assert len(texts) == len(voices), "texts and voices must have the same length"
+
+        prompts, global_token_ids = [], []
+        for text, voice in zip(texts, voices):
+            prompt, global_ids = self._build_prompt(text, voice)
+            prompts.append(prompt)
+            global_token_ids.append(global_ids)
+
+        prompt_ids = [prompt[0].tolist() for prompt in prompts]
+        order = sorted(range(len(prompts)), key=lambda i: len(prompt_ids[i]))
+
+        # group prompts of similar length so little compute is spent on padding
+        buckets = []
+        for i in order:
+            if (
+                len(buckets) > 0
+                and len(buckets[-1]) < batch_size
+                and len(prompt_ids[i]) - len(prompt_ids[buckets[-1][0]]) <= bucket_width
+            ):
+                buckets[-1].append(i)
+            else:
+                buckets.append([i])
+
+        caps = [
+            max_new_tokens
+            if max_new_tokens is not None
+            else self._generation_cap(text, global_ids is None)
+            for text, global_ids in zip(texts, global_token_ids)
+        ]
+
+        outputs, statuses = [None] * len(prompts), [None] * len(prompts)
+        for bucket in buckets:
+            model_inputs = self.tokenizer.pad(
+                {"input_ids": [prompt_ids[i] for i in bucket]},
+                padding=True,
+                return_tensors="pt",
+            ).to(self.device)
+            bucket_outputs = self._decode_rows(
+                **model_inputs,
+                max_new_tokens=[caps[i] for i in bucket],
+                top_k=top_k,
+                top_p=top_p,
+                temperature=temperature,
+                pad_token_id=self.tokenizer.pad_token_id,
+            )
+            for row, i in enumerate(bucket):
+                outputs[i] = bucket_outputs[row]
+                statuses[i] = self.last_status[row]
+        self.last_status = statuses
+
+        valid, batch_global, batch_semantic = [], [], []
+        for i, output_ids in enumerate(outputs):
+            semantic_ids = self.token_map.semantic_ids(output_ids)
+            global_ids = global_token_ids[i]
+            if global_ids is None:
+                global_ids = self.token_map.global_ids(output_ids)
+            global_ids = global_ids.reshape(-1)
+            if len(semantic_ids) == 0 or len(global_ids) != self.num_global_tokens:
+                continue
+            valid.append(i)
+            batch_global.append(global_ids.to(self.device))
+            batch_semantic.append(semantic_ids.to(self.device))
+
+        wavs = [None] * len(texts)
+        if len(valid) > 0:
+            batch_wavs = self.audio_tokenizer.detokenize_batch(
+                torch.stack(batch_global), batch_semantic
+            )
+            for i, wav in zip(valid, batch_wavs):
+                wavs[i] = wav
+
+        return wavs
+
+    @torch.no_grad()
+    def inference_stream(
+        self,
+        text: str,
+        prompt_speech_path: Path = None,
+        prompt_text: str = None,
+        gender: str = None,
+        pitch: str = None,
+        speed: str = None,
+        voice_id: str = None,
+        temperature: float = 0.8,
+        top_k: float = 50,
+        top_p: float = 0.95,
+        chunk_duration: float = 1.0,
+        max_chunk_duration: float = 3.0,
+        chunk_scale_factor: float = 2.0,
+        low_latency: bool = False,
+    ) -> Iterator[np.ndarray]:
+        """
+        Streams speech for a text, yielding waveform chunks while the LLM is still decoding.
+
+        Semantic tokens are vocoded incrementally by a `StreamingDetokenizer`, so the
+        yielded chunks concatenate to the same waveform as offline `inference` would
+        produce from the same tokens. The first chunk is yielded as soon as
+        `chunk_duration` seconds of audio are final; later chunks grow by
+        `chunk_scale_factor` up to `max_chunk_duration`.
+
+        Samples are final once the vocoder has its full right context: the receptive
+        fields of the prenet and the wave generator, 71 tokens with the released
+        BiCodec. Every chunk therefore waits for about 1.4 s of audio beyond it to be
+        generated, on top of `chunk_duration`. `low_latency` cuts that wait to 16
+        tokens (0.32 s, see `LOW_LATENCY_STREAM`) at the cost of approximate samples
+        near chunk boundaries, which are crossfaded over 80 ms; the output then no
+        longer matches `inference` exactly.
+
+        Args:
+            text, prompt_speech_path, prompt_text, gender, pitch, speed, voice_id,
+            temperature, top_k, top_p: Same as `inference`.
+            chunk_duration (float, optional): Audio length of the first chunk in seconds. Default is 1.0.
+            max_chunk_duration (float, optional): Upper bound of the chunk length in seconds. Default is 3.0.
+            chunk_scale_factor (float, optional): Growth factor of the chunk length. Default is 2.0.
+            low_latency (bool, optional): Vocode with reduced right context and crossfaded
+                chunk seams instead of exactly. Default is False.
+
+        Yields:
+            np.ndarray: Consecutive waveform chunks.
+        """
+        assert chunk_scale_factor >= 1.0, "chunk_scale_factor should be at least 1"
+        if gender is not None:
+            prompt = self.process_prompt_control(gender, pitch, speed, text)
+            global_token_ids = None
+        else:
+            prompt, global_token_ids = self.process_prompt(
+                text, prompt_speech_path, prompt_text, voice_id
+            )
+        input_ids = prompt.to(self.device)
+
+        streamer = TokenIdStreamer()
+        stop_event = threading.Event()
+        decoded = []
+
+        def _decode():
+            try:
+                with torch.no_grad():
+                    decoded.extend(
+                        self._decode_rows(
+                            input_ids=input_ids,
+                            attention_mask=torch.ones_like(input_ids),
+                            max_new_tokens=[self._generation_cap(text, gender is not None)],
+                            stopping_criteria=[StopFlagCriteria(stop_event)],
+                            prefix_length=self._prefix_length(
+                                prompt_text, voice_id, gender is not None
+                            ),
+                            top_k=top_k,
+                            top_p=top_p,
+                            temperature=temperature,
+                            streamer=streamer,
+                        )
+                    )
+            except Exception as e:
+                streamer.put_error(e)
+            finally:
+                streamer.end()
+
+        thread = threading.Thread(target=_decode, daemon=True)
+        thread.start()
+
+        token_rate = self.sample_rate / self.audio_tokenizer.config["latent_hop_length"]
+        chunk_size = math.ceil(chunk_duration * token_rate)
+        max_chunk_size = math.ceil(max_chunk_duration * token_rate)
+
+        global_ids, pending = [], []
+        vocoder = None
+
+        def _vocode(final: bool) -> np.ndarray:
+            semantic_ids = torch.tensor([pending], dtype=torch.long, device=self.device)
+            pending.clear()
+            wav = vocoder.push(semantic_ids, final=final)
+            return wav.reshape(-1).float().cpu().numpy()
+
+        try:
+            for token_id in streamer:
+                global_id = self.token_map.global_lut[token_id]
+                if global_id >= 0:
+                    global_ids.append(int(global_id))
+                    continue
+                semantic_id = self.token_map.semantic_lut[token_id]
+                if semantic_id < 0:
+                    continue
+                pending.append(int(semantic_id))
+
+                if vocoder is None:
+                    if global_token_ids is None:
+                        if len(global_ids) < self.num_global_tokens:
+                            continue
+                        global_token_ids = torch.tensor(
+                            global_ids[: self.num_global_tokens], dtype=torch.long
+                        ).view(1, 1, -1)
+                    vocoder = self.audio_tokenizer.detokenize_stream(
+                        global_token_ids.squeeze(0),
+                        **(LOW_LATENCY_STREAM if low_latency else {}),
+                    )
+                    lookahead = vocoder.prenet_context + vocoder.decoder_context
+
+                # samples are final once `lookahead` tokens of right context exist
+                if vocoder.pending + len(pending) - lookahead >= chunk_size:
+                    yield _vocode(final=False)
+                    chunk_size = min(max_chunk_size, int(chunk_size * chunk_scale_factor))
+
+            # drop the not yet vocoded part of a detected loop
+            thread.join()
+            if len(decoded) > 0 and vocoder is not None:
+                num_semantic = len(self.token_map.semantic_ids(decoded[0]))
+                del pending[max(0, num_semantic - vocoder.num_tokens) :]
+            if vocoder is not None:
+                wav = _vocode(final=True)
+                if len(wav) > 0:
+                    yield wav
+        finally:
+            stop_event.set()
+            thread.join()
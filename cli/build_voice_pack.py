@@ -0,0 +1,135 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import argparse
+import logging
+import torch
+
+from glob import glob
+from pathlib import Path
+from tqdm import tqdm
+
+from sparktts.utils.file import read_jsonl
+from sparktts.utils.voice_pack import write_voice_pack
+from sparktts.models.audio_tokenizer import BiCodecTokenizer
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Batch-tokenize reference audio into a voice pack."
+    )
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument(
+        "--audio_dir",
+        type=str,
+        default="AudioResources",
+        help="Directory searched recursively for .wav/.mp3 reference audio",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="AudioResources/voices.pack",
+        help="Path of the voice pack to write",
+    )
+    parser.add_argument(
+        "--transcripts",
+        type=str,
+        help="Optional jsonl with {'voice_id': ..., 'text': ...} per line",
+    )
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--device", type=str, default="cpu")
+    return parser.parse_args()
+
+
+def voice_id_from_path(audio_path: str) -> str:
+    """Catalog files are named `<voice_id>_<name>.mp3`."""
+    return Path(audio_path).stem.split("_")[0]
+
+
+def tokenize_files(tokenizer: BiCodecTokenizer, audio_paths, batch_size: int = 8):
+    """Tokenize audio files with `BiCodecTokenizer.tokenize_batch`.
+
+    Files are sorted by length before batching to keep padding small. Each clip gets
+    the same tokens as `BiCodecTokenizer.tokenize` gives it alone.
+
+    Returns:
+        dict: audio path -> (global token ids, semantic token ids) as numpy arrays
+    """
+    wavs = {}
+    for path in tqdm(audio_paths, desc="loading audio"):
+        wavs[path] = tokenizer.process_audio(path)
+    ordered = sorted(audio_paths, key=lambda p: len(wavs[p][0]))
+
+    results = {}
+    for start in tqdm(range(0, len(ordered), batch_size), desc="tokenizing"):
+        paths = ordered[start : start + batch_size]
+        batch = {
+            "wav": [wavs[p][0] for p in paths],
+            "ref_wav": torch.cat([wavs[p][1] for p in paths]).to(tokenizer.device),
+        }
+        with torch.no_grad():
+            global_tokens, semantic_tokens = tokenizer.tokenize_batch(batch)
+
+        for i, path in enumerate(paths):
+            results[path] = (
+                global_tokens[i].cpu().numpy(),
+                semantic_tokens[i].cpu().numpy(),
+            )
+    return results
+
+
+def build_voice_pack(args):
+    """Tokenize every reference audio under `audio_dir` and write one pack."""
+    audio_paths = sorted(
+        glob(os.path.join(args.audio_dir, "**", "*.wav"), recursive=True)
+        + glob(os.path.join(args.audio_dir, "**", "*.mp3"), recursive=True)
+    )
+    if len(audio_paths) == 0:
+        raise ValueError(f"No reference audio found under {args.audio_dir}")
+    logging.info(f"Found {len(audio_paths)} reference audio files")
+
+    transcripts = {}
+    if args.transcripts is not None:
+        transcripts = {m["voice_id"]: m["text"] for m in read_jsonl(args.transcripts)}
+
+    tokenizer = BiCodecTokenizer(args.model_dir, device=args.device)
+    tokens = tokenize_files(tokenizer, audio_paths, args.batch_size)
+
+    voice_ids = [voice_id_from_path(p) for p in audio_paths]
+    write_voice_pack(
+        args.output,
+        voice_ids,
+        [tokens[p][0] for p in audio_paths],
+        [tokens[p][1] for p in audio_paths],
+        [transcripts.get(v) for v in voice_ids],
+    )
+    logging.info(f"Voice pack with {len(voice_ids)} voices saved at: {args.output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    args = parse_args()
+    build_voice_pack(args)
@@ -0,0 +1,92 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Write an inference-only BiCodec checkpoint: weight norm folded, speaker
+encoder BatchNorms folded, postnet and training buffers dropped, optionally
+stored in half precision. BiCodecTokenizer loads it instead of model.safetensors
+when it sits in {model_dir}/BiCodec, and by default computes in the stored dtype:
+a half-precision export halves disk size and, with fast_load, resident memory.
+Pass `bicodec_dtype=torch.float32` to SparkTTS / BiCodecTokenizer to upcast it.
+"""
+
+import shutil
+import argparse
+import logging
+import torch
+
+from pathlib import Path
+
+from sparktts.models.bicodec import BiCodec
+
+
+DTYPES = {"fp32": None, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Export an inference-only BiCodec checkpoint.")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        help="Directory of the checkpoint (default is {model_dir}/BiCodec)",
+    )
+    parser.add_argument("--dtype", choices=list(DTYPES), default="fp32", help="Storage dtype")
+    return parser.parse_args()
+
+
+@torch.no_grad()
+def check_export(
+    model: BiCodec, output_dir: Path, dtype: torch.dtype = torch.float32, num_tokens: int = 100
+) -> float:
+    """
+    Max abs difference of `detokenize` between the source and exported models.
+
+    Args:
+        dtype (torch.dtype): Compute dtype the export is loaded in, None for its
+            storage dtype.
+    """
+    exported = BiCodec.load_inference_checkpoint(output_dir, dtype=dtype)
+    semantic_tokens = torch.randint(0, model.quantizer.codebook_size, (1, num_tokens))
+    global_tokens = torch.randint(
+        0, model.speaker_encoder.quantizer.codebook_size, (1, 1, model.speaker_encoder.token_num)
+    )
+    reference = model.detokenize(semantic_tokens, global_tokens)
+    wav = exported.detokenize(semantic_tokens, global_tokens).float()
+    return (reference - wav).abs().max().item()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    args = parse_args()
+    source_dir = Path(f"{args.model_dir}/BiCodec")
+    output_dir = Path(args.output_dir or source_dir)
+
+    model = BiCodec.load_from_checkpoint(source_dir)
+    ckpt_path = model.export_inference_checkpoint(output_dir, dtype=DTYPES[args.dtype])
+    if output_dir.resolve() != source_dir.resolve():
+        shutil.copy(source_dir / "config.yaml", output_dir / "config.yaml")
+    logging.info(f"Inference checkpoint written to {ckpt_path}")
+    logging.info(f"detokenize max abs difference: {check_export(model, output_dir):.2e}")
+    if DTYPES[args.dtype] is not None:
+        difference = check_export(model, output_dir, dtype=None)
+        logging.info(f"detokenize max abs difference in {args.dtype}: {difference:.2e}")
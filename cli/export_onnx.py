@@ -0,0 +1,53 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import argparse
+import logging
+
+from sparktts.models.bicodec import BiCodec
+from sparktts.models.bicodec_onnx import export_onnx
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Export BiCodec tokenize/detokenize to ONNX for the onnxruntime backend."
+    )
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        help="Directory of the graphs (default is {model_dir}/BiCodec/onnx)",
+    )
+    parser.add_argument("--opset_version", type=int, default=17)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    args = parse_args()
+    output_dir = args.output_dir or f"{args.model_dir}/BiCodec/onnx"
+
+    model = BiCodec.load_from_checkpoint(f"{args.model_dir}/BiCodec")
+    export_onnx(model, output_dir, opset_version=args.opset_version)
+    logging.info(f"ONNX graphs written to {output_dir}")
@@ -51,6 +51,22 @@ def parse_args():
         type=str,
         help="Path to the prompt audio file",
     )
+    parser.add_argument(
+        "--prompt_cache_dir",
+        type=str,
+        help="Directory of the on-disk prompt token cache",
+    )
+    parser.add_argument(
+        "--restrict_vocab",
+        action="store_true",
+        help="Decode with an LM head restricted to the audio vocabulary",
+    )
+    parser.add_argument(
+        "--compile_vocoder",
+        choices=["inductor", "torchscript"],
+        help="Vocode with compiled, shape-bucketed prenet and wave generator "
+        "(pays off when the model is reused, e.g. in a server)",
+    )
     parser.add_argument("--gender", choices=["male", "female"])
     parser.add_argument(
         "--pitch", choices=["very_low", "low", "moderate", "high", "very_high"]
@@ -84,7 +100,14 @@ def run_tts(args):
         logging.info("GPU acceleration not available, using CPU")
 
     # Initialize the model
-    model = SparkTTS(args.model_dir, device)
+    model = SparkTTS(
+        args.model_dir,
+        device,
+        prompt_cache_dir=args.prompt_cache_dir,
+        restrict_vocab=args.restrict_vocab,
+        compile_vocoder=args.compile_vocoder,
+    )
+    # no warmup: one utterance compiles only the bucket it uses, on demand
 
     # Generate unique filename using timestamp
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
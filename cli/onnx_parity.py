@@ -0,0 +1,109 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Check the onnxruntime BiCodec backend against PyTorch and benchmark both on CPU.
+
+Exits with a non-zero status if the tokens differ or the waveform error exceeds
+`--atol`.
+"""
+
+import sys
+import time
+import argparse
+import torch
+
+from sparktts.models.audio_tokenizer import BiCodecTokenizer
+from sparktts.models.bicodec_onnx import OnnxBiCodec
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="BiCodec onnxruntime parity and benchmark.")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument(
+        "--onnx_dir",
+        type=str,
+        help="Directory of the exported graphs (default is {model_dir}/BiCodec/onnx)",
+    )
+    parser.add_argument(
+        "--prompt_speech_path",
+        type=str,
+        default="example/prompt_audio.wav",
+        help="Path to the prompt audio file",
+    )
+    parser.add_argument("--num_threads", type=int, help="Threads of both backends")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--atol", type=float, default=1e-3, help="Max waveform error")
+    return parser.parse_args()
+
+
+def benchmark(fn, repeats: int) -> float:
+    """Mean wall time of `fn` in ms, after one warm-up call."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+@torch.no_grad()
+def run_parity(args) -> bool:
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    tokenizer = BiCodecTokenizer(args.model_dir, device="cpu")
+    torch_model = tokenizer.model
+    onnx_model = OnnxBiCodec(
+        args.onnx_dir or f"{args.model_dir}/BiCodec/onnx", num_threads=args.num_threads
+    )
+
+    wav, ref_wav = tokenizer.process_audio(args.prompt_speech_path)
+    batch = {
+        "wav": torch.from_numpy(wav).unsqueeze(0).float(),
+        "ref_wav": ref_wav,
+        "feat": tokenizer.extract_wav2vec2_features(wav),
+    }
+
+    semantic_torch, global_torch = torch_model.tokenize(batch)
+    semantic_onnx, global_onnx = onnx_model.tokenize(batch)
+    semantic_match = torch.equal(semantic_torch.long(), semantic_onnx.long())
+    global_match = torch.equal(global_torch.long(), global_onnx.long())
+    print(f"semantic tokens equal: {semantic_match}")
+    print(f"global tokens equal:   {global_match}")
+
+    wav_torch = torch_model.detokenize(semantic_torch, global_torch)
+    wav_onnx = onnx_model.detokenize(semantic_torch, global_torch)
+    error = (wav_torch - wav_onnx).abs().max().item()
+    print(f"waveform max abs error: {error:.2e}")
+
+    duration = wav_torch.shape[-1] / tokenizer.config["sample_rate"]
+    print(f"\n{'backend':<12}{'tokenize ms':>14}{'detokenize ms':>16}{'detokenize RTF':>16}")
+    for name, model in (("torch", torch_model), ("onnxruntime", onnx_model)):
+        tokenize_ms = benchmark(lambda: model.tokenize(batch), args.repeats)
+        detokenize_ms = benchmark(
+            lambda: model.detokenize(semantic_torch, global_torch), args.repeats
+        )
+        rtf = detokenize_ms / 1000 / duration
+        print(f"{name:<12}{tokenize_ms:>14.1f}{detokenize_ms:>16.1f}{rtf:>16.3f}")
+
+    return semantic_match and global_match and error <= args.atol
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_parity(parse_args()) else 1)
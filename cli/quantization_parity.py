@@ -0,0 +1,147 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compare int8 dynamic quantization against fp32 on CPU.
+
+Reports prompt token agreement of the audio tokenizer, teacher-forced next-token
+agreement of the LLM, waveform error of the vocoder on the same tokens, decode
+speed and resident weight size.
+"""
+
+import time
+import argparse
+import torch
+import numpy as np
+
+from cli.SparkTTS import SparkTTS
+from sparktts.utils.quantization import weight_bytes
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Int8 quantization parity check.")
+
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument(
+        "--prompt_speech_path",
+        type=str,
+        default="example/prompt_audio.wav",
+        help="Path to the prompt audio file",
+    )
+    parser.add_argument("--prompt_text", type=str, help="Transcript of prompt audio")
+    parser.add_argument(
+        "--text",
+        type=str,
+        default="身临其境，换新体验。塑造开源语音合成新范式，让智能语音更自然。",
+        help="Text for TTS generation",
+    )
+    parser.add_argument(
+        "--max_new_tokens", type=int, default=400, help="Tokens generated for the comparison"
+    )
+    return parser.parse_args()
+
+
+def agreement(a: torch.Tensor, b: torch.Tensor) -> float:
+    """Fraction of equal positions, counting a length mismatch as disagreement."""
+    a, b = a.reshape(-1).cpu(), b.reshape(-1).cpu()
+    n = min(len(a), len(b))
+    if max(len(a), len(b)) == 0:
+        return 1.0
+    return (a[:n] == b[:n]).sum().item() / max(len(a), len(b))
+
+
+def snr_db(ref: np.ndarray, test: np.ndarray) -> float:
+    """Signal-to-noise ratio of `test` against `ref` in dB."""
+    noise = np.sum((ref - test) ** 2)
+    return float(10 * np.log10(np.sum(ref**2) / max(noise, 1e-12)))
+
+
+def greedy_decode(model: SparkTTS, input_ids: torch.Tensor, max_new_tokens: int):
+    """Greedy generation; returns the new ids and the decode speed in tokens/s."""
+    start = time.perf_counter()
+    (output_ids,) = model._decode_rows(
+        input_ids=input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        max_new_tokens=[max_new_tokens],
+        temperature=1.0,
+        top_k=1,
+        top_p=1.0,
+    )
+    elapsed = time.perf_counter() - start
+    return output_ids, len(output_ids) / elapsed
+
+
+def model_bytes(model: SparkTTS) -> int:
+    tokenizer = model.audio_tokenizer
+    return (
+        weight_bytes(model.model)
+        + weight_bytes(tokenizer.feature_extractor)
+        + weight_bytes(tokenizer.model)
+    )
+
+
+@torch.no_grad()
+def run_parity(args):
+    models = {
+        quantize or "fp32": SparkTTS(
+            args.model_dir,
+            device="cpu",
+            quantize=quantize,
+        )
+        for quantize in (None, "int8")
+    }
+    fp32, int8 = models["fp32"], models["int8"]
+
+    # audio tokenizer
+    global_fp32, semantic_fp32 = fp32.audio_tokenizer.tokenize(args.prompt_speech_path)
+    global_int8, semantic_int8 = int8.audio_tokenizer.tokenize(args.prompt_speech_path)
+    print(f"prompt global token agreement:   {agreement(global_fp32, global_int8):.4f}")
+    print(f"prompt semantic token agreement: {agreement(semantic_fp32, semantic_int8):.4f}")
+
+    # LLM, teacher-forced on the fp32 greedy output
+    input_ids, global_token_ids = fp32.process_prompt(
+        args.text, args.prompt_speech_path, args.prompt_text
+    )
+    output_fp32, speed_fp32 = greedy_decode(fp32, input_ids, args.max_new_tokens)
+    _, speed_int8 = greedy_decode(int8, input_ids, args.max_new_tokens)
+
+    sequence = torch.cat([input_ids[0], output_fp32.cpu()]).unsqueeze(0)
+    positions = slice(input_ids.shape[1] - 1, sequence.shape[1] - 1)
+    pred_fp32 = fp32.model(sequence).logits[0, positions].argmax(-1)
+    pred_int8 = int8.model(sequence).logits[0, positions].argmax(-1)
+    print(f"LLM next-token agreement:        {agreement(pred_fp32, pred_int8):.4f}")
+    print(f"decode speed fp32 / int8:        {speed_fp32:.1f} / {speed_int8:.1f} tokens/s")
+
+    # vocoder on the same tokens
+    semantic_ids = fp32.token_map.semantic_ids(output_fp32).unsqueeze(0)
+    wav_fp32 = fp32.audio_tokenizer.detokenize(global_token_ids.squeeze(0), semantic_ids)
+    wav_int8 = int8.audio_tokenizer.detokenize(global_token_ids.squeeze(0), semantic_ids)
+    print(f"waveform max abs error:          {np.abs(wav_fp32 - wav_int8).max():.6f}")
+    print(f"waveform SNR:                    {snr_db(wav_fp32, wav_int8):.2f} dB")
+
+    bytes_fp32, bytes_int8 = model_bytes(fp32), model_bytes(int8)
+    print(
+        f"resident weights fp32 / int8:    {bytes_fp32 / 2**20:.1f} / {bytes_int8 / 2**20:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    run_parity(parse_args())
@@ -0,0 +1,561 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Standalone HTTP / WebSocket TTS server, built on asyncio and the standard
+library only, so it runs on a CPU-only host without Triton or TensorRT-LLM.
+
+Endpoints:
+    GET  /health       queue depth, requests in flight and prompt cache stats.
+    POST /tts          JSON request -> audio/wav. Timing in `Server-Timing` and
+                       `X-*` response headers.
+    GET  /tts/stream   WebSocket. The client sends one JSON request as a text
+                       message; the server answers with a `start` event, binary
+                       16-bit little-endian PCM chunks while generating, and a
+                       `done` event with the timings (or an `error` event).
+
+A request is `{"text": ..., "prompt_audio": <base64 audio file>, "prompt_text": ...}`,
+`{"text": ..., "voice_id": ...}` with `--voice_pack`, or
+`{"text": ..., "gender": "male", "pitch": "moderate", "speed": "moderate"}`.
+
+All requests share one model through `InferenceQueue`: requests arriving within
+`--batch_window_ms` of each other, up to `--max_batch_size`, are generated by one
+`inference_batch` call (one LLM generate when their prompt lengths are within
+`--bucket_width`, and one batched vocoder call). Past `--max_pending` requests
+in flight the server answers 503 instead of queueing without bound.
+`/tts/stream` sends its first PCM chunk once `--chunk_duration` seconds of audio
+are final; `--low_latency` cuts the vocoder lookahead behind every chunk from
+about 1.4 s to 0.32 s, see `SparkTTS.inference_stream`.
+
+Example:
+    python -m cli.server --model_dir pretrained_models/Spark-TTS-0.5B --port 8000
+    curl -s localhost:8000/tts -d '{"text": "Hello", "gender": "female"}' -o out.wav
+"""
+
+import io
+import os
+import json
+import base64
+import struct
+import hashlib
+import asyncio
+import logging
+import argparse
+import tempfile
+import numpy as np
+import soundfile as sf
+
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Tuple
+
+from cli.SparkTTS import SparkTTS
+from sparktts.utils.request_queue import InferenceQueue, SynthesisRequest
+from sparktts.utils.token_parser import GENDER_MAP, LEVELS_MAP
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_TEXT, WS_BINARY, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Spark-TTS HTTP / WebSocket server.")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument("--device", type=str, default="cpu", help="'cpu', a CUDA index or a device string")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--max_batch_size", type=int, default=8, help="Maximum requests generated together"
+    )
+    parser.add_argument(
+        "--batch_window_ms",
+        type=float,
+        default=10.0,
+        help="Time to wait for more requests before starting a batch",
+    )
+    parser.add_argument(
+        "--bucket_width",
+        type=int,
+        default=1024,
+        help="Maximum prompt length spread, in tokens, within one LLM generate",
+    )
+    parser.add_argument(
+        "--low_latency",
+        action="store_true",
+        help="Stream with reduced vocoder lookahead and crossfaded chunks (/tts/stream)",
+    )
+    parser.add_argument(
+        "--chunk_duration",
+        type=float,
+        default=1.0,
+        help="Audio length in seconds of the first streamed chunk (/tts/stream)",
+    )
+    parser.add_argument(
+        "--max_pending",
+        type=int,
+        default=64,
+        help="Requests in flight (queued or generating) before new ones get 503",
+    )
+    parser.add_argument(
+        "--max_body_mb", type=float, default=20.0, help="Largest accepted request body"
+    )
+    parser.add_argument(
+        "--max_text_chars", type=int, default=1000, help="Longest accepted text"
+    )
+    parser.add_argument(
+        "--prompt_cache_dir",
+        type=str,
+        help="Directory of the on-disk prompt token cache",
+    )
+    parser.add_argument("--voice_pack", type=str, help="Voice pack served by voice_id")
+    parser.add_argument(
+        "--quantize",
+        type=str,
+        choices=["int8"],
+        help="Dynamic int8 quantization of the Linear layers (CPU only)",
+    )
+    parser.add_argument(
+        "--fast_load",
+        action="store_true",
+        help="Load weights memory-mapped onto meta-initialized models",
+    )
+    parser.add_argument(
+        "--warmup", action="store_true", help="Run one forward pass before serving"
+    )
+    return parser.parse_args()
+
+
+class HTTPError(Exception):
+    """Error answered to the client with `status` and a JSON message."""
+
+    def __init__(self, status: int, message: str, headers: Dict[str, str] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def pcm16(wav: np.ndarray) -> bytes:
+    """Float waveform -> 16-bit little-endian PCM bytes."""
+    return (np.clip(wav, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def encode_wav(wav: np.ndarray, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    sf.write(buffer, wav, samplerate=sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+async def read_http_request(
+    reader: asyncio.StreamReader, max_body: int
+) -> Tuple[str, str, Dict[str, str], bytes]:
+    """
+    Read one HTTP/1.1 request.
+
+    Returns:
+        Tuple[str, str, Dict[str, str], bytes]: method; path; lower-cased headers; body
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        raise ConnectionResetError("connection closed before the request line")
+    try:
+        method, target, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "malformed Content-Length")
+    if length < 0:
+        raise HTTPError(400, "malformed Content-Length")
+    if length > max_body:
+        raise HTTPError(413, f"request body over {max_body} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method, target.split("?", 1)[0], headers, body
+
+
+async def write_http_response(
+    writer: asyncio.StreamWriter,
+    status: int,
+    body: bytes = b"",
+    content_type: str = "application/json",
+    headers: Dict[str, str] = None,
+):
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    response_headers = {
+        "Content-Type": content_type,
+        "Content-Length": str(len(body)),
+        "Connection": "close",
+    }
+    response_headers.update(headers or {})
+    lines += [f"{name}: {value}" for name, value in response_headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+async def read_ws_message(reader: asyncio.StreamReader, max_size: int) -> Tuple[int, bytes]:
+    """Read one (unfragmented) WebSocket frame. Returns the opcode and the unmasked payload."""
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if length > max_size:
+        raise HTTPError(413, f"message over {max_size} bytes")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask is not None:
+        key = np.frombuffer(mask * (length // 4 + 1), dtype=np.uint8)[:length]
+        payload = (np.frombuffer(payload, dtype=np.uint8) ^ key).tobytes()
+    return opcode, payload
+
+
+async def write_ws_message(writer: asyncio.StreamWriter, opcode: int, payload: bytes = b""):
+    """Write one unmasked server-to-client WebSocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    writer.write(header + payload)
+    await writer.drain()
+
+
+class TTSServer:
+    """
+    asyncio front end of an `InferenceQueue`.
+
+    Request handlers run on the event loop. Each request in flight waits for its
+    audio on a thread of `executor`, so the loop never blocks on the model.
+
+    Args:
+        inference_queue (InferenceQueue): Queue of the served model.
+        max_pending (int): Requests in flight before new ones are rejected with 503.
+        max_body (int): Largest accepted request body, in bytes.
+        max_text_chars (int): Longest accepted text.
+    """
+
+    def __init__(
+        self,
+        inference_queue: InferenceQueue,
+        max_pending: int = 64,
+        max_body: int = 20 * 1024 * 1024,
+        max_text_chars: int = 1000,
+    ):
+        self.inference_queue = inference_queue
+        self.model = inference_queue.model
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self.max_text_chars = max_text_chars
+        self.in_flight = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_pending)
+
+    def parse_request(self, body: bytes) -> Tuple[str, Dict[str, Any]]:
+        """
+        Validate a JSON request.
+
+        Returns:
+            Tuple[str, Dict[str, Any]]: text; voice keyword arguments. An uploaded
+                prompt is written to a temporary file given as `prompt_speech_path`;
+                remove it with `release_voice`.
+        """
+        try:
+            request = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "request is not valid JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "request should be a JSON object")
+
+        text = request.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPError(400, "'text' is required")
+        if len(text) > self.max_text_chars:
+            raise HTTPError(400, f"'text' is longer than {self.max_text_chars} characters")
+
+        if request.get("gender") is not None:
+            voice = {
+                "gender": request["gender"],
+                "pitch": request.get("pitch", "moderate"),
+                "speed": request.get("speed", "moderate"),
+            }
+            if voice["gender"] not in GENDER_MAP:
+                raise HTTPError(400, f"'gender' should be one of {list(GENDER_MAP)}")
+            if voice["pitch"] not in LEVELS_MAP or voice["speed"] not in LEVELS_MAP:
+                raise HTTPError(400, f"'pitch' and 'speed' should be one of {list(LEVELS_MAP)}")
+            return text, voice
+
+        prompt_text = request.get("prompt_text") or None
+        if request.get("voice_id") is not None:
+            if self.model.voice_pack is None:
+                raise HTTPError(400, "'voice_id' needs a server started with --voice_pack")
+            voice_id = request["voice_id"]
+            if not isinstance(voice_id, str) or voice_id not in self.model.voice_pack:
+                raise HTTPError(400, f"unknown 'voice_id': {voice_id!r}")
+            return text, {"voice_id": voice_id, "prompt_text": prompt_text}
+
+        if request.get("prompt_audio") is None:
+            raise HTTPError(400, "give 'prompt_audio', 'voice_id' or 'gender'")
+        try:
+            audio = base64.b64decode(request["prompt_audio"], validate=True)
+        except ValueError:
+            raise HTTPError(400, "'prompt_audio' is not valid base64")
+        # the prompt cache is keyed by the decoded audio, so repeated uploads of
+        # the same recording are tokenized once whatever the file name
+        fd, path = tempfile.mkstemp(suffix=".wav", prefix="sparktts_prompt_")
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio)
+        try:
+            sf.info(path)
+        except RuntimeError:
+            # soundfile.LibsndfileError is a RuntimeError
+            os.remove(path)
+            raise HTTPError(400, "'prompt_audio' is not a readable audio file")
+        return text, {"prompt_speech_path": path, "prompt_text": prompt_text}
+
+    @staticmethod
+    def release_voice(voice: Dict[str, Any]):
+        if voice.get("prompt_speech_path") is not None:
+            os.remove(voice["prompt_speech_path"])
+
+    def admit(self):
+        """Reserve a slot for a new request, or reject it when the server is full."""
+        if self.in_flight >= self.max_pending:
+            raise HTTPError(503, "server busy, retry later", {"Retry-After": "1"})
+        self.in_flight += 1
+
+    async def audio_chunks(self, request: SynthesisRequest) -> AsyncIterator[np.ndarray]:
+        """Yield the audio of a queued request without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        chunks = iter(request)
+        try:
+            while True:
+                wav = await loop.run_in_executor(self.executor, next, chunks, None)
+                if wav is None:
+                    return
+                yield wav
+        finally:
+            request.cancel()
+
+    def timings(self, request: SynthesisRequest, num_samples: int) -> Dict[str, Any]:
+        audio_seconds = num_samples / self.model.sample_rate
+        inference_seconds = request.inference_seconds or 0.0
+        timings = {
+            "queue_ms": round((request.queue_seconds or 0.0) * 1000, 1),
+            "inference_ms": round(inference_seconds * 1000, 1),
+            "total_ms": round((request.finished_at - request.submitted_at) * 1000, 1),
+            "batch_size": request.batch_size,
+            "audio_seconds": round(audio_seconds, 3),
+            "rtf": round(inference_seconds / audio_seconds, 3) if audio_seconds > 0 else None,
+        }
+        if request.first_chunk_at is not None:
+            timings["first_chunk_ms"] = round(
+                (request.first_chunk_at - request.submitted_at) * 1000, 1
+            )
+        return timings
+
+    async def handle_health(self, writer: asyncio.StreamWriter):
+        status = {
+            "status": "ok",
+            "in_flight": self.in_flight,
+            "queued": self.inference_queue.pending,
+            "max_pending": self.max_pending,
+            "max_batch_size": self.inference_queue.max_batch_size,
+            "prompt_cache": self.model.prompt_cache.stats(),
+        }
+        await write_http_response(writer, 200, json.dumps(status).encode("utf-8"))
+
+    async def handle_tts(self, writer: asyncio.StreamWriter, body: bytes):
+        text, voice = self.parse_request(body)
+        try:
+            self.admit()
+        except HTTPError:
+            self.release_voice(voice)
+            raise
+        try:
+            request = self.inference_queue.submit(text, voice, stream=False)
+            chunks = [wav async for wav in self.audio_chunks(request)]
+        except Exception as e:
+            raise HTTPError(500, f"synthesis failed: {e}")
+        finally:
+            self.in_flight -= 1
+            self.release_voice(voice)
+        if len(chunks) == 0:
+            raise HTTPError(500, "no speech was generated")
+
+        wav = np.concatenate(chunks)
+        timings = self.timings(request, len(wav))
+        headers = {
+            "Server-Timing": (
+                f"queue;dur={timings['queue_ms']}, inference;dur={timings['inference_ms']}, "
+                f"total;dur={timings['total_ms']}"
+            ),
+            "X-Batch-Size": str(timings["batch_size"]),
+            "X-Audio-Duration": str(timings["audio_seconds"]),
+            "X-Real-Time-Factor": str(timings["rtf"]),
+        }
+        await write_http_response(
+            writer, 200, encode_wav(wav, self.model.sample_rate), "audio/wav", headers
+        )
+
+    async def handle_stream(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict[str, str]
+    ):
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or key is None:
+            raise HTTPError(400, "expected a WebSocket upgrade")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest())
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept.decode()}\r\n\r\n"
+            ).encode("latin-1")
+        )
+        await writer.drain()
+
+        async def send_event(event: Dict[str, Any]):
+            await write_ws_message(writer, WS_TEXT, json.dumps(event).encode("utf-8"))
+
+        while True:
+            opcode, payload = await read_ws_message(reader, self.max_body)
+            if opcode == WS_PING:
+                await write_ws_message(writer, WS_PONG, payload)
+            elif opcode == WS_CLOSE:
+                await write_ws_message(writer, WS_CLOSE)
+                return
+            elif opcode == WS_TEXT:
+                break
+
+        async def reject(error: HTTPError):
+            # 1013: try again later, 1008: policy violation
+            close_code = 1013 if error.status == 503 else 1008
+            await send_event({"event": "error", "status": error.status, "message": error.message})
+            await write_ws_message(writer, WS_CLOSE, struct.pack("!H", close_code))
+
+        try:
+            text, voice = self.parse_request(payload)
+        except HTTPError as e:
+            await reject(e)
+            return
+        try:
+            self.admit()
+        except HTTPError as e:
+            self.release_voice(voice)
+            await reject(e)
+            return
+
+        num_samples = 0
+        try:
+            request = self.inference_queue.submit(text, voice, stream=True)
+            await send_event(
+                {"event": "start", "sample_rate": self.model.sample_rate, "format": "pcm_s16le"}
+            )
+            async for wav in self.audio_chunks(request):
+                num_samples += len(wav)
+                await write_ws_message(writer, WS_BINARY, pcm16(wav))
+            if num_samples == 0:
+                raise RuntimeError("no speech was generated")
+            await send_event({"event": "done", **self.timings(request, num_samples)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # client went away; leaving audio_chunks cancelled the request
+            return
+        except Exception as e:
+            await send_event({"event": "error", "status": 500, "message": f"synthesis failed: {e}"})
+        finally:
+            self.in_flight -= 1
+            self.release_voice(voice)
+        await write_ws_message(writer, WS_CLOSE, struct.pack("!H", 1000))
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, headers, body = await read_http_request(reader, self.max_body)
+            if path == "/health" and method == "GET":
+                await self.handle_health(writer)
+            elif path == "/tts" and method == "POST":
+                await self.handle_tts(writer, body)
+            elif path == "/tts/stream" and method == "GET":
+                await self.handle_stream(reader, writer, headers)
+            else:
+                raise HTTPError(404, f"no route for {method} {path}")
+        except HTTPError as e:
+            body = json.dumps({"error": e.message}).encode("utf-8")
+            await write_http_response(writer, e.status, body, headers=e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logging.exception("Unhandled error")
+            await write_http_response(writer, 500, b'{"error": "internal error"}')
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logging.info(f"Serving on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+        async with server:
+            await server.serve_forever()
+
+
+def main(args):
+    logging.info(f"Loading model from: {args.model_dir}")
+    model = SparkTTS(
+        args.model_dir,
+        args.device,
+        prompt_cache_dir=args.prompt_cache_dir,
+        voice_pack=args.voice_pack,
+        quantize=args.quantize,
+        fast_load=args.fast_load,
+    )
+    if args.warmup:
+        model.warmup()
+    inference_queue = InferenceQueue(
+        model,
+        max_batch_size=args.max_batch_size,
+        batch_wait=args.batch_window_ms / 1000,
+        bucket_width=args.bucket_width,
+        low_latency=args.low_latency,
+        chunk_duration=args.chunk_duration,
+    )
+    server = TTSServer(
+        inference_queue,
+        max_pending=args.max_pending,
+        max_body=int(args.max_body_mb * 1024 * 1024),
+        max_text_chars=args.max_text_chars,
+    )
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    main(parse_args())
@@ -0,0 +1,80 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Benchmark the inference SpeakerTokenizer against the speaker path of
+`BiCodec.tokenize` (mel spectrogram, ECAPA-TDNN, perceiver, FSQ) over batches
+of reference clips, and check that both give the same global tokens.
+"""
+
+import sys
+import copy
+import argparse
+import torch
+
+from cli.onnx_parity import benchmark
+from sparktts.utils.file import load_config
+from sparktts.models.bicodec import BiCodec
+from sparktts.models.speaker_tokenizer import SpeakerTokenizer
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Speaker encoder benchmark.")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--num_threads", type=int)
+    parser.add_argument("--repeats", type=int, default=5)
+    return parser.parse_args()
+
+
+@torch.no_grad()
+def run_benchmark(args) -> bool:
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    config = load_config(f"{args.model_dir}/config.yaml")
+    clip_length = (
+        int(config["sample_rate"] * config["ref_segment_duration"])
+        // config["latent_hop_length"]
+        * config["latent_hop_length"]
+    )
+    model = BiCodec.load_from_checkpoint(f"{args.model_dir}/BiCodec")
+    speaker_tokenizer = SpeakerTokenizer(copy.deepcopy(model))
+
+    def reference(ref_wavs):
+        mel = model.mel_transformer(ref_wavs).squeeze(1)
+        return model.speaker_encoder.tokenize(mel.transpose(1, 2))
+
+    all_match = True
+    print(f"{'batch':>6}{'tokens equal':>14}{'current ms/clip':>18}{'inference ms/clip':>20}{'speedup':>10}")
+    for batch_size in args.batch_sizes:
+        ref_wavs = 0.1 * torch.randn(batch_size, clip_length)
+        match = torch.equal(reference(ref_wavs), speaker_tokenizer(ref_wavs))
+        all_match = all_match and match
+        current_ms = benchmark(lambda: reference(ref_wavs), args.repeats) / batch_size
+        inference_ms = benchmark(lambda: speaker_tokenizer(ref_wavs), args.repeats) / batch_size
+        print(
+            f"{batch_size:>6}{str(match):>14}{current_ms:>18.1f}{inference_ms:>20.1f}"
+            f"{current_ms / inference_ms:>10.2f}"
+        )
+    return all_match
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_benchmark(parse_args()) else 1)
@@ -0,0 +1,110 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Measure per-component load time and peak RSS, with and without `fast_load`.
+
+Every measurement runs in a fresh interpreter so that peak RSS is not
+inflated by earlier loads.
+"""
+
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+from transformers import AutoModelForCausalLM, Wav2Vec2Model
+
+from cli.SparkTTS import SparkTTS
+from sparktts.models.bicodec import BiCodec
+from sparktts.utils.fast_load import hf_load_kwargs
+
+
+COMPONENTS = ("llm", "bicodec", "wav2vec2", "sparktts")
+
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Cold start benchmark.")
+    parser.add_argument(
+        "--model_dir",
+        type=str,
+        default="pretrained_models/Spark-TTS-0.5B",
+        help="Path to the model directory",
+    )
+    parser.add_argument(
+        "--components", nargs="+", choices=COMPONENTS, default=list(COMPONENTS)
+    )
+    parser.add_argument("--child", choices=COMPONENTS, help=argparse.SUPPRESS)
+    parser.add_argument("--fast_load", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def load_component(component: str, model_dir: str, fast_load: bool):
+    if component == "llm":
+        return AutoModelForCausalLM.from_pretrained(
+            f"{model_dir}/LLM", **hf_load_kwargs(fast_load)
+        )
+    if component == "bicodec":
+        return BiCodec.load_from_checkpoint(f"{model_dir}/BiCodec", fast_load=fast_load)
+    if component == "wav2vec2":
+        return Wav2Vec2Model.from_pretrained(
+            f"{model_dir}/wav2vec2-large-xlsr-53", **hf_load_kwargs(fast_load)
+        )
+    return SparkTTS(model_dir, device="cpu", fast_load=fast_load)
+
+
+def run_child(args):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    load_component(args.child, args.model_dir, args.fast_load)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "peak_rss_mb": peak_rss_mb(), "baseline_mb": baseline}))
+
+
+def run_benchmark(args):
+    print(f"{'component':<12}{'fast_load':>10}{'load s':>10}{'peak RSS MB':>14}{'+ over imports':>16}")
+    for component in args.components:
+        for fast_load in (False, True):
+            command = [
+                sys.executable, "-m", "cli.startup_benchmark",
+                "--model_dir", args.model_dir,
+                "--child", component,
+            ]
+            if fast_load:
+                command.append("--fast_load")
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{component:<12}{str(fast_load):>10}{result['seconds']:>10.2f}"
+                f"{result['peak_rss_mb']:>14.0f}"
+                f"{result['peak_rss_mb'] - result['baseline_mb']:>16.0f}"
+            )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child is not None:
+        run_child(args)
+    else:
+        run_benchmark(args)
@@ -27,7 +27,6 @@
 import json
 import math
 import os
-import re
 import threading
 import time
 from typing import Dict, List, Tuple, Optional, Union
@@ -38,64 +37,38 @@ from torch.utils.dlpack import from_dlpack, to_dlpack
 import triton_python_backend_utils as pb_utils
 from transformers import AutoTokenizer
 
-from sparktts.utils.token_parser import TASK_TOKEN_MAP
+from sparktts.utils.token_parser import AudioTokenMap, PromptBuilder
+from sparktts.utils.generation_budget import GenerationBudget
 
 
 def process_prompt(
+    prompt_builder: PromptBuilder,
     text: str,
     prompt_text: Optional[str] = None,
     global_token_ids: torch.Tensor = None,
     semantic_token_ids: torch.Tensor = None,
-) -> Tuple[str, torch.Tensor]:
+) -> Tuple[torch.Tensor, torch.Tensor]:
     """
     Process input for voice cloning.
 
     Args:
+        prompt_builder: Builder holding the pre-tokenized template segments.
         text: The text input to be converted to speech.
         prompt_text: Transcript of the prompt audio.
         global_token_ids: Global token IDs extracted from reference audio.
         semantic_token_ids: Semantic token IDs extracted from reference audio.
 
     Returns:
-        Tuple containing the formatted input prompt and global token IDs.
+        Tuple containing the prompt token IDs [1, sequence_length] and global token IDs.
     """
-    # Convert global tokens to string format
-    global_tokens = "".join([f"<|bicodec_global_{i}|>" for i in global_token_ids.squeeze()])
-
-    # Prepare the input tokens for the model
-    if prompt_text is not None:
-        # Include semantic tokens when prompt text is provided
-        semantic_tokens = "".join(
-            [f"<|bicodec_semantic_{i}|>" for i in semantic_token_ids.squeeze()]
-        )
-
-        inputs = [
-            TASK_TOKEN_MAP["tts"],
-            "<|start_content|>",
-            prompt_text,
-            text,
-            "<|end_content|>",
-            "<|start_global_token|>",
-            global_tokens,
-            "<|end_global_token|>",
-            "<|start_semantic_token|>",
-            semantic_tokens,
-        ]
-    else:
-        # Without prompt text, exclude semantic tokens
-        inputs = [
-            TASK_TOKEN_MAP["tts"],
-            "<|start_content|>",
-            text,
-            "<|end_content|>",
-            "<|start_global_token|>",
-            global_tokens,
-            "<|end_global_token|>",
-        ]
-
-    # Join all input components into a single string
-    inputs = "".join(inputs)
-    return inputs, global_token_ids
+    # Semantic tokens of the reference are only included when prompt text is provided
+    input_ids = prompt_builder.tts_prompt(
+        text,
+        global_token_ids.cpu(),
+        semantic_token_ids.cpu() if prompt_text is not None else None,
+        prompt_text,
+    )
+    return input_ids, global_token_ids
 
 
 class TritonPythonModel:
@@ -132,12 +105,15 @@ class TritonPythonModel:
         # Initialize tokenizer
         llm_tokenizer_dir = model_params["llm_tokenizer_dir"]
         self.tokenizer = AutoTokenizer.from_pretrained(llm_tokenizer_dir)
+        self.token_map = AudioTokenMap(self.tokenizer)
+        self.prompt_builder = PromptBuilder(self.tokenizer, self.token_map)
+        self.budget = GenerationBudget(token_rate=self.audio_tokenizer_frame_rate)
         self.device = torch.device("cuda")
 
         self.inflight_thread_count = 0
         self.inflight_thread_count_lck = threading.Lock()
 
-    def forward_llm_stream(self, input_ids):
+    def forward_llm_stream(self, input_ids, max_tokens):
         """
         Prepares the response from the language model based on the provided
         inputs. Creates a `pb_utils.InferenceRequest` object with passed
@@ -155,12 +131,12 @@ class TritonPythonModel:
             - pb_utils.InferenceResponse: The response object containing the generated text and additional metadata.
 
         params: input_ids: torch.Tensor [1, sequence_length] - The input token IDs for the language model.
+        params: max_tokens: int - Cap on generated tokens.
 
         return: output_ids generator: numpy.ndarray [sequence_length] - The generated token IDs.
         """
         # convert input_ids to numpy, with shape [1, sequence_length]
         input_ids = input_ids.cpu().numpy()
-        max_tokens = 1024  # qwen2.5 8196
         # https://github.com/triton-inference-server/tensorrtllm_backend/blob/main/docs/model_config.md#unique-inputs-for-tensorrt_llm-model
         input_dict = {
             "request_output_len": np.array([[max_tokens]], dtype=np.int32),
@@ -279,15 +255,9 @@ class TritonPythonModel:
         return waveform
 
     def token2wav(self, generated_token_ids, global_token_ids):
-        # Decode and extract semantic token IDs from generated text
-        predicted_text = self.tokenizer.batch_decode(
-            [generated_token_ids],
-            skip_special_tokens=True,
-        )[0]
+        # Map generated token IDs to semantic token IDs
         pred_semantic_ids = (
-            torch.tensor(
-                [int(token) for token in re.findall(r"bicodec_semantic_(\d+)", predicted_text)]
-            )
+            torch.from_numpy(self.token_map.semantic_ids(generated_token_ids))
             .unsqueeze(0)
             .to(torch.int32)
         )
@@ -369,19 +339,20 @@ class TritonPythonModel:
         global_tokens, semantic_tokens = self.forward_audio_tokenizer(wav, wav_len)
 
         # Prepare prompt for LLM
-        prompt, global_token_ids = process_prompt(
+        input_ids, global_token_ids = process_prompt(
+            prompt_builder=self.prompt_builder,
             text=target_text,
             prompt_text=reference_text,
             global_token_ids=global_tokens,
             semantic_token_ids=semantic_tokens,
         )
 
-        # Tokenize prompt for LLM
-        model_inputs = self.tokenizer([prompt], return_tensors="pt").to(self.device)
-        input_ids = model_inputs.input_ids.to(torch.int32)
+        input_ids = input_ids.to(torch.int32)
 
         # Generate semantic tokens with LLM
-        generated_ids_iter = self.forward_llm_stream(input_ids)
+        generated_ids_iter = self.forward_llm_stream(
+            input_ids, self.budget.cap(target_text, extra_tokens=2)
+        )
 
         semantic_token_ids_arr = []
         max_chunk_size = math.ceil(self.max_audio_chunk_duration * self.audio_tokenizer_frame_rate)
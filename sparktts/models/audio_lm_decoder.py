@@ -0,0 +1,426 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+import numpy as np
+import torch.nn as nn
+import torch.nn.functional as F
+
+from collections import deque
+from typing import List, Optional
+from transformers.generation.logits_process import LogitsProcessor
+from transformers.generation.utils import GenerateDecoderOnlyOutput
+
+from sparktts.utils.token_parser import AudioTokenMap
+
+
+STRUCTURAL_TOKENS = [
+    "<|start_global_token|>",
+    "<|end_global_token|>",
+    "<|start_semantic_token|>",
+    "<|end_semantic_token|>",
+]
+
+
+class _GrammarState:
+    """Decoding state of one row, see `AudioGrammar`."""
+
+    def __init__(self, state: int, count: int = 0, forced: List[int] = ()):
+        self.state = state
+        self.count = count
+        self.forced = deque(forced)
+
+
+class AudioGrammar:
+    """State machine of the audio part of Spark-TTS outputs.
+
+    Controllable mode generates `<|start_global_token|>`, exactly
+    `num_global_tokens` global tokens, `<|end_global_token|>`,
+    `<|start_semantic_token|>` and semantic tokens until EOS. Voice cloning
+    continues from the semantic section. Structural tokens are deterministic
+    and queued as forced tokens, the other states restrict sampling to the
+    tokens valid at that point. EOS is only allowed after `min_semantic_tokens`
+    semantic tokens, so a finished sequence always contains audio.
+
+    Args:
+        tokenizer: Tokenizer of the LLM.
+        token_map (AudioTokenMap): Audio token tables of the LLM vocabulary.
+        num_global_tokens (int): Global tokens per utterance. Default is 32.
+        min_semantic_tokens (int): Semantic tokens required before EOS. Default is 1.
+    """
+
+    FREE, GLOBAL, SEMANTIC, SEMANTIC_OR_EOS, DONE = range(5)
+
+    def __init__(
+        self,
+        tokenizer,
+        token_map: AudioTokenMap,
+        num_global_tokens: int = 32,
+        min_semantic_tokens: int = 1,
+    ):
+        self.token_map = token_map
+        self.num_global_tokens = num_global_tokens
+        self.min_semantic_tokens = min_semantic_tokens
+        self.eos_token_id = tokenizer.eos_token_id
+        self.start_global_id, self.end_global_id, self.start_semantic_id, _ = [
+            tokenizer.convert_tokens_to_ids(t) for t in STRUCTURAL_TOKENS
+        ]
+        self.end_style_id = tokenizer.convert_tokens_to_ids("<|end_style_label|>")
+
+    def _in_lut(self, lut: np.ndarray, ids: np.ndarray) -> torch.Tensor:
+        valid = (ids >= 0) & (ids < len(lut))
+        return torch.from_numpy(valid & (lut[np.clip(ids, 0, len(lut) - 1)] >= 0))
+
+    def state_masks(self, vocab_ids: torch.Tensor) -> torch.Tensor:
+        """Allowed tokens of every state over `vocab_ids`.
+
+        Returns:
+            torch.Tensor: bool mask. shape: (num_states, len(vocab_ids))
+        """
+        ids = vocab_ids.cpu().numpy()
+        is_global = self._in_lut(self.token_map.global_lut, ids)
+        is_semantic = self._in_lut(self.token_map.semantic_lut, ids)
+        is_eos = torch.from_numpy(ids == self.eos_token_id)
+        masks = torch.stack(
+            [torch.ones_like(is_eos), is_global, is_semantic, is_semantic | is_eos, is_eos]
+        )
+        return masks.to(vocab_ids.device)
+
+    def start(self, prompt_ids: List[int]) -> _GrammarState:
+        """Initial state after a prompt, given as a list of ids without padding."""
+        if len(prompt_ids) == 0:
+            return _GrammarState(self.FREE)
+        last = prompt_ids[-1]
+        if last == self.end_style_id:
+            return _GrammarState(self.GLOBAL, forced=[self.start_global_id])
+        if last == self.start_global_id:
+            return _GrammarState(self.GLOBAL)
+        if last == self.end_global_id:
+            return _GrammarState(self.SEMANTIC, forced=[self.start_semantic_id])
+        if last == self.start_semantic_id or self._in_lut(self.token_map.semantic_lut, np.array([last]))[0]:
+            return _GrammarState(self.SEMANTIC)
+        return _GrammarState(self.FREE)
+
+    def advance(self, state: _GrammarState, token_id: int):
+        """Update `state` with the token appended to its row."""
+        if len(state.forced) > 0:
+            state.forced.popleft()
+        elif state.state == self.GLOBAL:
+            state.count += 1
+            if state.count == self.num_global_tokens:
+                state.state, state.count = self.SEMANTIC, 0
+                state.forced.extend([self.end_global_id, self.start_semantic_id])
+        elif state.state == self.SEMANTIC:
+            if token_id == self.eos_token_id:
+                state.state = self.DONE
+            else:
+                state.count += 1
+        elif state.state == self.FREE and token_id == self.eos_token_id:
+            state.state = self.DONE
+
+    def mask_code(self, state: _GrammarState) -> int:
+        """Row of `state_masks` that applies to the next sampled token."""
+        if len(state.forced) > 0:
+            return self.FREE
+        if state.state == self.SEMANTIC and state.count >= self.min_semantic_tokens:
+            return self.SEMANTIC_OR_EOS
+        return state.state
+
+
+class AudioGrammarLogitsProcessor(LogitsProcessor):
+    """Applies an `AudioGrammar` inside `model.generate`.
+
+    Forced structural tokens are enforced by masking every other token, so
+    they still cost a decode step here; `AudioLMDecoder` feeds them without
+    sampling instead.
+
+    Args:
+        grammar (AudioGrammar): Output grammar.
+        pad_token_id (int): Padding id of left-padded prompts.
+    """
+
+    def __init__(self, grammar: AudioGrammar, pad_token_id: int = None):
+        self.grammar = grammar
+        self.pad_token_id = pad_token_id
+        self.states = None
+        self.seen = 0
+        self.vocab_ids = None
+        self.masks = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self.states is None:
+            self.states = [
+                self.grammar.start([t for t in row if t != self.pad_token_id])
+                for row in input_ids.tolist()
+            ]
+        else:
+            for row, tokens in enumerate(input_ids[:, self.seen :].tolist()):
+                for token_id in tokens:
+                    self.grammar.advance(self.states[row], token_id)
+        self.seen = input_ids.shape[1]
+
+        if self.masks is None:
+            self.vocab_ids = torch.arange(scores.shape[-1], device=scores.device)
+            self.masks = self.grammar.state_masks(self.vocab_ids)
+        allowed = self.masks[[self.grammar.mask_code(state) for state in self.states]]
+        for row, state in enumerate(self.states):
+            if len(state.forced) > 0:
+                allowed[row] = self.vocab_ids == state.forced[0]
+        return scores.masked_fill(~allowed, float("-inf"))
+
+
+class AudioVocabHead(nn.Module):
+    """LM head restricted to the tokens Spark-TTS can emit after the prompt.
+
+    Holds the rows of the full output projection for the semantic and global
+    audio tokens, a few structural tokens and EOS. Logits are computed over
+    this small vocabulary and sampled indices are mapped back to vocab ids.
+
+    Args:
+        lm_head (nn.Linear): Output projection of the LLM.
+        token_ids (torch.Tensor): Vocab ids to keep.
+    """
+
+    def __init__(self, lm_head: nn.Linear, token_ids: torch.Tensor):
+        super().__init__()
+        token_ids = torch.unique(token_ids.long())
+        weight = lm_head.weight.detach()
+        self.weight = nn.Parameter(weight[token_ids.to(weight.device)].clone(), requires_grad=False)
+        if lm_head.bias is not None:
+            bias = lm_head.bias.detach()[token_ids.to(weight.device)].clone()
+            self.bias = nn.Parameter(bias, requires_grad=False)
+        else:
+            self.bias = None
+        self.register_buffer("vocab_ids", token_ids.to(weight.device))
+
+        # vocab id -> index in the restricted vocabulary, -1 for dropped tokens
+        index = torch.full((int(token_ids.max()) + 1,), -1, dtype=torch.long)
+        index[token_ids] = torch.arange(len(token_ids))
+        self.register_buffer("vocab_index", index.to(weight.device))
+
+    @classmethod
+    def from_token_map(
+        cls,
+        lm_head: nn.Linear,
+        token_map: AudioTokenMap,
+        extra_token_ids: List[int],
+    ) -> "AudioVocabHead":
+        """Build the head over all audio tokens of `token_map` plus `extra_token_ids`."""
+        token_ids = [
+            torch.from_numpy(token_map.semantic_vocab_ids),
+            torch.from_numpy(token_map.global_vocab_ids),
+            torch.tensor(extra_token_ids, dtype=torch.long),
+        ]
+        token_ids = torch.cat(token_ids)
+        return cls(lm_head, token_ids[token_ids >= 0])
+
+    def forward(self, hidden_states: torch.Tensor) -> torch.Tensor:
+        return F.linear(hidden_states, self.weight, self.bias)
+
+    def to_vocab(self, indices: torch.Tensor) -> torch.Tensor:
+        """Map indices of the restricted vocabulary back to vocab ids."""
+        return self.vocab_ids[indices]
+
+    def to_index(self, token_ids: torch.Tensor) -> torch.Tensor:
+        """Map vocab ids to indices of the restricted vocabulary (-1 if absent)."""
+        token_ids = token_ids.long()
+        in_range = (token_ids >= 0) & (token_ids < len(self.vocab_index))
+        index = self.vocab_index[token_ids.clamp(0, len(self.vocab_index) - 1)]
+        return index.masked_fill(~in_range, -1)
+
+
+def sample_logits(
+    logits: torch.Tensor,
+    temperature: float = 0.8,
+    top_k: int = 50,
+    top_p: float = 0.95,
+) -> torch.Tensor:
+    """Temperature, top-k and top-p sampling, in the order HF `generate` applies them.
+
+    Args:
+        logits (torch.Tensor): (batch_size, vocab_size)
+
+    Returns:
+        torch.Tensor: sampled indices. shape: (batch_size,)
+    """
+    logits = logits.float() / temperature
+    if top_k is not None and 0 < top_k < logits.shape[-1]:
+        kth = torch.topk(logits, int(top_k), dim=-1).values[..., -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    if top_p is not None and top_p < 1.0:
+        sorted_logits, sorted_indices = torch.sort(logits, descending=False, dim=-1)
+        cumulative = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+        sorted_remove = cumulative <= (1 - top_p)
+        sorted_remove[..., -1:] = False
+        remove = sorted_remove.scatter(-1, sorted_indices, sorted_remove)
+        logits = logits.masked_fill(remove, float("-inf"))
+    probs = logits.softmax(dim=-1)
+    return torch.multinomial(probs, num_samples=1).squeeze(-1)
+
+
+class AudioLMDecoder:
+    """Sampling loop over the restricted audio vocabulary.
+
+    Runs the LLM backbone with a KV cache and projects only the last hidden
+    state through an `AudioVocabHead`. `generate` mirrors the subset of
+    `model.generate` used by SparkTTS and returns prompt plus generated ids,
+    padded with `pad_token_id` after EOS.
+
+    With a `grammar`, sampling is masked to the tokens valid in each row's
+    state, and forced structural tokens are appended without a sampling step:
+    whenever every unfinished row has a forced token pending, it is fed in the
+    same forward pass as the previous token.
+
+    Args:
+        model: HuggingFace causal LM (Qwen2 for Spark-TTS).
+        token_map (AudioTokenMap): Audio token tables of the LLM vocabulary.
+        tokenizer: Tokenizer of the LLM, used to resolve structural tokens.
+    """
+
+    def __init__(self, model, token_map: AudioTokenMap, tokenizer):
+        self.model = model
+        self.eos_token_id = tokenizer.eos_token_id
+        self.pad_token_id = (
+            tokenizer.pad_token_id if tokenizer.pad_token_id is not None else self.eos_token_id
+        )
+        extra_token_ids = [tokenizer.convert_tokens_to_ids(t) for t in STRUCTURAL_TOKENS]
+        extra_token_ids.append(self.eos_token_id)
+        self.head = AudioVocabHead.from_token_map(
+            model.get_output_embeddings(), token_map, extra_token_ids
+        )
+        self._grammar_masks = {}
+
+    def _forced_column(self, states: List[_GrammarState], finished: torch.Tensor):
+        """Pop the next forced token of every row if all unfinished rows have one."""
+        active = [row for row in range(len(states)) if not finished[row]]
+        if len(active) == 0 or any(len(states[row].forced) == 0 for row in active):
+            return None
+        column = [self.pad_token_id] * len(states)
+        for row in active:
+            column[row] = states[row].forced[0]
+        return column
+
+    @torch.no_grad()
+    def generate(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: Optional[torch.Tensor] = None,
+        max_new_tokens: int = 3000,
+        temperature: float = 0.8,
+        top_k: int = 50,
+        top_p: float = 0.95,
+        grammar: AudioGrammar = None,
+        streamer=None,
+        stopping_criteria=None,
+        past_key_values=None,
+        return_dict_in_generate: bool = False,
+        **kwargs,
+    ):
+        """Sample up to `max_new_tokens` tokens for a (left-padded) batch of prompts.
+
+        `past_key_values` may hold the keys/values of a prefix of `input_ids`;
+        prefill then only runs on the remaining prompt tokens.
+
+        Returns:
+            torch.Tensor: prompt and generated ids. shape: (batch_size, seq_len)
+                With `return_dict_in_generate`, a `GenerateDecoderOnlyOutput` holding
+                the ids and the final `past_key_values`.
+        """
+        device = input_ids.device
+        batch_size = input_ids.shape[0]
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        position_ids = (attention_mask.long().cumsum(-1) - 1).clamp(min=0)
+        backbone = self.model.get_decoder()
+
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+
+        states, masks = None, None
+        if grammar is not None:
+            states = [
+                grammar.start(row[mask.bool()].tolist())
+                for row, mask in zip(input_ids.cpu(), attention_mask.cpu())
+            ]
+            if id(grammar) not in self._grammar_masks:
+                self._grammar_masks[id(grammar)] = grammar.state_masks(self.head.vocab_ids)
+            masks = self._grammar_masks[id(grammar)]
+
+        sequences = input_ids
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=device)
+        num_cached = past_key_values.get_seq_length() if past_key_values is not None else 0
+        step_ids, step_positions = input_ids[:, num_cached:], position_ids[:, num_cached:]
+        last_position = position_ids[:, -1:]
+        num_new_tokens = 0
+
+        def _append(next_ids: torch.Tensor):
+            nonlocal sequences, step_ids, step_positions, last_position
+            nonlocal attention_mask, finished, num_new_tokens
+            next_ids = next_ids.masked_fill(finished, self.pad_token_id)
+            last_position = last_position + 1
+            sequences = torch.cat([sequences, next_ids[:, None]], dim=-1)
+            step_ids = torch.cat([step_ids, next_ids[:, None]], dim=-1)
+            step_positions = torch.cat([step_positions, last_position], dim=-1)
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((batch_size, 1))], dim=-1)
+            num_new_tokens += 1
+            if streamer is not None:
+                streamer.put(next_ids.cpu())
+            if states is not None:
+                for row, token_id in enumerate(next_ids.tolist()):
+                    if not finished[row]:
+                        grammar.advance(states[row], token_id)
+            finished = finished | (next_ids == self.eos_token_id)
+
+        def _fast_forward():
+            while states is not None and num_new_tokens < max_new_tokens:
+                column = self._forced_column(states, finished)
+                if column is None:
+                    return
+                _append(torch.tensor(column, dtype=torch.long, device=device))
+
+        _fast_forward()
+        while num_new_tokens < max_new_tokens and not bool(finished.all()):
+            outputs = backbone(
+                input_ids=step_ids,
+                attention_mask=attention_mask,
+                position_ids=step_positions,
+                past_key_values=past_key_values,
+                use_cache=True,
+            )
+            past_key_values = outputs.past_key_values
+            step_ids, step_positions = step_ids[:, :0], step_positions[:, :0]
+
+            logits = self.head(outputs.last_hidden_state[:, -1])
+            if states is not None:
+                allowed = masks[[grammar.mask_code(state) for state in states]]
+                logits = logits.masked_fill(~allowed, float("-inf"))
+            next_ids = self.head.to_vocab(sample_logits(logits, temperature, top_k, top_p))
+            if states is not None:
+                forced = [(row, state.forced[0]) for row, state in enumerate(states) if state.forced]
+                for row, token_id in forced:
+                    next_ids[row] = token_id
+            _append(next_ids)
+
+            if stopping_criteria is not None:
+                finished = finished | stopping_criteria(sequences, logits).to(device)
+            if bool(finished.all()):
+                break
+            _fast_forward()
+
+        if streamer is not None:
+            streamer.end()
+        if return_dict_in_generate:
+            return GenerateDecoderOnlyOutput(sequences=sequences, past_key_values=past_key_values)
+        return sequences
@@ -14,28 +14,79 @@
 # limitations under the License.
 
 
+import gc
+import threading
 import torch
 import numpy as np
 
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from transformers import Wav2Vec2FeatureExtractor, Wav2Vec2Model
 
 from sparktts.utils.file import load_config
 from sparktts.utils.audio import load_audio
-from sparktts.models.bicodec import BiCodec
+from sparktts.utils.fast_load import hf_load_kwargs
+from sparktts.models.bicodec import (
+    INFERENCE_CHECKPOINT,
+    BiCodec,
+    StreamingDetokenizer,
+    VoiceConditioning,
+)
+from sparktts.models.bicodec_onnx import OnnxBiCodec
+from sparktts.models.wav2vec2_features import TruncatedWav2Vec2
+from sparktts.models.speaker_tokenizer import SpeakerTokenizer
+from sparktts.models.compiled_vocoder import COMPILE_MODES, DEFAULT_BUCKETS, BucketedVocoder
+from sparktts.utils.quantization import check_quantize, quantize_bicodec, quantize_linear
 
 
 class BiCodecTokenizer:
     """BiCodec tokenizer for handling audio input and tokenization."""
 
-    def __init__(self, model_dir: Path, device = None, **kwargs):
+    def __init__(
+        self,
+        model_dir: Path,
+        device = None,
+        quantize: str = None,
+        backend: str = "torch",
+        onnx_dir: Path = None,
+        compile_vocoder: str = None,
+        vocoder_buckets: Sequence[int] = DEFAULT_BUCKETS,
+        decode_only: bool = False,
+        lazy: bool = False,
+        fast_load: bool = False,
+        bicodec_dtype: Optional[torch.dtype] = None,
+        max_cached_voices: int = 64,
+        **kwargs,
+    ):
         super().__init__()
         """
         Args:
             model_dir: Path to the model directory.
             device: Device to run the model on (default is GPU if available).
                    Can be a string ('cpu', 'cuda:0') or torch.device object.
+            quantize: "int8" applies dynamic int8 quantization to the Linear layers of
+                   wav2vec2, the ConvNeXt pointwise layers and the perceiver attention
+                   of BiCodec. CPU only.
+            backend: "torch", or "onnxruntime" to run BiCodec tokenize/detokenize with the
+                   graphs exported by cli/export_onnx.py. wav2vec2 stays in PyTorch. CPU only.
+            onnx_dir: Directory of the exported graphs (default is `{model_dir}/BiCodec/onnx`).
+            compile_vocoder: "inductor" (torch.compile) or "torchscript" (trace + freeze) to
+                   detokenize with semantic lengths padded to `vocoder_buckets`, each compiled
+                   once, see `BucketedVocoder`. Torch backend only.
+            vocoder_buckets: Semantic lengths compiled by `compile_vocoder`, in tokens.
+            decode_only: Only load what `detokenize` needs: no wav2vec2 and no BiCodec
+                   encoder, postnet or speaker ECAPA-TDNN/perceiver. `tokenize` is unavailable.
+            lazy: Load BiCodec and wav2vec2 on first use instead of at construction.
+            fast_load: Build models with parameters on the meta device and assign
+                   memory-mapped checkpoint weights, skipping random init and host copies.
+            bicodec_dtype: Compute dtype of a BiCodec inference checkpoint written by
+                   cli/export_bicodec.py. None runs it in its storage dtype, so fp16/bf16
+                   exports compute in half precision and, with `fast_load`, stay
+                   memory-mapped instead of being upcast into a private float32 copy.
+                   `quantize` needs float32. Unused with model.safetensors or onnxruntime.
+            max_cached_voices: Number of voice conditionings (d-vector and prenet
+                   AdaLayerNorm scale/shift) kept by `conditioning`. 0 disables the cache.
         """
         # 处理设备参数
         if device is None:
@@ -53,22 +104,160 @@ class BiCodecTokenizer:
         else:
             self.device = device
             
+        check_quantize(quantize, self.device)
+        if backend not in ("torch", "onnxruntime"):
+            raise ValueError(f"Unsupported backend: {backend}")
+        if backend == "onnxruntime" and torch.device(self.device).type != "cpu":
+            raise ValueError("The onnxruntime backend only runs on CPU")
+        if compile_vocoder not in COMPILE_MODES:
+            raise ValueError(f"Unsupported compile mode: {compile_vocoder}")
+        if compile_vocoder is not None and backend != "torch":
+            raise ValueError("compile_vocoder requires the torch backend")
+        if quantize is not None and bicodec_dtype not in (None, torch.float32):
+            raise ValueError("quantize requires bicodec_dtype float32")
+        self.quantize = quantize
+        self.backend = backend
+        self.onnx_dir = onnx_dir if onnx_dir is not None else f"{model_dir}/BiCodec/onnx"
+        self.compile_vocoder = compile_vocoder
+        self.vocoder_buckets = vocoder_buckets
+        self.decode_only = decode_only
+        self.fast_load = fast_load
+        # dynamic int8 Linear layers take float32 inputs only
+        self.bicodec_dtype = torch.float32 if quantize is not None else bicodec_dtype
         self.model_dir = model_dir
         self.config = load_config(f"{model_dir}/config.yaml")
-        self._initialize_model()
+        self.num_global_tokens = load_config(f"{model_dir}/BiCodec/config.yaml")[
+            "audio_tokenizer"
+        ]["speaker_encoder"]["token_num"]
+
+        self._model = None
+        self._vocoder = None
+        self._speaker_tokenizer = None
+        self._processor = None
+        self._feature_extractor = None
+        self._lock = threading.RLock()
+        # global token bytes -> VoiceConditioning, least recently used first
+        self.max_cached_voices = max_cached_voices
+        self._conditionings: "OrderedDict[Tuple, VoiceConditioning]" = OrderedDict()
+        if not lazy:
+            self._initialize_model()
 
     def _initialize_model(self):
-        """Load and initialize the BiCodec model and Wav2Vec2 feature extractor."""
-        self.model = BiCodec.load_from_checkpoint(f"{self.model_dir}/BiCodec").to(
-            self.device
-        )
-        self.processor = Wav2Vec2FeatureExtractor.from_pretrained(
-            f"{self.model_dir}/wav2vec2-large-xlsr-53"
-        )
-        self.feature_extractor = Wav2Vec2Model.from_pretrained(
-            f"{self.model_dir}/wav2vec2-large-xlsr-53"
-        ).to(self.device)
-        self.feature_extractor.config.output_hidden_states = True
+        """Load the BiCodec model and, unless decode-only, the Wav2Vec2 feature extractor."""
+        self._load_bicodec()
+        if not self.decode_only:
+            self._load_wav2vec2()
+
+    def _load_bicodec(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            if self.backend == "onnxruntime":
+                model = OnnxBiCodec(self.onnx_dir)
+            else:
+                bicodec_dir = Path(f"{self.model_dir}/BiCodec")
+                # prefer the checkpoint written by cli/export_bicodec.py
+                if (bicodec_dir / INFERENCE_CHECKPOINT).exists():
+                    model = BiCodec.load_inference_checkpoint(
+                        bicodec_dir,
+                        decode_only=self.decode_only,
+                        fast_load=self.fast_load,
+                        dtype=self.bicodec_dtype,
+                    )
+                else:
+                    model = BiCodec.load_from_checkpoint(
+                        bicodec_dir, decode_only=self.decode_only, fast_load=self.fast_load
+                    )
+                model = model.to(self.device)
+                if not self.decode_only:
+                    # folds the ECAPA-TDNN BatchNorms, before any quantization
+                    self._speaker_tokenizer = SpeakerTokenizer(model)
+                if self.quantize == "int8":
+                    quantize_bicodec(model)
+            self._vocoder = (
+                BucketedVocoder(model, self.compile_vocoder, self.vocoder_buckets)
+                if self.compile_vocoder is not None
+                else model
+            )
+            self._model = model
+
+    def _load_wav2vec2(self):
+        if self.decode_only:
+            raise ValueError("Tokenization is unavailable in a decode-only BiCodecTokenizer")
+        with self._lock:
+            if self._feature_extractor is not None:
+                return
+            self._processor = Wav2Vec2FeatureExtractor.from_pretrained(
+                f"{self.model_dir}/wav2vec2-large-xlsr-53"
+            )
+            # BiCodec reads the mean of hidden states 11, 14 and 16 only
+            layers = (11, 14, 16)
+            load_kwargs = hf_load_kwargs(self.fast_load)
+            if self.fast_load:
+                # the weights of the dropped layers are never read
+                load_kwargs["num_hidden_layers"] = max(layers)
+            feature_extractor = TruncatedWav2Vec2(
+                Wav2Vec2Model.from_pretrained(
+                    f"{self.model_dir}/wav2vec2-large-xlsr-53", **load_kwargs
+                ),
+                layers=layers,
+            ).to(self.device).eval()
+            if self.quantize == "int8":
+                quantize_linear(feature_extractor)
+            self._feature_extractor = feature_extractor
+
+    @property
+    def model(self):
+        """BiCodec model, loaded on first access."""
+        if self._model is None:
+            self._load_bicodec()
+        return self._model
+
+    @property
+    def vocoder(self):
+        """Model used by `detokenize`: the BiCodec model or its `BucketedVocoder`."""
+        if self._model is None:
+            self._load_bicodec()
+        return self._vocoder
+
+    @property
+    def cache_config(self) -> Dict[str, Any]:
+        """Settings that change the tokens `tokenize` produces, for prompt cache keys."""
+        dtype = self.model.dtype if self.backend == "torch" else torch.float32
+        return {
+            "backend": self.backend,
+            "quantize": self.quantize,
+            "dtype": str(dtype).replace("torch.", ""),
+        }
+
+    @property
+    def processor(self) -> Wav2Vec2FeatureExtractor:
+        """Wav2Vec2 input processor, loaded on first access."""
+        if self._feature_extractor is None:
+            self._load_wav2vec2()
+        return self._processor
+
+    @property
+    def feature_extractor(self) -> TruncatedWav2Vec2:
+        """Wav2Vec2 model truncated after layer 16, loaded on first access."""
+        if self._feature_extractor is None:
+            self._load_wav2vec2()
+        return self._feature_extractor
+
+    def unload_feature_extractor(self):
+        """Free wav2vec2; it is loaded again by the next `tokenize`."""
+        with self._lock:
+            self._processor = None
+            self._feature_extractor = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def warmup(self, batch_sizes: Sequence[int] = (1,)):
+        """Load the models and compile every vocoder bucket, if `compile_vocoder` is set."""
+        self._initialize_model()
+        if self.compile_vocoder is not None:
+            self.vocoder.warmup(batch_sizes)
 
     def get_ref_clip(self, wav: np.ndarray) -> np.ndarray:
         """Get reference audio clip for speaker embedding."""
@@ -99,41 +288,94 @@ class BiCodecTokenizer:
         return wav, wav_ref
 
     def extract_wav2vec2_features(self, wavs: torch.Tensor) -> torch.Tensor:
-        """extract wav2vec2 features"""
+        """extract wav2vec2 features
+
+        Clips of different lengths are zero-padded and run with an attention mask, so
+        the frames of each clip match the clip run alone; frames past
+        `feature_extractor.frame_lengths` of a clip are padding.
+        """
         inputs = self.processor(
             wavs,
             sampling_rate=16000,
             return_tensors="pt",
             padding=True,
-            output_hidden_states=True,
-        ).input_values
-        feat = self.feature_extractor(inputs.to(self.feature_extractor.device))
-        feats_mix = (
-            feat.hidden_states[11] + feat.hidden_states[14] + feat.hidden_states[16]
-        ) / 3
+            return_attention_mask=True,
+        )
+        device = self.feature_extractor.device
+        attention_mask = inputs.attention_mask
+        if attention_mask is not None and bool(attention_mask.all()):
+            # nothing padded, skip the masked attention
+            attention_mask = None
+        feats_mix = self.feature_extractor(
+            inputs.input_values.to(device),
+            None if attention_mask is None else attention_mask.to(device),
+        )
 
         return feats_mix
 
-    def tokenize_batch(self, batch: Dict[str, Any]) -> torch.Tensor:
+    def _tokenize(self, batch: Dict[str, Any]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """`BiCodec.tokenize`, with the speaker path run by the inference `SpeakerTokenizer`"""
+        model = self.model
+        if self._speaker_tokenizer is None:
+            return model.tokenize(batch)
+        semantic_tokens = model.tokenize_semantic(batch["feat"])
+        global_tokens = self._speaker_tokenizer(batch["ref_wav"])
+        return semantic_tokens, global_tokens
+
+    def tokenize_speakers(self, ref_wavs: torch.Tensor) -> torch.Tensor:
+        """global tokens of many reference clips in one batch, without wav2vec2
+
+        Args:
+            ref_wavs: reference clips from `get_ref_clip`. shape: (batch_size, num_samples)
+
+        Returns:
+            global_tokens: global tokens. shape: (batch_size, 1, global_dim)
+        """
+        if self.decode_only:
+            raise ValueError("Tokenization is unavailable in a decode-only BiCodecTokenizer")
+        self._load_bicodec()
+        if self._speaker_tokenizer is None:
+            raise ValueError("tokenize_speakers requires the torch backend")
+        return self._speaker_tokenizer(ref_wavs.to(self.device))
+
+    def tokenize_batch(
+        self, batch: Dict[str, Any]
+    ) -> Tuple[torch.Tensor, List[torch.Tensor]]:
         """tokenize the batch of audio
 
+        Each clip gets the tokens `tokenize` gives it alone: wav2vec2, the costly
+        part, runs on the whole batch with an attention mask, then BiCodec encodes
+        each clip's features cut at its exact frame count.
+
         Args:
             batch:
-                wavs (List[np.ndarray]): batch of audio
-                ref_wavs (torch.Tensor): reference audio. shape: (batch_size, seq_len)
+                wav (List[np.ndarray]): batch of audio
+                ref_wav (torch.Tensor): reference audio. shape: (batch_size, seq_len)
 
         Returns:
-            semantic_tokens: semantic tokens. shape: (batch_size, seq_len, latent_dim)
-            global_tokens: global tokens. shape: (batch_size, seq_len, global_dim)
+            global_tokens: global tokens. shape: (batch_size, 1, global_dim)
+            semantic_tokens: semantic tokens of each clip. shape: (num_tokens,) each
         """
+        self._load_wav2vec2()
         feats = self.extract_wav2vec2_features(batch["wav"])
-        batch["feat"] = feats
-        semantic_tokens, global_tokens = self.model.tokenize(batch)
+        num_samples = torch.tensor([len(wav) for wav in batch["wav"]])
+        frame_lengths = self.feature_extractor.frame_lengths(num_samples).tolist()
 
-        return global_tokens, semantic_tokens
+        global_tokens, semantic_tokens = [], []
+        for i, length in enumerate(frame_lengths):
+            clip = {
+                "feat": feats[i : i + 1, :length].to(self.device),
+                "ref_wav": batch["ref_wav"][i : i + 1].to(self.device),
+            }
+            clip_semantic_tokens, clip_global_tokens = self._tokenize(clip)
+            semantic_tokens.append(clip_semantic_tokens[0])
+            global_tokens.append(clip_global_tokens)
+
+        return torch.cat(global_tokens), semantic_tokens
 
     def tokenize(self, audio_path: str) -> Tuple[torch.Tensor, torch.Tensor]:
         """tokenize the audio"""
+        self._load_wav2vec2()
         wav, ref_wav = self.process_audio(audio_path)
         feat = self.extract_wav2vec2_features(wav)
         batch = {
@@ -141,10 +383,44 @@ class BiCodecTokenizer:
             "ref_wav": ref_wav.to(self.device),
             "feat": feat.to(self.device),
         }
-        semantic_tokens, global_tokens = self.model.tokenize(batch)
+        semantic_tokens, global_tokens = self._tokenize(batch)
 
         return global_tokens, semantic_tokens
 
+    def conditioning(self, global_tokens: torch.Tensor) -> VoiceConditioning:
+        """voice conditioning of the global tokens, cached by their values
+
+        Args:
+            global_tokens: global tokens. shape: (batch_size, 1, global_dim)
+
+        Returns:
+            VoiceConditioning: d-vector and prenet scale/shift of these voices
+        """
+        key = (tuple(global_tokens.shape), global_tokens.cpu().numpy().tobytes())
+        with self._lock:
+            conditioning = self._conditionings.get(key)
+            if conditioning is not None:
+                self._conditionings.move_to_end(key)
+                return conditioning
+
+        conditioning = self.model.condition(global_tokens.to(self.device))
+        if self.max_cached_voices > 0:
+            with self._lock:
+                self._conditionings[key] = conditioning
+                while len(self._conditionings) > self.max_cached_voices:
+                    self._conditionings.popitem(last=False)
+        return conditioning
+
+    def _vocode(self, semantic_tokens: torch.Tensor, global_tokens: torch.Tensor) -> torch.Tensor:
+        """`vocoder.detokenize`, conditioned through the voice cache on the torch backend
+
+        The waveform is float32 whatever `bicodec_dtype` the vocoder runs in.
+        """
+        if self.backend != "torch":
+            return self.vocoder.detokenize(semantic_tokens, global_tokens)
+        conditioning = self.conditioning(global_tokens)
+        return self.vocoder.detokenize(semantic_tokens, conditioning=conditioning).float()
+
     def detokenize(
         self, global_tokens: torch.Tensor, semantic_tokens: torch.Tensor
     ) -> np.array:
@@ -160,9 +436,57 @@ class BiCodecTokenizer:
         if semantic_tokens.size(1) == 0:
             raise ValueError("Semantic tokens are empty. The input audio may be too short or invalid.")
         global_tokens = global_tokens.unsqueeze(1)
-        wav_rec = self.model.detokenize(semantic_tokens, global_tokens)
+        wav_rec = self._vocode(semantic_tokens, global_tokens)
         return wav_rec.detach().squeeze().cpu().numpy()
 
+    def detokenize_stream(self, global_tokens: torch.Tensor, **kwargs) -> StreamingDetokenizer:
+        """create a streaming detokenizer that vocodes semantic tokens chunk by chunk
+
+        Args:
+            global_tokens: global tokens. shape: (batch_size, global_dim)
+
+        Returns:
+            StreamingDetokenizer: push semantic tokens of shape (batch_size, seq_len) to get new samples
+        """
+        if self.backend != "torch":
+            raise ValueError("Streaming detokenization requires the torch backend")
+        conditioning = self.conditioning(global_tokens.unsqueeze(1))
+        return self.model.detokenize_stream(conditioning, **kwargs)
+
+    def detokenize_batch(
+        self, global_tokens: torch.Tensor, semantic_tokens: List[torch.Tensor]
+    ) -> List[np.ndarray]:
+        """detokenize a batch of variable-length token sequences in one call
+
+        Sequences are right-padded to the longest one by repeating their last token,
+        as `BucketedVocoder` does, and each waveform is trimmed back to
+        `len(tokens) * latent_hop_length` samples. The prenet and wave generator
+        contexts reach into the padding, so the samples of the last
+        `vocoder_context(model)` tokens of a padded item (71 with the released
+        BiCodec) can differ from `detokenize`; earlier samples match.
+
+        Args:
+            global_tokens: global tokens. shape: (batch_size, global_dim)
+            semantic_tokens: list of semantic tokens, each of shape (seq_len,)
+
+        Returns:
+            List[np.ndarray]: one waveform per item
+        """
+        lengths = [len(tokens) for tokens in semantic_tokens]
+        if min(lengths) == 0:
+            raise ValueError("Semantic tokens are empty. The input audio may be too short or invalid.")
+        max_length = max(lengths)
+        padded = torch.stack(
+            [
+                torch.cat([tokens, tokens[-1:].expand(max_length - len(tokens))])
+                for tokens in semantic_tokens
+            ]
+        ).to(self.device).long()
+        wav_rec = self._vocode(padded, global_tokens.unsqueeze(1))
+        wav_rec = wav_rec.detach().squeeze(1).cpu().numpy()
+        hop_length = self.config["latent_hop_length"]
+        return [wav_rec[i, : lengths[i] * hop_length] for i in range(len(lengths))]
+
 
 # test
 if __name__ == "__main__":
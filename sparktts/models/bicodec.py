@@ -13,14 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
+import contextlib
 import torch
 import torch.nn as nn
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from omegaconf import DictConfig
-from safetensors.torch import load_file
+from safetensors import safe_open
+from safetensors.torch import load_file, save_file
 
 from sparktts.utils.file import load_config
+from sparktts.utils.fast_load import load_meta_state_dict, meta_parameters, mmap_safetensors
 from sparktts.modules.speaker.speaker_encoder import SpeakerEncoder
 from sparktts.modules.encoder_decoder.feat_encoder import Encoder
 from sparktts.modules.encoder_decoder.feat_decoder import Decoder
@@ -28,6 +33,32 @@ from sparktts.modules.encoder_decoder.wave_generator import WaveGenerator
 from sparktts.modules.vq.factorized_vector_quantize import FactorizedVectorQuantize
 
 
+# written next to config.yaml by `export_inference_checkpoint`
+INFERENCE_CHECKPOINT = "model_inference.safetensors"
+INFERENCE_FORMAT = "bicodec-inference"
+
+
+@dataclass
+class VoiceConditioning:
+    """
+    Detokenizer inputs that only depend on the global tokens, see `BiCodec.condition`.
+
+    Attributes:
+        d_vector (tensor): Speaker embedding. shape: (batch_size, out_dim)
+        modulations (list): AdaLayerNorm (scale, shift) of the prenet input norm and
+            of each of its ConvNeXt blocks, each of shape (batch_size, dim). None if
+            the prenet is unconditional.
+    """
+
+    d_vector: torch.Tensor
+    modulations: Optional[List[Tuple[torch.Tensor, torch.Tensor]]]
+
+    @property
+    def num_bytes(self) -> int:
+        tensors = [self.d_vector] + [t for pair in self.modulations or [] for t in pair]
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+
 class BiCodec(nn.Module):
     """
     BiCodec model for speech synthesis, incorporating a speaker encoder, feature encoder/decoder,
@@ -66,29 +97,70 @@ class BiCodec(nn.Module):
         self.postnet = postnet
         self.init_mel_transformer(mel_params)
 
+    @property
+    def dtype(self) -> torch.dtype:
+        """Compute dtype of the model, see `load_inference_checkpoint`."""
+        return next(self.prenet.parameters()).dtype
+
     @classmethod
-    def load_from_checkpoint(cls, model_dir: Path, **kwargs) -> "BiCodec":
+    def load_from_checkpoint(
+        cls, model_dir: Path, decode_only: bool = False, fast_load: bool = False, **kwargs
+    ) -> "BiCodec":
         """
         Loads the model from a checkpoint.
 
         Args:
             model_dir (Path): Path to the model directory containing checkpoint and config.
+            decode_only (bool): Skip the modules only used by `tokenize`/`forward` (encoder,
+                postnet, speaker ECAPA-TDNN and perceiver), leaving a model that can only
+                `detokenize`.
+            fast_load (bool): Build the modules with parameters on the meta device (no
+                random init) and assign memory-mapped checkpoint tensors to them.
         
         Returns:
             BiCodec: The initialized BiCodec model.
         """
         ckpt_path = f'{model_dir}/model.safetensors'
         config = load_config(f'{model_dir}/config.yaml')['audio_tokenizer']
-        mel_params = config["mel_params"]
-        encoder = Encoder(**config["encoder"])
+        with meta_parameters() if fast_load else contextlib.nullcontext():
+            model = cls._build(config, decode_only)
+
+        state_dict = mmap_safetensors(ckpt_path) if fast_load else load_file(ckpt_path)
+        if decode_only:
+            expected_keys = model.state_dict().keys()
+            state_dict = {
+                key: value for key, value in state_dict.items() if key in expected_keys
+            }
+        if fast_load:
+            missing_keys, unexpected_keys = load_meta_state_dict(model, state_dict)
+        else:
+            missing_keys, unexpected_keys = model.load_state_dict(state_dict, strict=False)
+
+        for key in missing_keys:
+            print(f"Missing tensor: {key}")
+        for key in unexpected_keys:
+            print(f"Unexpected tensor: {key}")
+
+        model.eval()
+        model.remove_weight_norm()
+
+        return model
+
+    @classmethod
+    def _build(cls, config: Dict[str, Any], decode_only: bool = False) -> "BiCodec":
+        """Builds the modules described by the `audio_tokenizer` config."""
+        encoder = None if decode_only else Encoder(**config["encoder"])
         quantizer = FactorizedVectorQuantize(**config["quantizer"])
         prenet = Decoder(**config["prenet"])
-        postnet = Decoder(**config["postnet"])
+        postnet = None if decode_only else Decoder(**config["postnet"])
         decoder = WaveGenerator(**config["decoder"])
         speaker_encoder = SpeakerEncoder(**config["speaker_encoder"])
+        if decode_only:
+            speaker_encoder.speaker_encoder = None
+            speaker_encoder.perceiver_sampler = None
 
-        model = cls(
-            mel_params=mel_params,
+        return cls(
+            mel_params=config["mel_params"],
             encoder=encoder,
             decoder=decoder,
             quantizer=quantizer,
@@ -97,18 +169,102 @@ class BiCodec(nn.Module):
             postnet=postnet,
         )
 
-        state_dict = load_file(ckpt_path)
-        missing_keys, unexpected_keys = model.load_state_dict(state_dict, strict=False)
+    @classmethod
+    def load_inference_checkpoint(
+        cls,
+        model_dir: Path,
+        decode_only: bool = False,
+        fast_load: bool = False,
+        dtype: Optional[torch.dtype] = torch.float32,
+    ) -> "BiCodec":
+        """
+        Loads a checkpoint written by `export_inference_checkpoint`.
 
-        for key in missing_keys:
-            print(f"Missing tensor: {key}")
-        for key in unexpected_keys:
-            print(f"Unexpected tensor: {key}")
+        The model is built directly in its inference form on the meta device and the
+        checkpoint tensors are assigned to it with strict key matching, so nothing is
+        recomputed at load time.
 
-        model.eval()
-        model.remove_weight_norm()
+        Args:
+            model_dir (Path): Directory holding config.yaml and the inference checkpoint.
+            decode_only (bool): Only build and load the modules used by `detokenize`.
+            fast_load (bool): Memory-map the checkpoint instead of reading it.
+            dtype (torch.dtype, optional): Compute dtype every floating point parameter
+                and buffer is cast to, or None for the storage dtype of the checkpoint.
+                Casting a memory-mapped half-precision checkpoint makes a private copy.
+                The mel spectrogram front end stays in float32 (`torch.stft` has no
+                half precision kernel on CPU); `tokenize` casts its output.
 
-        return model
+        Returns:
+            BiCodec: The model in eval mode.
+        """
+        ckpt_path = f"{model_dir}/{INFERENCE_CHECKPOINT}"
+        with safe_open(ckpt_path, framework="pt") as f:
+            metadata = f.metadata() or {}
+        if metadata.get("format") != INFERENCE_FORMAT:
+            raise ValueError(f"{ckpt_path} is not a BiCodec inference checkpoint")
+
+        config = load_config(f"{model_dir}/config.yaml")["audio_tokenizer"]
+        with meta_parameters():
+            model = cls._build(config, decode_only)
+        model.prepare_inference()
+
+        state_dict = mmap_safetensors(ckpt_path) if fast_load else load_file(ckpt_path)
+        if decode_only:
+            expected_keys = model.state_dict().keys()
+            state_dict = {
+                key: value for key, value in state_dict.items() if key in expected_keys
+            }
+        model.load_state_dict(state_dict, strict=True, assign=True)
+        if dtype is None:
+            dtype = next(t.dtype for t in state_dict.values() if t.is_floating_point())
+        # buffers computed at build time (filterbanks, FSQ levels, ...) are float32
+        model.to(dtype)
+        model.mel_transformer.float()
+        return model.eval()
+
+    def prepare_inference(self) -> "BiCodec":
+        """
+        Converts the model to its inference form in place: weight norm removed,
+        speaker encoder BatchNorms folded, postnet and training buffers dropped.
+
+        On parameters on the meta device this only changes the module structure,
+        which is how `load_inference_checkpoint` gets keys matching the export.
+        """
+        self.remove_weight_norm()
+        if self.speaker_encoder.speaker_encoder is not None:
+            self.speaker_encoder.speaker_encoder.fuse_batch_norm()
+        self.postnet = None
+        if "cluster_size" in self.quantizer._buffers:
+            del self.quantizer.cluster_size
+        return self
+
+    def export_inference_checkpoint(
+        self, output_dir: Path, dtype: Optional[torch.dtype] = None
+    ) -> Path:
+        """
+        Writes the inference form of a model loaded with `load_from_checkpoint`.
+
+        Args:
+            output_dir (Path): Directory of the checkpoint. It should hold (or receive)
+                the config.yaml of the source model.
+            dtype (torch.dtype, optional): Storage dtype of floating point tensors,
+                e.g. torch.float16 or torch.bfloat16. None keeps float32.
+
+        Returns:
+            Path: Path of the written checkpoint.
+        """
+        self.eval().prepare_inference()
+        state_dict = {}
+        for key, value in self.state_dict().items():
+            if dtype is not None and value.is_floating_point():
+                value = value.to(dtype)
+            state_dict[key] = value.contiguous()
+
+        ckpt_path = Path(output_dir) / INFERENCE_CHECKPOINT
+        ckpt_path.parent.mkdir(parents=True, exist_ok=True)
+        metadata = {"format": INFERENCE_FORMAT, "dtype": str(dtype or torch.float32)}
+        save_file(state_dict, ckpt_path, metadata=metadata)
+        return ckpt_path
 
     def forward(self, batch: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -159,35 +315,83 @@ class BiCodec(nn.Module):
         Returns:
             tuple: Semantic tokens and global tokens.
         """
-        feat = batch["feat"]
-        mel = self.mel_transformer(batch["ref_wav"]).squeeze(1)
-
-        z = self.encoder(feat.transpose(1, 2))
-        semantic_tokens = self.quantizer.tokenize(z)
+        mel = self.mel_transformer(batch["ref_wav"]).squeeze(1).to(self.dtype)
+        semantic_tokens = self.tokenize_semantic(batch["feat"])
         global_tokens = self.speaker_encoder.tokenize(mel.transpose(1, 2))
 
         return semantic_tokens, global_tokens
 
     @torch.no_grad()
-    def detokenize(self, semantic_tokens, global_tokens):
+    def tokenize_semantic(self, feat: torch.Tensor) -> torch.Tensor:
+        """
+        Tokenizes wav2vec2 features into semantic tokens.
+
+        Args:
+            feat (tensor): wav2vec2 features. shape: (batch_size, num_frames, feat_dim)
+
+        Returns:
+            tensor: Semantic tokens. shape: (batch_size, num_tokens)
+        """
+        z = self.encoder(feat.transpose(1, 2).to(self.dtype))
+        return self.quantizer.tokenize(z)
+
+    @torch.no_grad()
+    def condition(self, global_tokens: torch.Tensor) -> VoiceConditioning:
+        """
+        Computes the voice conditioning of `detokenize`: the d-vector and the scale and
+        shift of every prenet AdaLayerNorm. It is constant for a voice, so callers
+        decoding many sequences with the same global tokens can compute it once.
+
+        Args:
+            global_tokens (tensor): Global tokens. shape: (batch_size, 1, token_num)
+
+        Returns:
+            VoiceConditioning: Conditioning passed to `detokenize`.
+        """
+        d_vector = self.speaker_encoder.detokenize(global_tokens)
+        return VoiceConditioning(d_vector, self.prenet.modulations(d_vector))
+
+    @torch.no_grad()
+    def detokenize(
+        self,
+        semantic_tokens: torch.Tensor,
+        global_tokens: Optional[torch.Tensor] = None,
+        conditioning: Optional[VoiceConditioning] = None,
+    ):
         """
         Detokenizes the semantic and global tokens into a waveform.
 
         Args:
             semantic_tokens (tensor): Semantic tokens.
-            global_tokens (tensor): Global tokens.
+            global_tokens (tensor, optional): Global tokens.
+            conditioning (VoiceConditioning, optional): `condition(global_tokens)`,
+                used instead of the global tokens.
 
         Returns:
             tensor: Reconstructed waveform.
         """
+        if conditioning is None:
+            conditioning = self.condition(global_tokens)
         z_q = self.quantizer.detokenize(semantic_tokens)
-        d_vector = self.speaker_encoder.detokenize(global_tokens)
-        x = self.prenet(z_q, d_vector)
+        d_vector = conditioning.d_vector
+        x = self.prenet(z_q, d_vector, modulations=conditioning.modulations)
         x = x + d_vector.unsqueeze(-1)
         wav_recon = self.decoder(x)
 
         return wav_recon
 
+    def detokenize_stream(self, global_tokens, **kwargs) -> "StreamingDetokenizer":
+        """
+        Creates an incremental detokenizer for one voice, see `StreamingDetokenizer`.
+
+        Args:
+            global_tokens (tensor): Global tokens, or their `VoiceConditioning`.
+
+        Returns:
+            StreamingDetokenizer: Detokenizer fed with semantic tokens chunk by chunk.
+        """
+        return StreamingDetokenizer(self, global_tokens, **kwargs)
+
     def init_mel_transformer(self, config: Dict[str, Any]):
         """
         Initializes the MelSpectrogram transformer based on the provided configuration.
@@ -197,18 +401,20 @@ class BiCodec(nn.Module):
         """
         import torchaudio.transforms as TT
 
-        self.mel_transformer = TT.MelSpectrogram(
-            config["sample_rate"],
-            config["n_fft"],
-            config["win_length"],
-            config["hop_length"],
-            config["mel_fmin"],
-            config["mel_fmax"],
-            n_mels=config["num_mels"],
-            power=1,
-            norm="slaney",
-            mel_scale="slaney",
-        )
+        # the filterbank cannot be computed on the meta device, see `meta_parameters`
+        with torch.device("cpu"):
+            self.mel_transformer = TT.MelSpectrogram(
+                config["sample_rate"],
+                config["n_fft"],
+                config["win_length"],
+                config["hop_length"],
+                config["mel_fmin"],
+                config["mel_fmax"],
+                n_mels=config["num_mels"],
+                power=1,
+                norm="slaney",
+                mel_scale="slaney",
+            )
 
     def remove_weight_norm(self):
         """Removes weight normalization from all layers."""
@@ -221,6 +427,189 @@ class BiCodec(nn.Module):
         self.apply(_remove_weight_norm)
 
 
+def receptive_field(module: nn.Module) -> Tuple[int, int]:
+    """
+    Computes the one-sided receptive field of a stack of 1D convolutions.
+
+    The Conv1d / ConvTranspose1d layers of `module` must be registered in forward
+    order, as in `Decoder` and `WaveGenerator`; all other layers are pointwise in time.
+
+    Args:
+        module (nn.Module): Convolutional stack.
+
+    Returns:
+        Tuple[int, int]: Receptive field in input frames, rounded up; output frames per input frame.
+    """
+    rate, context = 1, 0.0
+    for m in module.modules():
+        if isinstance(m, nn.ConvTranspose1d):
+            context += (m.kernel_size[0] / m.stride[0] / 2 + 1) / rate
+            rate *= m.stride[0]
+        elif isinstance(m, nn.Conv1d):
+            k, d, p = m.kernel_size[0], m.dilation[0], m.padding[0]
+            context += max(p, (k - 1) * d - p) / rate
+            rate /= m.stride[0]
+    return math.ceil(context) + 1, int(rate)
+
+
+def vocoder_context(model: BiCodec) -> int:
+    """
+    Right context of `detokenize` in tokens: the receptive field of the prenet plus
+    that of the wave generator, 71 tokens (1.42 s) with the released BiCodec.
+
+    Changing a token can only alter the samples of the `vocoder_context` tokens
+    before it, e.g. padding appended to a sequence only alters its tail.
+    """
+    prenet_field, frame_rate = receptive_field(model.prenet)
+    decoder_field, _ = receptive_field(model.decoder)
+    return prenet_field + math.ceil(decoder_field / frame_rate)
+
+
+class StreamingDetokenizer:
+    """
+    Incremental `BiCodec.detokenize` for one voice.
+
+    Semantic tokens are pushed chunk by chunk and only new samples are returned.
+    The prenet runs on each new span with `prenet_context` tokens of left and right
+    context, and its outputs are cached; the wave generator runs on cached prenet
+    outputs with `decoder_context` tokens of context. With the default contexts
+    (the receptive fields of both stages) the concatenated output matches the
+    offline result up to float rounding, at the cost of holding back the last
+    `prenet_context + decoder_context` tokens until more arrive or `flush` is
+    called. Buffers only keep those contexts, so memory is bounded by the chunk size.
+
+    Smaller contexts hold back fewer tokens but make the samples near chunk
+    boundaries approximate. `crossfade` then hides the seams: each chunk also
+    decodes `crossfade` tokens past its end, and those samples are faded into the
+    start of the next chunk.
+
+    Args:
+        model (BiCodec): BiCodec model.
+        global_tokens (tensor): Global tokens. shape: (batch_size, 1, token_num), or
+            their `VoiceConditioning`, reused by the prenet run of every chunk.
+        prenet_context (int, optional): Context of the prenet in tokens.
+        decoder_context (int, optional): Context of the wave generator in tokens.
+        crossfade (int): Overlap of consecutive chunks in tokens, at most
+            `decoder_context`. Default is 0.
+    """
+
+    def __init__(
+        self,
+        model: BiCodec,
+        global_tokens: torch.Tensor,
+        prenet_context: Optional[int] = None,
+        decoder_context: Optional[int] = None,
+        crossfade: int = 0,
+    ):
+        self.model = model
+        if isinstance(global_tokens, VoiceConditioning):
+            self.conditioning = global_tokens
+        else:
+            self.conditioning = model.condition(global_tokens)
+        self.d_vector = self.conditioning.d_vector
+
+        prenet_field, self.frame_rate = receptive_field(model.prenet)
+        decoder_field, decoder_rate = receptive_field(model.decoder)
+        self.hop_length = self.frame_rate * decoder_rate
+        if prenet_context is None:
+            prenet_context = prenet_field
+        if decoder_context is None:
+            decoder_context = math.ceil(decoder_field / self.frame_rate)
+        assert 0 <= crossfade <= decoder_context, "crossfade should be within decoder_context"
+        self.prenet_context = prenet_context
+        self.decoder_context = decoder_context
+        self.crossfade = crossfade
+
+        batch_size = self.d_vector.shape[0]
+        device = self.d_vector.device
+        # tokens[:, i] is token `token_offset + i`; feats start at token `feat_offset`
+        self.tokens = torch.zeros(batch_size, 0, dtype=torch.long, device=device)
+        self.token_offset = 0
+        self.feats = None
+        self.feat_offset = 0
+        self.num_tokens = 0
+        self.prenet_done = 0
+        self.emitted = 0
+        # samples decoded past `emitted` by the previous chunk, faded into the next one
+        self.overlap = None
+
+    @property
+    def pending(self) -> int:
+        """Number of pushed tokens whose samples have not been returned yet."""
+        return self.num_tokens - self.emitted
+
+    def _run_prenet(self, end: int):
+        start = max(0, self.prenet_done - self.prenet_context)
+        stop = min(self.num_tokens, end + self.prenet_context)
+        tokens = self.tokens[:, start - self.token_offset : stop - self.token_offset]
+        z_q = self.model.quantizer.detokenize(tokens)
+        x = self.model.prenet(z_q, self.d_vector, modulations=self.conditioning.modulations)
+        x = x + self.d_vector.unsqueeze(-1)
+        x = x[..., (self.prenet_done - start) * self.frame_rate : (end - start) * self.frame_rate]
+        self.feats = x if self.feats is None else torch.cat([self.feats, x], dim=-1)
+        self.prenet_done = end
+
+    def _run_decoder(self, end: int) -> torch.Tensor:
+        start = max(self.feat_offset, self.emitted - self.decoder_context)
+        stop = min(self.prenet_done, end + self.decoder_context)
+        x = self.feats[
+            ..., (start - self.feat_offset) * self.frame_rate : (stop - self.feat_offset) * self.frame_rate
+        ]
+        wav = self.model.decoder(x)
+        overlap = min(self.crossfade, stop - end) * self.hop_length
+        wav = wav[..., (self.emitted - start) * self.hop_length : (end - start) * self.hop_length + overlap]
+
+        if self.overlap is not None:
+            n = min(self.overlap.shape[-1], wav.shape[-1] - overlap)
+            fade = torch.linspace(0, 1, n + 2, device=wav.device, dtype=wav.dtype)[1:-1]
+            wav = torch.cat(
+                [self.overlap[..., :n] * (1 - fade) + wav[..., :n] * fade, wav[..., n:]], dim=-1
+            )
+        self.overlap = wav[..., wav.shape[-1] - overlap :] if overlap > 0 else None
+        self.emitted = end
+        return wav[..., : wav.shape[-1] - overlap]
+
+    @torch.no_grad()
+    def push(self, semantic_tokens: torch.Tensor, final: bool = False) -> torch.Tensor:
+        """
+        Adds semantic tokens and returns the samples that became final.
+
+        Args:
+            semantic_tokens (tensor): New semantic tokens. shape: (batch_size, seq_len)
+            final (bool): Whether these are the last tokens of the utterance.
+
+        Returns:
+            tensor: New samples. shape: (batch_size, 1, num_samples)
+        """
+        semantic_tokens = semantic_tokens.to(self.tokens.device).long()
+        self.tokens = torch.cat([self.tokens, semantic_tokens], dim=1)
+        self.num_tokens += semantic_tokens.shape[1]
+
+        prenet_end = self.num_tokens if final else self.num_tokens - self.prenet_context
+        if prenet_end > self.prenet_done:
+            self._run_prenet(prenet_end)
+
+        decoder_end = self.prenet_done if final else self.prenet_done - self.decoder_context
+        if decoder_end > self.emitted:
+            wav = self._run_decoder(decoder_end)
+        else:
+            wav = self.d_vector.new_zeros(self.tokens.shape[0], 1, 0)
+
+        # keep only the context needed by the next call
+        token_start = max(self.token_offset, self.prenet_done - self.prenet_context)
+        self.tokens = self.tokens[:, token_start - self.token_offset :]
+        self.token_offset = token_start
+        if self.feats is not None:
+            feat_start = max(self.feat_offset, self.emitted - self.decoder_context)
+            self.feats = self.feats[..., (feat_start - self.feat_offset) * self.frame_rate :]
+            self.feat_offset = feat_start
+        return wav
+
+    def flush(self) -> torch.Tensor:
+        """Returns the remaining samples once all tokens have been pushed."""
+        return self.push(self.tokens[:, :0], final=True)
+
+
 # Test the model
 if __name__ == "__main__":
 
@@ -0,0 +1,263 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    ONNX export of BiCodec and an ONNX Runtime model with the same
+    tokenize/detokenize interface. Tokenization (mel, encoder, FVQ, speaker
+    encoder) and detokenization (FVQ/FSQ lookup, prenet, WaveGenerator) are
+    exported as two graphs with dynamic batch and time axes.
+"""
+
+import os
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import numpy as np
+
+from pathlib import Path
+from typing import Any, Dict
+
+from sparktts.models.bicodec import BiCodec
+
+
+TOKENIZE_GRAPH = "bicodec_tokenize.onnx"
+DETOKENIZE_GRAPH = "bicodec_detokenize.onnx"
+
+
+class ConvMelSpectrogram(nn.Module):
+    """
+    Mel spectrogram computed with a convolution over a real DFT basis.
+
+    Numerically equivalent to the torchaudio `MelSpectrogram` it is built from
+    (centered reflect padding, magnitude spectrum), but exportable to ONNX
+    since it avoids the complex output of `torch.stft`.
+
+    Args:
+        mel_transformer: torchaudio `MelSpectrogram` with power=1.
+    """
+
+    def __init__(self, mel_transformer: nn.Module):
+        super().__init__()
+        spectrogram = mel_transformer.spectrogram
+        assert spectrogram.power == 1 and spectrogram.center and not spectrogram.normalized
+        n_fft = spectrogram.n_fft
+        self.n_fft = n_fft
+        self.hop_length = spectrogram.hop_length
+        self.pad_mode = spectrogram.pad_mode
+
+        # torch.stft centers a shorter window inside the n_fft frame
+        window = torch.zeros(n_fft, dtype=torch.float64)
+        offset = (n_fft - spectrogram.win_length) // 2
+        window[offset : offset + spectrogram.win_length] = spectrogram.window.double()
+        freqs = torch.arange(n_fft // 2 + 1, dtype=torch.float64).unsqueeze(1)
+        phase = 2 * np.pi * freqs * torch.arange(n_fft, dtype=torch.float64) / n_fft
+        basis = torch.cat([torch.cos(phase), -torch.sin(phase)]) * window
+        self.register_buffer("basis", basis.float().unsqueeze(1), persistent=False)
+        self.register_buffer(
+            "mel_fb", mel_transformer.mel_scale.fb.T.contiguous(), persistent=False
+        )
+
+    def forward(self, wav: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            wav: waveform. shape: (batch_size, num_samples)
+
+        Returns:
+            mel: shape: (batch_size, num_mels, num_frames)
+        """
+        pad = self.n_fft // 2
+        x = F.pad(wav.unsqueeze(1), (pad, pad), mode=self.pad_mode)
+        spec = F.conv1d(x, self.basis, stride=self.hop_length)
+        real, imag = spec.chunk(2, dim=1)
+        magnitude = torch.sqrt(real**2 + imag**2)
+        return torch.matmul(self.mel_fb, magnitude)
+
+
+class BiCodecTokenizeGraph(nn.Module):
+    """Exportable `BiCodec.tokenize`: (feat, ref_wav) -> (semantic_tokens, global_tokens)."""
+
+    def __init__(self, model: BiCodec):
+        super().__init__()
+        self.model = model
+        self.mel_transformer = ConvMelSpectrogram(model.mel_transformer)
+
+    def forward(self, feat: torch.Tensor, ref_wav: torch.Tensor):
+        mel = self.mel_transformer(ref_wav)
+        z = self.model.encoder(feat.transpose(1, 2))
+        semantic_tokens = self.model.quantizer.tokenize(z)
+        global_tokens = self.model.speaker_encoder.tokenize(mel.transpose(1, 2))
+        return semantic_tokens.long(), global_tokens.long()
+
+
+class BiCodecDetokenizeGraph(nn.Module):
+    """Exportable `BiCodec.detokenize`: (semantic_tokens, global_tokens) -> wav.
+
+    The einops/einx reshapes of the speaker FSQ lookup are traced with a fixed
+    batch size, so the d-vector is computed here with plain embedding lookups
+    into the scaled implicit codebooks instead.
+    """
+
+    def __init__(self, model: BiCodec):
+        super().__init__()
+        self.model = model
+        quantizer = model.speaker_encoder.quantizer
+        codebooks = quantizer.codebooks * quantizer.scales.unsqueeze(1)
+        self.register_buffer("speaker_codebooks", codebooks, persistent=False)
+
+    def speaker_detokenize(self, global_tokens: torch.Tensor) -> torch.Tensor:
+        """Same as `SpeakerEncoder.detokenize`, (B, 1, T2) indices -> (B, out_dim)."""
+        speaker_encoder = self.model.speaker_encoder
+        indices = global_tokens.transpose(1, 2)
+        codes = sum(
+            F.embedding(indices[..., q], codebook)
+            for q, codebook in enumerate(self.speaker_codebooks)
+        )
+        zq = speaker_encoder.quantizer.project_out(codes).transpose(1, 2)
+        return speaker_encoder.project(zq.reshape(zq.shape[0], -1))
+
+    def forward(self, semantic_tokens: torch.Tensor, global_tokens: torch.Tensor):
+        z_q = self.model.quantizer.detokenize(semantic_tokens)
+        d_vector = self.speaker_detokenize(global_tokens)
+        x = self.model.prenet(z_q, d_vector)
+        x = x + d_vector.unsqueeze(-1)
+        return self.model.decoder(x)
+
+
+@torch.no_grad()
+def export_onnx(model: BiCodec, output_dir: Path, opset_version: int = 17):
+    """
+    Export BiCodec to `bicodec_tokenize.onnx` and `bicodec_detokenize.onnx`.
+
+    Args:
+        model (BiCodec): Model in eval mode with weight norm removed.
+        output_dir (Path): Directory the graphs are written to.
+        opset_version (int): ONNX opset. Default is 17.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    model = model.cpu().eval()
+    # the traced lengths are arbitrary, all time axes are exported as dynamic
+    feat = torch.randn(1, 100, model.encoder.encoder.input_channels)
+    ref_wav = torch.randn(1, 32000) * 0.1
+    tokenize_graph = BiCodecTokenizeGraph(model).eval()
+    torch.onnx.export(
+        tokenize_graph,
+        (feat, ref_wav),
+        f"{output_dir}/{TOKENIZE_GRAPH}",
+        input_names=["feat", "ref_wav"],
+        output_names=["semantic_tokens", "global_tokens"],
+        dynamic_axes={
+            "feat": {0: "batch_size", 1: "num_frames"},
+            "ref_wav": {0: "batch_size", 1: "num_ref_samples"},
+            "semantic_tokens": {0: "batch_size", 1: "num_tokens"},
+            "global_tokens": {0: "batch_size"},
+        },
+        opset_version=opset_version,
+        dynamo=False,
+    )
+
+    semantic_tokens, global_tokens = tokenize_graph(feat, ref_wav)
+    torch.onnx.export(
+        BiCodecDetokenizeGraph(model).eval(),
+        (semantic_tokens, global_tokens),
+        f"{output_dir}/{DETOKENIZE_GRAPH}",
+        input_names=["semantic_tokens", "global_tokens"],
+        output_names=["wav"],
+        dynamic_axes={
+            "semantic_tokens": {0: "batch_size", 1: "num_tokens"},
+            "global_tokens": {0: "batch_size"},
+            "wav": {0: "batch_size", 2: "num_samples"},
+        },
+        opset_version=opset_version,
+        dynamo=False,
+    )
+
+
+class OnnxBiCodec:
+    """
+    BiCodec tokenize/detokenize running on ONNX Runtime (CPU).
+
+    Args:
+        onnx_dir (Path): Directory containing the graphs written by `export_onnx`.
+        num_threads (int, optional): Intra-op threads. ONNX Runtime picks if None.
+    """
+
+    def __init__(self, onnx_dir: Path, num_threads: int = None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "The onnxruntime backend requires `pip install onnxruntime`"
+            ) from e
+
+        for name in (TOKENIZE_GRAPH, DETOKENIZE_GRAPH):
+            if not os.path.exists(f"{onnx_dir}/{name}"):
+                raise FileNotFoundError(
+                    f"{onnx_dir}/{name} not found, export it with cli/export_onnx.py"
+                )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+        self.tokenize_session = ort.InferenceSession(
+            f"{onnx_dir}/{TOKENIZE_GRAPH}", options, providers=providers
+        )
+        self.detokenize_session = ort.InferenceSession(
+            f"{onnx_dir}/{DETOKENIZE_GRAPH}", options, providers=providers
+        )
+
+    @staticmethod
+    def _numpy(x: torch.Tensor, dtype) -> np.ndarray:
+        return x.detach().cpu().numpy().astype(dtype, copy=False)
+
+    def tokenize(self, batch: Dict[str, Any]):
+        """
+        Tokenizes the input audio into semantic and global tokens.
+
+        Args:
+            batch (dict): The input audio features and reference waveform.
+
+        Returns:
+            tuple: Semantic tokens and global tokens.
+        """
+        semantic_tokens, global_tokens = self.tokenize_session.run(
+            None,
+            {
+                "feat": self._numpy(batch["feat"], np.float32),
+                "ref_wav": self._numpy(batch["ref_wav"], np.float32),
+            },
+        )
+        return torch.from_numpy(semantic_tokens), torch.from_numpy(global_tokens)
+
+    def detokenize(self, semantic_tokens: torch.Tensor, global_tokens: torch.Tensor):
+        """
+        Detokenizes the semantic and global tokens into a waveform.
+
+        Args:
+            semantic_tokens (tensor): Semantic tokens. shape: (batch_size, num_tokens)
+            global_tokens (tensor): Global tokens. shape: (batch_size, 1, num_global_tokens)
+
+        Returns:
+            tensor: Reconstructed waveform. shape: (batch_size, 1, num_samples)
+        """
+        (wav,) = self.detokenize_session.run(
+            None,
+            {
+                "semantic_tokens": self._numpy(semantic_tokens, np.int64),
+                "global_tokens": self._numpy(global_tokens, np.int64),
+            },
+        )
+        return torch.from_numpy(wav)
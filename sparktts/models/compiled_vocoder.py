@@ -0,0 +1,150 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Compiled, shape-bucketed vocoder. Semantic token sequences are padded up to
+    the next of a few bucket lengths so the prenet and wave generator only ever
+    see a fixed set of shapes, each compiled once with torch.compile or traced
+    and frozen with TorchScript. The padded tail is trimmed from the output.
+"""
+
+import torch
+import torch.nn as nn
+
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from sparktts.models.bicodec import BiCodec, VoiceConditioning, vocoder_context
+
+
+COMPILE_MODES = (None, "inductor", "torchscript")
+DEFAULT_BUCKETS = (64, 128, 256, 512, 1024, 1536)
+
+
+class VocoderGraph(nn.Module):
+    """Prenet and wave generator of BiCodec: (z_q, d_vector) -> wav."""
+
+    def __init__(self, model: BiCodec):
+        super().__init__()
+        self.prenet = model.prenet
+        self.decoder = model.decoder
+
+    def forward(self, z_q: torch.Tensor, d_vector: torch.Tensor) -> torch.Tensor:
+        x = self.prenet(z_q, d_vector)
+        x = x + d_vector.unsqueeze(-1)
+        return self.decoder(x)
+
+
+class BucketedVocoder:
+    """
+    `BiCodec.detokenize` with semantic lengths padded to compiled buckets.
+
+    Sequences are padded by repeating their last token, which keeps the padded
+    tail close to the signal. The right contexts of both the prenet and the wave
+    generator reach into the padding, so the samples of the last `tail_tokens`
+    tokens (`vocoder_context`, 71 with the released BiCodec) can differ from the
+    eager output; earlier samples match. Sequences longer than the largest bucket
+    run eagerly.
+
+    Args:
+        model (BiCodec): BiCodec model in eval mode.
+        mode (str): "inductor" for torch.compile or "torchscript" for trace + freeze.
+        buckets (Sequence[int]): Semantic lengths compiled, in tokens.
+    """
+
+    def __init__(
+        self,
+        model: BiCodec,
+        mode: str = "inductor",
+        buckets: Sequence[int] = DEFAULT_BUCKETS,
+    ):
+        if mode not in COMPILE_MODES[1:]:
+            raise ValueError(f"Unsupported compile mode: {mode}, expected one of {COMPILE_MODES[1:]}")
+        self.model = model
+        self.mode = mode
+        self.buckets = sorted(buckets)
+        self.tail_tokens = vocoder_context(model)
+        self.graph = VocoderGraph(model).eval()
+        if mode == "inductor":
+            # one specialization per (batch size, bucket)
+            torch._dynamo.config.cache_size_limit = max(
+                torch._dynamo.config.cache_size_limit, 4 * len(self.buckets)
+            )
+            self._compiled = torch.compile(self.graph, dynamic=False)
+        # (batch_size, bucket) -> frozen TorchScript module
+        self._traced: Dict[Tuple[int, int], Callable] = {}
+
+    def bucket(self, length: int) -> int:
+        """Smallest bucket holding `length` tokens, or None if it exceeds all of them."""
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        return None
+
+    def _graph_for(self, z_q: torch.Tensor, d_vector: torch.Tensor) -> Callable:
+        if self.mode == "inductor":
+            return self._compiled
+        key = (z_q.shape[0], z_q.shape[-1])
+        if key not in self._traced:
+            traced = torch.jit.trace(self.graph, (z_q, d_vector), check_trace=False)
+            self._traced[key] = torch.jit.freeze(traced)
+        return self._traced[key]
+
+    @torch.no_grad()
+    def detokenize(
+        self,
+        semantic_tokens: torch.Tensor,
+        global_tokens: Optional[torch.Tensor] = None,
+        conditioning: Optional[VoiceConditioning] = None,
+    ):
+        """
+        Detokenizes the semantic and global tokens into a waveform.
+
+        Args:
+            semantic_tokens (tensor): Semantic tokens. shape: (batch_size, num_tokens)
+            global_tokens (tensor, optional): Global tokens. shape: (batch_size, 1, token_num)
+            conditioning (VoiceConditioning, optional): Used instead of the global tokens.
+                Only its d-vector is reused, the compiled graph recomputes the modulations.
+
+        Returns:
+            tensor: Reconstructed waveform. shape: (batch_size, 1, num_samples)
+        """
+        length = semantic_tokens.shape[1]
+        bucket = self.bucket(length)
+        if bucket is None:
+            return self.model.detokenize(semantic_tokens, global_tokens, conditioning)
+
+        padding = semantic_tokens[:, -1:].expand(-1, bucket - length)
+        semantic_tokens = torch.cat([semantic_tokens, padding], dim=1)
+        z_q = self.model.quantizer.detokenize(semantic_tokens)
+        if conditioning is not None:
+            d_vector = conditioning.d_vector
+        else:
+            d_vector = self.model.speaker_encoder.detokenize(global_tokens)
+        wav = self._graph_for(z_q, d_vector)(z_q, d_vector)
+        hop_length = wav.shape[-1] // bucket
+        return wav[..., : length * hop_length]
+
+    @torch.no_grad()
+    def warmup(self, batch_sizes: Sequence[int] = (1,)):
+        """Compile every bucket for each batch size ahead of the first request."""
+        device = next(self.model.parameters()).device
+        num_global_tokens = self.model.speaker_encoder.token_num
+        for batch_size in batch_sizes:
+            global_tokens = torch.zeros(
+                batch_size, 1, num_global_tokens, dtype=torch.long, device=device
+            )
+            for bucket in self.buckets:
+                semantic_tokens = torch.zeros(batch_size, bucket, dtype=torch.long, device=device)
+                self.detokenize(semantic_tokens, global_tokens)
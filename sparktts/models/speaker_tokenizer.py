@@ -0,0 +1,141 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Inference build of the BiCodec speaker path (reference clip -> global
+    tokens). Same weights and results as `BiCodec.tokenize`, with the ECAPA-TDNN
+    BatchNorms folded, the x-vector head skipped, and the perceiver attention
+    run with `scaled_dot_product_attention`.
+"""
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from sparktts.models.bicodec import BiCodec
+from sparktts.modules.speaker.perceiver_encoder import Attention
+
+
+class StftMelSpectrogram(nn.Module):
+    """
+    The magnitude mel spectrogram of a torchaudio `MelSpectrogram`, returned
+    frame-major as the speaker encoder consumes it.
+
+    The window and the filterbank are kept as buffers, and the spectrum goes
+    straight from `torch.stft` into the filterbank matmul. This skips the
+    `pow(1.0)` pass and the transposes in and out of the torchaudio layout.
+
+    Args:
+        mel_transformer: torchaudio `MelSpectrogram` with power=1.
+    """
+
+    def __init__(self, mel_transformer: nn.Module):
+        super().__init__()
+        spectrogram = mel_transformer.spectrogram
+        assert spectrogram.power == 1 and spectrogram.pad == 0 and not spectrogram.normalized
+        self.n_fft = spectrogram.n_fft
+        self.hop_length = spectrogram.hop_length
+        self.win_length = spectrogram.win_length
+        self.center = spectrogram.center
+        self.pad_mode = spectrogram.pad_mode
+        self.register_buffer("window", spectrogram.window.clone(), persistent=False)
+        self.register_buffer("mel_fb", mel_transformer.mel_scale.fb.clone(), persistent=False)
+
+    def forward(self, wav: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            wav: waveform. shape: (batch_size, num_samples)
+
+        Returns:
+            mel: shape: (batch_size, num_frames, num_mels)
+        """
+        spec = torch.stft(
+            wav,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            win_length=self.win_length,
+            window=self.window,
+            center=self.center,
+            pad_mode=self.pad_mode,
+            return_complex=True,
+        ).abs()
+        return torch.matmul(spec.transpose(1, 2), self.mel_fb)
+
+
+def sdpa_attention(attn: Attention, x: torch.Tensor, context: torch.Tensor) -> torch.Tensor:
+    """`Attention.forward` (no mask, not causal) with `F.scaled_dot_product_attention`."""
+    if attn.cross_attn_include_queries:
+        context = torch.cat((x, context), dim=-2)
+    q = attn.to_q(x)
+    k, v = attn.to_kv(context).chunk(2, dim=-1)
+    q, k, v = (t.unflatten(-1, (attn.heads, -1)).transpose(1, 2) for t in (q, k, v))
+    out = F.scaled_dot_product_attention(q, k, v)
+    return attn.to_out(out.transpose(1, 2).flatten(2))
+
+
+class SpeakerTokenizer(nn.Module):
+    """
+    Reference clips -> global tokens, equal to the speaker half of `BiCodec.tokenize`.
+
+    The modules are shared with `model`, whose ECAPA-TDNN BatchNorms are folded in
+    place (see `ECAPA_TDNN.fuse_batch_norm`). That leaves `model.tokenize` unchanged,
+    but the x-vector of `model.forward` is then the inference one.
+
+    Args:
+        model (BiCodec): BiCodec model in eval mode, not decode-only.
+    """
+
+    def __init__(self, model: BiCodec):
+        super().__init__()
+        speaker_encoder = model.speaker_encoder
+        assert speaker_encoder.speaker_encoder is not None, "decode-only BiCodec"
+        speaker_encoder.speaker_encoder.fuse_batch_norm()
+        self.mel_transformer = StftMelSpectrogram(model.mel_transformer)
+        self.ecapa = speaker_encoder.speaker_encoder
+        self.perceiver = speaker_encoder.perceiver_sampler
+        self.quantizer = speaker_encoder.quantizer
+
+    def latent(self, mels: torch.Tensor) -> torch.Tensor:
+        """ECAPA-TDNN frame features, without the pooling and x-vector head."""
+        ecapa = self.ecapa
+        out1 = ecapa.layer1(mels.transpose(1, 2))
+        out2 = ecapa.layer2(out1)
+        out3 = ecapa.layer3(out2)
+        out4 = ecapa.layer4(out3)
+        return F.relu(ecapa.conv(torch.cat([out2, out3, out4], dim=1)))
+
+    def resample(self, features: torch.Tensor) -> torch.Tensor:
+        """Perceiver resampler: (B, C, T) features -> (B, num_latents, dim)."""
+        perceiver = self.perceiver
+        x = perceiver.proj_context(features.transpose(1, 2))
+        latents = perceiver.latents.expand(x.shape[0], -1, -1)
+        for attn, ff in perceiver.layers:
+            latents = sdpa_attention(attn, latents, x) + latents
+            latents = ff(latents) + latents
+        return perceiver.norm(latents)
+
+    @torch.no_grad()
+    def forward(self, ref_wavs: torch.Tensor) -> torch.Tensor:
+        """
+        Args:
+            ref_wavs: reference clips of equal length. shape: (batch_size, num_samples)
+
+        Returns:
+            global_tokens: same as `BiCodec.tokenize`. shape: (batch_size, 1, token_num)
+        """
+        mels = self.mel_transformer(ref_wavs).to(next(self.ecapa.parameters()).dtype)
+        x = self.resample(self.latent(mels)).transpose(1, 2)
+        _, indices = self.quantizer(x)
+        return indices
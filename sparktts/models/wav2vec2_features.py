@@ -0,0 +1,114 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    wav2vec2 feature extractor truncated to the transformer layers BiCodec
+    reads. Layers after the deepest requested hidden state are dropped at load
+    time, and only the requested hidden states are accumulated instead of
+    keeping the activations of every layer.
+"""
+
+import torch
+import torch.nn as nn
+
+from typing import Optional, Sequence
+from transformers import Wav2Vec2Model
+
+
+class TruncatedWav2Vec2(nn.Module):
+    """
+    Mean of selected wav2vec2 hidden states, computed with the minimum of layers.
+
+    `hidden_states[i]` follows the Hugging Face convention: index 0 is the input
+    of the first transformer layer and index i the output of layer i. The final
+    encoder layer norm, which Hugging Face applies to the last hidden state of the
+    full model, is never applied, so `model` may also be loaded with only
+    `max(layers)` layers.
+
+    Args:
+        model (Wav2Vec2Model): Pretrained model. Its encoder layers past
+            `max(layers)` are removed in place.
+        layers (Sequence[int]): Hidden states averaged. Default is (11, 14, 16).
+    """
+
+    def __init__(self, model: Wav2Vec2Model, layers: Sequence[int] = (11, 14, 16)):
+        super().__init__()
+        assert max(layers) <= len(model.encoder.layers)
+        self.layers = sorted(layers)
+        self.config = model.config
+        self.stable_layer_norm = model.config.do_stable_layer_norm
+
+        encoder = model.encoder
+        encoder.layers = encoder.layers[: max(layers)]
+        self.feature_extractor = model.feature_extractor
+        self.feature_projection = model.feature_projection
+        self.pos_conv_embed = encoder.pos_conv_embed
+        # pre-layer norm of the post-LN encoder variant
+        self.layer_norm = None if self.stable_layer_norm else encoder.layer_norm
+        self.encoder_layers = encoder.layers
+
+    @property
+    def device(self) -> torch.device:
+        return next(self.parameters()).device
+
+    def frame_lengths(self, num_samples: torch.Tensor) -> torch.Tensor:
+        """Number of frames of clips of `num_samples` samples (the conv output lengths)."""
+        for kernel_size, stride in zip(self.config.conv_kernel, self.config.conv_stride):
+            num_samples = torch.div(num_samples - kernel_size, stride, rounding_mode="floor") + 1
+        return num_samples
+
+    def forward(
+        self, input_values: torch.Tensor, attention_mask: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """
+        Args:
+            input_values: normalized waveform. shape: (batch_size, num_samples)
+            attention_mask: 1 for samples of the clip, 0 for padding, as returned by
+                the wav2vec2 processor. As in Hugging Face, padded frames are zeroed
+                before the positional conv and masked out of self-attention, so the
+                frames of a clip match those of the clip run alone.
+                shape: (batch_size, num_samples)
+
+        Returns:
+            features: mean of the selected hidden states. shape: (batch_size, num_frames, hidden_size)
+        """
+        extract_features = self.feature_extractor(input_values).transpose(1, 2)
+        hidden_states, _ = self.feature_projection(extract_features)
+
+        mask = None
+        if attention_mask is not None:
+            num_frames = hidden_states.shape[1]
+            frame_lengths = self.frame_lengths(attention_mask.sum(-1))
+            valid = torch.arange(num_frames, device=hidden_states.device) < frame_lengths[:, None]
+            hidden_states = hidden_states * valid.unsqueeze(-1).to(hidden_states.dtype)
+            # additive (batch_size, 1, num_frames, num_frames) key mask, accepted by the
+            # eager and sdpa attention of both transformers 4.x and 5.x
+            mask = torch.zeros(valid.shape, dtype=hidden_states.dtype, device=hidden_states.device)
+            mask = mask.masked_fill(~valid, torch.finfo(hidden_states.dtype).min)
+            mask = mask[:, None, None, :].expand(-1, 1, num_frames, -1)
+
+        hidden_states = hidden_states + self.pos_conv_embed(hidden_states)
+        if self.layer_norm is not None:
+            hidden_states = self.layer_norm(hidden_states)
+
+        features = hidden_states if 0 in self.layers else 0
+        for index, layer in enumerate(self.encoder_layers, start=1):
+            hidden_states = layer(hidden_states, attention_mask=mask)
+            # older transformers return (hidden_states, attentions)
+            if isinstance(hidden_states, tuple):
+                hidden_states = hidden_states[0]
+            if index in self.layers:
+                features = features + hidden_states
+        return features / len(self.layers)
@@ -17,7 +17,7 @@
 import torch
 import torch.nn as nn
 
-from typing import Tuple
+from typing import List, Tuple
 from torch.nn.utils import weight_norm, remove_weight_norm
 
 from typing import Optional
@@ -63,14 +63,17 @@ class ConvNeXtBlock(nn.Module):
         )
 
     def forward(
-        self, x: torch.Tensor, cond_embedding_id: Optional[torch.Tensor] = None
+        self,
+        x: torch.Tensor,
+        cond_embedding_id: Optional[torch.Tensor] = None,
+        modulation: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
     ) -> torch.Tensor:
         residual = x
         x = self.dwconv(x)
         x = x.transpose(1, 2)  # (B, C, T) -> (B, T, C)
         if self.adanorm:
-            assert cond_embedding_id is not None
-            x = self.norm(x, cond_embedding_id)
+            assert cond_embedding_id is not None or modulation is not None
+            x = self.norm(x, cond_embedding_id, modulation)
         else:
             x = self.norm(x)
         x = self.pwconv1(x)
@@ -102,9 +105,19 @@ class AdaLayerNorm(nn.Module):
         torch.nn.init.ones_(self.scale.weight)
         torch.nn.init.zeros_(self.shift.weight)
 
-    def forward(self, x: torch.Tensor, cond_embedding: torch.Tensor) -> torch.Tensor:
-        scale = self.scale(cond_embedding)
-        shift = self.shift(cond_embedding)
+    def modulation(self, cond_embedding: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Scale and shift of a condition, constant for a fixed condition."""
+        return self.scale(cond_embedding), self.shift(cond_embedding)
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        cond_embedding: Optional[torch.Tensor] = None,
+        modulation: Optional[Tuple[torch.Tensor, torch.Tensor]] = None,
+    ) -> torch.Tensor:
+        if modulation is None:
+            modulation = self.modulation(cond_embedding)
+        scale, shift = modulation
         x = nn.functional.layer_norm(x, (self.dim,), eps=self.eps)
         x = x * scale.unsqueeze(1) + shift.unsqueeze(1)
         return x
@@ -321,16 +334,36 @@ class VocosBackbone(Backbone):
             nn.init.trunc_normal_(m.weight, std=0.02)
             nn.init.constant_(m.bias, 0)
 
-    def forward(self, x: torch.Tensor, condition: torch.Tensor = None) -> torch.Tensor:
+    def modulations(self, condition: torch.Tensor) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        """
+        AdaLayerNorm (scale, shift) of the input norm and of every ConvNeXt block.
+
+        They only depend on `condition`, so callers decoding many sequences with the
+        same condition can compute them once and pass them to `forward`.
+        """
+        assert self.adanorm, "modulations require condition_dim"
+        return [self.norm.modulation(condition)] + [
+            block.norm.modulation(condition) for block in self.convnext
+        ]
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        condition: torch.Tensor = None,
+        modulations: Optional[List[Tuple[torch.Tensor, torch.Tensor]]] = None,
+    ) -> torch.Tensor:
         x = self.embed(x)
         if self.adanorm:
-            assert condition is not None
-            x = self.norm(x.transpose(1, 2), condition)
+            if modulations is None:
+                assert condition is not None
+                modulations = self.modulations(condition)
+            x = self.norm(x.transpose(1, 2), modulation=modulations[0])
         else:
             x = self.norm(x.transpose(1, 2))
         x = x.transpose(1, 2)
-        for conv_block in self.convnext:
-            x = conv_block(x, condition)
+        for i, conv_block in enumerate(self.convnext):
+            modulation = modulations[i + 1] if self.adanorm else None
+            x = conv_block(x, condition, modulation)
         x = self.final_layer_norm(x.transpose(1, 2))
         return x
 
@@ -75,10 +75,14 @@ class FSQ(Module):
         force_quantization_f32=True,
     ):
         super().__init__()
-        _levels = torch.tensor(levels, dtype=int32)
+        # explicit device: these buffers are not in checkpoints, so they must be
+        # computed even when the module is built under `torch.device("meta")`
+        _levels = torch.tensor(levels, dtype=int32, device="cpu")
         self.register_buffer("_levels", _levels, persistent=False)
 
-        _basis = torch.cumprod(torch.tensor([1] + levels[:-1]), dim=0, dtype=int32)
+        _basis = torch.cumprod(
+            torch.tensor([1] + levels[:-1], device="cpu"), dim=0, dtype=int32
+        )
         self.register_buffer("_basis", _basis, persistent=False)
 
         self.scale = scale
@@ -115,7 +119,9 @@ class FSQ(Module):
         self.return_indices = return_indices
         if return_indices:
             self.codebook_size = self._levels.prod().item()
-            implicit_codebook = self._indices_to_codes(torch.arange(self.codebook_size))
+            implicit_codebook = self._indices_to_codes(
+                torch.arange(self.codebook_size, device="cpu")
+            )
             self.register_buffer(
                 "implicit_codebook", implicit_codebook, persistent=False
             )
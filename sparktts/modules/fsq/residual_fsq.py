@@ -79,7 +79,8 @@ class ResidualFSQ(Module):
         self.levels = levels
         self.layers = nn.ModuleList([])
 
-        levels_tensor = torch.Tensor(levels)
+        # not in checkpoints, computed even under `torch.device("meta")`
+        levels_tensor = torch.tensor(levels, dtype=torch.float32, device="cpu")
 
         scales = []
 
@@ -25,6 +25,51 @@ import torch.nn.functional as F
 import sparktts.modules.speaker.pooling_layers as pooling_layers
 
 
+""" BatchNorm folding for inference
+"""
+
+
+def batch_norm_affine(bn):
+    """Eval-mode BatchNorm1d as `x * scale + shift`, on the device of its weight."""
+    device = bn.weight.device
+    scale = bn.weight / torch.sqrt(bn.running_var.to(device) + bn.eps)
+    shift = bn.bias - bn.running_mean.to(device) * scale
+    return scale, shift
+
+
+class ChannelAffine(nn.Module):
+    """Per-channel `x * scale + shift` over (B, C, T) inputs."""
+
+    def __init__(self, channels):
+        super().__init__()
+        self.register_buffer("scale", torch.ones(channels))
+        self.register_buffer("shift", torch.zeros(channels))
+
+    def forward(self, x):
+        return torch.addcmul(self.shift.unsqueeze(-1), x, self.scale.unsqueeze(-1))
+
+
+@torch.no_grad()
+def fold_relu_bn(conv, bn):
+    """
+    Fold the BatchNorm of `bn(relu(conv(x)))` into `conv`.
+
+    The BatchNorm follows the ReLU, so only its scale magnitude can move into the
+    conv: relu is positively homogeneous, so a * relu(z) = sign(a) * relu(|a| * z).
+    The conv is rescaled in place and the returned ChannelAffine applies the
+    remaining sign and shift.
+    """
+    scale, shift = batch_norm_affine(bn)
+    magnitude = scale.abs()
+    conv.weight = nn.Parameter(conv.weight * magnitude.view(-1, 1, 1))
+    if conv.bias is not None:
+        conv.bias = nn.Parameter(conv.bias * magnitude)
+    affine = ChannelAffine(scale.numel())
+    affine.scale = torch.sign(scale)
+    affine.shift = shift
+    return affine
+
+
 class Res2Conv1dReluBn(nn.Module):
     """
     in_channels == out_channels == channels
@@ -81,6 +126,13 @@ class Res2Conv1dReluBn(nn.Module):
 
         return out
 
+    def fuse_batch_norm(self):
+        if isinstance(self.bns[0], ChannelAffine):
+            return
+        self.bns = nn.ModuleList(
+            [fold_relu_bn(conv, bn) for conv, bn in zip(self.convs, self.bns)]
+        )
+
 
 """ Conv1d + BatchNorm1d + ReLU
 """
@@ -107,6 +159,10 @@ class Conv1dReluBn(nn.Module):
     def forward(self, x):
         return self.bn(F.relu(self.conv(x)))
 
+    def fuse_batch_norm(self):
+        if isinstance(self.bn, nn.BatchNorm1d):
+            self.bn = fold_relu_bn(self.conv, self.bn)
+
 
 """ The SE connection of 1D case.
 """
@@ -207,6 +263,32 @@ class ECAPA_TDNN(nn.Module):
             return out, latent
         return out
 
+    @torch.no_grad()
+    def fuse_batch_norm(self):
+        """
+        Fold every BatchNorm for inference: the post-ReLU ones of the conv blocks
+        (see `fold_relu_bn`) and the embedding ones into `linear`. Only changes the
+        structure when the parameters are on the meta device. No-op once fused.
+        """
+        if isinstance(self.bn, nn.Identity):
+            return
+        for module in list(self.modules()):
+            if isinstance(module, (Conv1dReluBn, Res2Conv1dReluBn)):
+                module.fuse_batch_norm()
+
+        scale, shift = batch_norm_affine(self.bn)
+        weight = self.linear.weight * scale
+        bias = self.linear.bias + self.linear.weight @ shift
+        if self.emb_bn:
+            scale, shift = batch_norm_affine(self.bn2)
+            weight = weight * scale.unsqueeze(1)
+            bias = bias * scale + shift
+            self.emb_bn = False
+            self.bn2 = nn.Identity()
+        self.linear.weight = nn.Parameter(weight)
+        self.linear.bias = nn.Parameter(bias)
+        self.bn = nn.Identity()
+
 
 def ECAPA_TDNN_c1024(feat_dim, embed_dim, pooling_func="ASTP", emb_bn=False):
     return ECAPA_TDNN(
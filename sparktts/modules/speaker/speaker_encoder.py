@@ -51,6 +51,7 @@ class SpeakerEncoder(nn.Module):
         fsq_num_quantizers: int = 1,
     ):
         super(SpeakerEncoder, self).__init__()
+        self.token_num = token_num
 
         self.speaker_encoder = ECAPA_TDNN_GLOB_c512(
             feat_dim=input_dim, embed_dim=out_dim
@@ -0,0 +1,121 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Fast model loading. Modules are built with their parameters on the meta
+    device, so no memory is filled and no random init runs, and the
+    checkpoint is memory-mapped so loaded parameters are views of the page
+    cache instead of private copies.
+"""
+
+import os
+import json
+import struct
+import itertools
+import contextlib
+import torch
+import torch.nn as nn
+
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+@contextlib.contextmanager
+def meta_parameters() -> Iterator[None]:
+    """
+    Build the modules created inside the context with their tensors on the meta device.
+
+    This is `with torch.device("meta")`, which only affects the calling thread, so
+    other threads keep allocating real tensors meanwhile. Buffers that are not part
+    of the checkpoint (FSQ levels and codebooks) are created on an explicit device
+    by their modules and are still computed. Init functions applied to meta tensors
+    are no-ops.
+    """
+    with torch.device("meta"):
+        yield
+
+
+def mmap_safetensors(path: Path) -> Dict[str, torch.Tensor]:
+    """
+    Memory-map a safetensors file on CPU.
+
+    The returned tensors share one private (copy-on-write) mapping of the file, so
+    pages are read on first access and never duplicated into process memory.
+
+    Args:
+        path (Path): Path of the .safetensors file.
+
+    Returns:
+        Dict[str, torch.Tensor]: the tensors of the file
+    """
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header: Dict[str, Any] = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+
+    storage = torch.UntypedStorage.from_file(
+        str(path), shared=False, nbytes=os.path.getsize(path)
+    )
+    data = torch.empty(0, dtype=torch.uint8).set_(storage)
+    data_offset = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        buffer = data[data_offset + start : data_offset + end]
+        if buffer.storage_offset() % dtype.itemsize != 0:
+            # unaligned tensors cannot be viewed in place
+            buffer = buffer.clone()
+        tensors[name] = buffer.view(dtype).reshape(info["shape"])
+    return tensors
+
+
+def load_meta_state_dict(model: nn.Module, state_dict: Dict[str, torch.Tensor]):
+    """
+    Assign checkpoint tensors to a model built under `meta_parameters`.
+
+    Returns:
+        Tuple[List[str], List[str]]: missing and unexpected keys, as `load_state_dict`.
+
+    Raises:
+        ValueError: If a parameter or buffer is still on the meta device after loading.
+    """
+    missing_keys, unexpected_keys = model.load_state_dict(state_dict, strict=False, assign=True)
+    tensors = itertools.chain(model.named_parameters(), model.named_buffers())
+    on_meta = [name for name, tensor in tensors if tensor.is_meta]
+    if on_meta:
+        raise ValueError(f"Tensors missing from the checkpoint: {on_meta}")
+    return missing_keys, unexpected_keys
+
+
+def hf_load_kwargs(fast_load: bool) -> Dict[str, Any]:
+    """`from_pretrained` kwargs of the fast path: meta init and direct assignment of weights."""
+    # transformers 5 always loads this way and ignores the flag
+    return {"low_cpu_mem_usage": True} if fast_load else {}
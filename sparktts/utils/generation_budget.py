@@ -0,0 +1,178 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Adaptive generation budget. The expected number of semantic tokens of a
+    text is estimated from its length per script and the 50 Hz token rate,
+    and generation is capped at a multiple of it. A stopping criterion enforces
+    the per-row cap and stops rows that fall into a repetitive loop.
+"""
+
+import re
+import math
+import torch
+
+from typing import Dict, List
+from transformers.generation.stopping_criteria import StoppingCriteria
+
+
+# Seconds of speech per unit, rough averages of read speech
+SECONDS_PER_CJK_CHAR = 0.22
+SECONDS_PER_WORD = 0.35
+SECONDS_PER_PAUSE = 0.25
+
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+WORD_PATTERN = re.compile(r"[A-Za-z\u00c0-\u024f\u0400-\u04ff]+(?:'[A-Za-z]+)?|\d+")
+PAUSE_PATTERN = re.compile(r"[,.;:!?，。；：！？、…\n]")
+
+STATUS_EOS = "eos"
+STATUS_BUDGET_CAP = "budget_cap"
+STATUS_LOOP = "loop"
+STATUS_STOPPED = "stopped"
+
+
+def estimate_duration(text: str) -> float:
+    """Estimate the spoken duration of `text` in seconds.
+
+    CJK characters are counted one syllable each; words in alphabetic scripts
+    and digit groups are counted as words. Punctuation adds a short pause.
+    """
+    num_chars = len(CJK_PATTERN.findall(text))
+    num_words = len(WORD_PATTERN.findall(text))
+    num_pauses = len(PAUSE_PATTERN.findall(text))
+    return (
+        num_chars * SECONDS_PER_CJK_CHAR
+        + num_words * SECONDS_PER_WORD
+        + num_pauses * SECONDS_PER_PAUSE
+    )
+
+
+class GenerationBudget:
+    """Cap on generated tokens derived from the text to be spoken.
+
+    Args:
+        token_rate (float): Semantic tokens per second. Default is 50.
+        multiple (float): Cap as a multiple of the expected semantic tokens. Default is 3.
+        min_duration (float): Lower bound of the estimate in seconds. Default is 2.
+        max_new_tokens (int): Hard upper bound of the cap. Default is 3000.
+    """
+
+    def __init__(
+        self,
+        token_rate: float = 50,
+        multiple: float = 3.0,
+        min_duration: float = 2.0,
+        max_new_tokens: int = 3000,
+    ):
+        self.token_rate = token_rate
+        self.multiple = multiple
+        self.min_duration = min_duration
+        self.max_new_tokens = max_new_tokens
+
+    def expected_tokens(self, text: str) -> int:
+        """Expected number of semantic tokens of `text`."""
+        duration = max(self.min_duration, estimate_duration(text))
+        return math.ceil(duration * self.token_rate)
+
+    def cap(self, text: str, extra_tokens: int = 0) -> int:
+        """Token cap of one generation.
+
+        Args:
+            text (str): The text to be spoken.
+            extra_tokens (int): Non-semantic tokens the model also generates,
+                e.g. global and structural tokens in controllable mode.
+
+        Returns:
+            int: value for `max_new_tokens`
+        """
+        cap = math.ceil(self.multiple * self.expected_tokens(text)) + extra_tokens
+        return min(cap, self.max_new_tokens)
+
+
+class RunawayStoppingCriteria(StoppingCriteria):
+    """Per-row token cap and loop detector for batched generation.
+
+    A row is stopped when it has generated `max_new_tokens[row]` tokens, or
+    when its last `window` tokens are all semantic tokens that repeat with a
+    period of at most `max_period` tokens. `status` records why each row
+    stopped, and `loop_start` where the repeated tail begins.
+
+    Args:
+        prompt_length (int): Length of the (padded) prompts.
+        max_new_tokens (List[int]): Token cap of every row.
+        semantic_mask (torch.Tensor): bool mask over the vocabulary, True for semantic tokens.
+        window (int): Repeated span that counts as a loop, in tokens. Default is 100 (2 s).
+        max_period (int): Longest repeated pattern checked, in tokens. Default is 25.
+    """
+
+    def __init__(
+        self,
+        prompt_length: int,
+        max_new_tokens: List[int],
+        semantic_mask: torch.Tensor,
+        window: int = 100,
+        max_period: int = 25,
+    ):
+        self.prompt_length = prompt_length
+        self.max_new_tokens = max_new_tokens
+        self.semantic_mask = semantic_mask
+        self.window = window
+        self.max_period = max_period
+        self.status: List[str] = [None] * len(max_new_tokens)
+        self.loop_start: List[int] = [None] * len(max_new_tokens)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs):
+        num_new_tokens = input_ids.shape[1] - self.prompt_length
+        is_done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+        if num_new_tokens >= self.window:
+            tail = input_ids[:, -self.window :]
+            mask = self.semantic_mask.to(tail.device)
+            semantic = mask[tail.clamp(0, len(mask) - 1)].all(-1)
+            for period in range(1, self.max_period + 1):
+                looped = semantic & (tail[:, period:] == tail[:, :-period]).all(-1)
+                for row in looped.nonzero().reshape(-1).tolist():
+                    if self.status[row] is None:
+                        self.status[row] = STATUS_LOOP
+                        # keep one occurrence of the repeated pattern
+                        self.loop_start[row] = num_new_tokens - self.window + period
+                is_done |= looped
+
+        for row, cap in enumerate(self.max_new_tokens):
+            if num_new_tokens >= cap:
+                if self.status[row] is None:
+                    self.status[row] = STATUS_BUDGET_CAP
+                is_done[row] = True
+        return is_done
+
+
+class GenerationStats:
+    """Counters of how generations ended."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {
+            STATUS_EOS: 0,
+            STATUS_BUDGET_CAP: 0,
+            STATUS_LOOP: 0,
+            STATUS_STOPPED: 0,
+        }
+
+    def update(self, statuses: List[str]):
+        for status in statuses:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of runs per stop reason."""
+        return dict(self.counts, runs=sum(self.counts.values()))
@@ -0,0 +1,106 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Helpers for synthesizing long text chunk by chunk: a sentence-level text
+    splitter and an in-memory stitcher that joins the waveforms of consecutive
+    chunks with a short crossfade, releasing samples as soon as they are final.
+"""
+
+import re
+import numpy as np
+
+from typing import List
+
+
+# sentence ends; "." only counts when followed by whitespace, so decimals stay intact
+SENTENCE_SPLIT = re.compile(r"(?<=[。！？!?；;…\n])|(?<=\.)(?=\s)")
+CLAUSE_MARKS = "，,、：:"
+
+
+def split_text(text: str, max_chars: int = 150) -> List[str]:
+    """Split text into chunks of whole sentences of at most `max_chars` characters.
+
+    Consecutive sentences are merged while they fit. Sentences longer than
+    `max_chars` are cut at their last clause mark (comma, colon, ...) within
+    the limit, or at the limit if there is none.
+
+    Args:
+        text (str): Text to split.
+        max_chars (int): Maximum characters per chunk. Default is 150.
+
+    Returns:
+        List[str]: Non-empty chunks, in order.
+    """
+    pieces = []
+    for sentence in SENTENCE_SPLIT.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = max(sentence.rfind(mark, 0, max_chars) for mark in CLAUSE_MARKS) + 1
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+
+    chunks = []
+    for piece in pieces:
+        if len(chunks) > 0 and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            separator = " " if chunks[-1][-1].isascii() else ""
+            chunks[-1] = chunks[-1] + separator + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+class CrossfadeStitcher:
+    """Concatenate waveform chunks in memory with a linear crossfade at each junction.
+
+    The last `crossfade` samples of a chunk overlap the first samples of the next
+    one, so `push` holds them back and returns only the samples no later chunk can
+    change; `flush` returns the held-back tail. The concatenation of all returned
+    arrays is the stitched waveform, of length `num_samples`.
+
+    Args:
+        crossfade (int): Overlap between consecutive chunks, in samples.
+    """
+
+    def __init__(self, crossfade: int):
+        self.crossfade = crossfade
+        self.tail = np.zeros(0, dtype=np.float32)
+        self.num_samples = 0
+
+    def push(self, wav: np.ndarray) -> np.ndarray:
+        """Add the next chunk and return the samples that became final."""
+        wav = np.asarray(wav, dtype=np.float32).reshape(-1)
+        overlap = min(len(self.tail), len(wav))
+        if overlap > 0:
+            fade_in = np.linspace(0, 1, overlap + 2, dtype=np.float32)[1:-1]
+            mixed = self.tail[len(self.tail) - overlap :] * (1 - fade_in) + wav[:overlap] * fade_in
+            wav = np.concatenate([self.tail[: len(self.tail) - overlap], mixed, wav[overlap:]])
+        else:
+            wav = np.concatenate([self.tail, wav])
+
+        keep = min(self.crossfade, len(wav))
+        ready, self.tail = wav[: len(wav) - keep], wav[len(wav) - keep :]
+        self.num_samples += len(ready)
+        return ready
+
+    def flush(self) -> np.ndarray:
+        """Return the held-back tail of the last chunk."""
+        tail, self.tail = self.tail, np.zeros(0, dtype=np.float32)
+        self.num_samples += len(tail)
+        return tail
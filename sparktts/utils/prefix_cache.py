@@ -0,0 +1,165 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    LRU cache of LLM key/value states of previous prompts. A new prompt is
+    matched against the cached ones by longest common token-id prefix, and the
+    cached keys/values of that prefix seed `generate`, so prefill only covers
+    the divergent suffix.
+"""
+
+import threading
+import torch
+import numpy as np
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from transformers import DynamicCache
+
+
+def cache_tensors(past_key_values) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """Return the (key, value) tensors of every layer of a `DynamicCache`."""
+    if hasattr(past_key_values, "layers"):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    return list(zip(past_key_values.key_cache, past_key_values.value_cache))
+
+
+class PrefixKVCache:
+    """LRU cache of prompt key/values keyed by token ids, with a byte budget.
+
+    Only batch size 1 is cached. Stored tensors are never modified: a lookup
+    builds a fresh `DynamicCache` over views of the matched prefix, and
+    `generate` appends to it by concatenation.
+
+    Args:
+        max_bytes (int): Memory budget. Default is 256 MB.
+        min_prefix_tokens (int): Shortest prefix worth reusing; shorter prefixes are
+            neither looked up nor stored. Default is 16.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, min_prefix_tokens: int = 16):
+        self.max_bytes = max_bytes
+        self.min_prefix_tokens = min_prefix_tokens
+
+        self._entries: "OrderedDict[Tuple[int, ...], List[Tuple[torch.Tensor, torch.Tensor]]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_bytes(entry: List[Tuple[torch.Tensor, torch.Tensor]]) -> int:
+        return sum(t.numel() * t.element_size() for kv in entry for t in kv)
+
+    @staticmethod
+    def _common_prefix(a: np.ndarray, b: np.ndarray) -> int:
+        n = min(len(a), len(b))
+        mismatch = np.flatnonzero(a[:n] != b[:n])
+        return int(mismatch[0]) if len(mismatch) > 0 else n
+
+    def lookup(self, input_ids: torch.Tensor) -> Tuple[Optional[DynamicCache], int]:
+        """Find the cached prompt sharing the longest prefix with `input_ids`.
+
+        At least the last prompt token is left uncached, since `generate` needs
+        it to produce the first logits.
+
+        Args:
+            input_ids (torch.Tensor): Prompt ids. shape: (1, seq_len)
+
+        Returns:
+            Tuple[Optional[DynamicCache], int]: cache seeded with the prefix and its
+                length in tokens, or (None, 0) on a miss
+        """
+        ids = input_ids.reshape(-1).cpu().numpy()
+        with self._lock:
+            best_key, best_len = None, 0
+            for key in self._entries:
+                length = self._common_prefix(np.asarray(key), ids)
+                if length > best_len:
+                    best_key, best_len = key, length
+            best_len = min(best_len, len(ids) - 1)
+            if best_key is None or best_len < self.min_prefix_tokens:
+                self.misses += 1
+                return None, 0
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            self.hits += 1
+            self.reused_tokens += best_len
+
+        past_key_values = DynamicCache()
+        for layer_idx, (key, value) in enumerate(entry):
+            past_key_values.update(
+                key[:, :, :best_len].to(input_ids.device),
+                value[:, :, :best_len].to(input_ids.device),
+                layer_idx,
+            )
+        return past_key_values, best_len
+
+    def put(self, input_ids: torch.Tensor, past_key_values, prefix_length: int = None):
+        """Store the key/values of the prompt `input_ids` (1, seq_len).
+
+        `past_key_values` may extend past the prompt, e.g. the cache returned by
+        `generate`; only the first `seq_len` positions are kept.
+
+        Args:
+            prefix_length (int, optional): Keep only the first `prefix_length` ids, the
+                part later prompts can share. Nothing is stored if it is shorter than
+                `min_prefix_tokens`. Default is the whole prompt.
+        """
+        ids = tuple(input_ids.reshape(-1).tolist())[:prefix_length]
+        length = len(ids)
+        if length < self.min_prefix_tokens:
+            return
+        entry = [
+            (key[:, :, :length].clone(), value[:, :, :length].clone())
+            for key, value in cache_tensors(past_key_values)
+        ]
+        with self._lock:
+            if ids in self._entries:
+                self.num_bytes -= self._entry_bytes(self._entries.pop(ids))
+            size = self._entry_bytes(entry)
+            if size > self.max_bytes:
+                return
+            self._entries[ids] = entry
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.num_bytes -= self._entry_bytes(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters, reused prefix tokens and memory usage."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.num_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reused_tokens": self.reused_tokens,
+            }
@@ -0,0 +1,194 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Content-addressed cache of BiCodec prompt tokens. Entries are keyed by a
+    hash of the decoded PCM of the reference audio plus the model directory and
+    the tokenizer configuration, so a repeated voice skips resampling, wav2vec2
+    and the BiCodec encoders.
+"""
+
+import os
+import hashlib
+import threading
+import soundfile
+import torch
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from safetensors.torch import load_file, save_file
+
+
+def hash_audio(
+    audio_path: Path, model_dir: Path, tokenizer_config: Dict[str, Any] = None
+) -> str:
+    """Hash the decoded PCM of an audio file together with the model directory.
+
+    The hash is computed on the decoded samples rather than on the file bytes,
+    so re-encoded or re-tagged copies of the same recording share an entry.
+
+    Args:
+        audio_path (Path): Path to the reference audio.
+        model_dir (Path): Model directory the tokens were produced with.
+        tokenizer_config (Dict[str, Any], optional): Tokenizer settings that change
+            the tokens, e.g. `BiCodecTokenizer.cache_config`.
+
+    Returns:
+        str: Hex digest used as the cache key.
+    """
+    audio, sr = soundfile.read(audio_path, dtype="float32")
+    if len(audio.shape) > 1:
+        audio = audio[:, 0]
+
+    hasher = hashlib.sha256()
+    hasher.update(str(Path(model_dir).resolve()).encode("utf-8"))
+    if tokenizer_config:
+        hasher.update(repr(sorted(tokenizer_config.items())).encode("utf-8"))
+    hasher.update(str(sr).encode("utf-8"))
+    hasher.update(audio.tobytes())
+    return hasher.hexdigest()
+
+
+class PromptCache:
+    """LRU cache of (global_token_ids, semantic_token_ids) with a byte budget.
+
+    Args:
+        max_bytes (int): Memory budget of the in-memory LRU. Default is 64 MB.
+        cache_dir (Path, optional): Directory of the on-disk store. Entries
+            evicted from memory are still served from disk.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, cache_dir: Path = None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._entries: "OrderedDict[str, Tuple[torch.Tensor, torch.Tensor]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.num_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @staticmethod
+    def _entry_bytes(entry: Tuple[torch.Tensor, torch.Tensor]) -> int:
+        return sum(t.numel() * t.element_size() for t in entry)
+
+    def _disk_path(self, key: str) -> Path:
+        return Path(self.cache_dir) / f"{key}.safetensors"
+
+    def get(self, key: str) -> Optional[Tuple[torch.Tensor, torch.Tensor]]:
+        """Look up an entry in memory, then on disk. Counts hits and misses."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        if self.cache_dir is not None and os.path.exists(self._disk_path(key)):
+            tensors = load_file(self._disk_path(key))
+            entry = (tensors["global_token_ids"], tensors["semantic_token_ids"])
+            with self._lock:
+                self.disk_hits += 1
+                self._insert(key, entry)
+            return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, global_token_ids: torch.Tensor, semantic_token_ids: torch.Tensor):
+        """Store an entry in memory and, if configured, on disk."""
+        entry = (
+            global_token_ids.detach().cpu().contiguous(),
+            semantic_token_ids.detach().cpu().contiguous(),
+        )
+        if self.cache_dir is not None:
+            save_file(
+                {"global_token_ids": entry[0], "semantic_token_ids": entry[1]},
+                self._disk_path(key),
+            )
+        with self._lock:
+            self._insert(key, entry)
+
+    def _insert(self, key: str, entry: Tuple[torch.Tensor, torch.Tensor]):
+        """Insert under the lock and evict least recently used entries over budget."""
+        if key in self._entries:
+            self.num_bytes -= self._entry_bytes(self._entries.pop(key))
+        size = self._entry_bytes(entry)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self.num_bytes += size
+        while self.num_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.num_bytes -= self._entry_bytes(evicted)
+            self.evictions += 1
+
+    def get_or_tokenize(
+        self,
+        audio_path: Path,
+        model_dir: Path,
+        tokenize_fn: Callable[[Path], Tuple[torch.Tensor, torch.Tensor]],
+        tokenizer_config: Dict[str, Any] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Return cached prompt tokens for `audio_path`, tokenizing on a miss.
+
+        Args:
+            audio_path (Path): Path to the reference audio.
+            model_dir (Path): Model directory, part of the cache key.
+            tokenize_fn (Callable): Fallback, usually `BiCodecTokenizer.tokenize`.
+            tokenizer_config (Dict[str, Any], optional): Settings of the tokenizer
+                behind `tokenize_fn`, part of the cache key, so a cache shared by
+                int8, ONNX and float models keeps their tokens apart.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: global tokens; semantic tokens
+        """
+        key = hash_audio(audio_path, model_dir, tokenizer_config)
+        entry = self.get(key)
+        if entry is None:
+            global_token_ids, semantic_token_ids = tokenize_fn(audio_path)
+            self.put(key, global_token_ids, semantic_token_ids)
+            entry = (global_token_ids, semantic_token_ids)
+        return entry
+
+    def clear(self):
+        """Drop all in-memory entries. The on-disk store is left untouched."""
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and memory usage."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.num_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,99 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Dynamic int8 quantization for CPU inference. Weights of the selected
+    nn.Linear layers are stored as int8 and activations are quantized on the
+    fly, which roughly quarters the memory traffic of the matmuls that dominate
+    LLM decoding and wav2vec2 feature extraction.
+"""
+
+import torch
+import torch.nn as nn
+
+from typing import Callable, Set
+
+from sparktts.modules.blocks.vocos import ConvNeXtBlock
+from sparktts.modules.speaker.perceiver_encoder import Attention
+
+
+QUANTIZE_MODES = (None, "int8")
+
+
+def check_quantize(quantize: str, device: torch.device):
+    """Validate a `quantize` option against the device it will run on."""
+    if quantize not in QUANTIZE_MODES:
+        raise ValueError(f"Unsupported quantize mode: {quantize}, expected one of {QUANTIZE_MODES}")
+    if quantize is not None and torch.device(device).type != "cpu":
+        raise ValueError("Dynamic int8 quantization is only supported on CPU")
+
+
+def linear_names(module: nn.Module, predicate: Callable[[str, nn.Module], bool]) -> Set[str]:
+    """Names of the nn.Linear submodules whose (name, parent module) satisfy `predicate`."""
+    names = set()
+    for parent_name, parent in module.named_modules():
+        for child_name, child in parent.named_children():
+            if isinstance(child, nn.Linear) and predicate(child_name, parent):
+                names.add(f"{parent_name}.{child_name}" if parent_name else child_name)
+    return names
+
+
+def quantize_linear(module: nn.Module, names: Set[str] = None) -> nn.Module:
+    """
+    Apply dynamic int8 quantization in place.
+
+    Args:
+        module (nn.Module): Model to quantize.
+        names (Set[str], optional): Submodule names to quantize. All nn.Linear layers if None.
+
+    Returns:
+        nn.Module: the quantized model
+    """
+    qconfig_spec = {nn.Linear} if names is None else names
+    return torch.ao.quantization.quantize_dynamic(
+        module, qconfig_spec=qconfig_spec, dtype=torch.qint8, inplace=True
+    )
+
+
+def quantize_llm(model: nn.Module, include_lm_head: bool = True) -> nn.Module:
+    """Quantize every nn.Linear of the causal LM, optionally keeping `lm_head` in float."""
+    names = linear_names(model, lambda name, parent: True)
+    if not include_lm_head:
+        names.discard("lm_head")
+    return quantize_linear(model, names)
+
+
+def quantize_bicodec(model: nn.Module) -> nn.Module:
+    """Quantize the ConvNeXt pointwise layers and the perceiver attention of BiCodec."""
+    names = linear_names(
+        model,
+        lambda name, parent: (isinstance(parent, ConvNeXtBlock) and name in ("pwconv1", "pwconv2"))
+        or isinstance(parent, Attention),
+    )
+    return quantize_linear(model, names)
+
+
+def weight_bytes(module: nn.Module) -> int:
+    """Bytes held by parameters, buffers and packed int8 weights of `module`."""
+    tensors = {id(t): t for t in module.parameters()}
+    tensors.update({id(t): t for t in module.buffers()})
+    num_bytes = sum(t.numel() * t.element_size() for t in tensors.values())
+    for m in module.modules():
+        if isinstance(m, torch.ao.nn.quantized.dynamic.Linear):
+            weight, bias = m._packed_params._weight_bias()
+            num_bytes += weight.numel() * weight.element_size()
+            if bias is not None:
+                num_bytes += bias.numel() * bias.element_size()
+    return num_bytes
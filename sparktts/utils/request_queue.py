@@ -0,0 +1,257 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Request queue in front of one shared SparkTTS model. A single worker thread
+    owns the model, so callers on any number of threads never run it
+    concurrently. A request that is alone in the queue is streamed chunk by
+    chunk; requests that arrive together are generated as one batch.
+"""
+
+import time
+import queue
+import logging
+import threading
+import numpy as np
+
+from typing import Any, Dict, Iterator, List, Optional
+
+
+_END = object()
+
+
+class SynthesisRequest:
+    """
+    One text to synthesize, and the channel its audio comes back through.
+
+    Iterating the request blocks until audio arrives and yields waveform chunks
+    until the request is complete. Errors of the request are raised from the
+    iteration. Leaving the iteration early cancels the request.
+
+    The worker records `perf_counter` timestamps of the request (`submitted_at`,
+    `started_at`, `first_chunk_at`, `finished_at`) and the size of the batch it
+    was served in.
+
+    Args:
+        text (str): Text to be converted to speech.
+        voice (Dict[str, Any]): Keyword arguments of `SparkTTS.inference` selecting
+            the voice: `prompt_speech_path` / `prompt_text`, `voice_id`, or
+            `gender` / `pitch` / `speed`.
+        stream (bool): Yield audio while it is generated. Requests served in a
+            batch yield their whole waveform as one chunk. Default is True.
+    """
+
+    def __init__(self, text: str, voice: Dict[str, Any], stream: bool = True):
+        self.text = text
+        self.voice = voice
+        self.stream = stream
+        self._chunks = queue.Queue()
+        self._cancelled = threading.Event()
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.batch_size = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stop generating for this request; queued requests are dropped unserved."""
+        self._cancelled.set()
+
+    @property
+    def queue_seconds(self) -> Optional[float]:
+        """Time spent waiting for the worker."""
+        return None if self.started_at is None else self.started_at - self.submitted_at
+
+    @property
+    def inference_seconds(self) -> Optional[float]:
+        """Time from the start of generation to the last audio."""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def start(self, batch_size: int):
+        self.started_at = time.perf_counter()
+        self.batch_size = batch_size
+
+    def put(self, wav: np.ndarray):
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+        self._chunks.put(wav)
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+        self._chunks.put(_END)
+
+    def fail(self, error: BaseException):
+        self._chunks.put(error)
+        self.finish()
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        try:
+            while True:
+                item = self._chunks.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.cancel()
+
+
+class InferenceQueue:
+    """
+    Serializes access to a SparkTTS model through a queue and a worker thread.
+
+    The worker takes the oldest request, waits up to `batch_wait` seconds for more,
+    and serves up to `max_batch_size` requests at once with `inference_batch`. A
+    request served alone is streamed with `inference_stream` (or generated with
+    `inference` if it does not stream). Prompt audio goes through the model's
+    prompt cache, which is keyed by the content of the audio, so re-submitting
+    the same recording under a new path skips its tokenization.
+
+    Args:
+        model (SparkTTS): Model served. It must not be used elsewhere meanwhile.
+        max_batch_size (int): Maximum requests generated together. 1 disables
+            batching. Default is 4.
+        batch_wait (float): Seconds to wait for more requests before starting a
+            batch. Default is 0, which batches only requests already queued.
+        bucket_width (int): `bucket_width` of `inference_batch`. Default is 64.
+        low_latency (bool): `low_latency` of `inference_stream`: streamed audio
+            starts after 16 tokens of right context instead of the exact
+            vocoder's 71 (about 1.4 s). Default is False.
+        chunk_duration (float): `chunk_duration` of `inference_stream`, the audio
+            length of the first streamed chunk in seconds. Default is 1.0.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = 4,
+        batch_wait: float = 0.0,
+        bucket_width: int = 64,
+        low_latency: bool = False,
+        chunk_duration: float = 1.0,
+    ):
+        assert max_batch_size >= 1, "max_batch_size should be at least 1"
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait
+        self.bucket_width = bucket_width
+        self.low_latency = low_latency
+        self.chunk_duration = chunk_duration
+        self._requests = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    @property
+    def pending(self) -> int:
+        """Number of requests waiting for the worker."""
+        return self._requests.qsize()
+
+    def submit(self, text: str, voice: Dict[str, Any], stream: bool = True) -> SynthesisRequest:
+        """Queue a text; iterate the returned request for its audio."""
+        request = SynthesisRequest(text, voice, stream)
+        self._requests.put(request)
+        return request
+
+    def close(self):
+        """Serve the requests already queued, then stop the worker."""
+        self._requests.put(None)
+        self._worker.join()
+
+    def _next_batch(self, request: SynthesisRequest) -> List[SynthesisRequest]:
+        batch = [request]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                # keep the shutdown marker for the main loop
+                self._requests.put(None)
+                break
+            batch.append(item)
+        for request in batch:
+            if request.cancelled:
+                # release anyone still waiting on a dropped request
+                request.finish()
+        return [request for request in batch if not request.cancelled]
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            batch = self._next_batch(request)
+            if len(batch) == 1:
+                self._serve(batch[0])
+            elif len(batch) > 1:
+                self._serve_batch(batch)
+
+    def _serve(self, request: SynthesisRequest):
+        request.start(batch_size=1)
+        try:
+            if request.stream:
+                chunks = self.model.inference_stream(
+                    request.text,
+                    chunk_duration=self.chunk_duration,
+                    low_latency=self.low_latency,
+                    **request.voice,
+                )
+                try:
+                    for wav in chunks:
+                        if request.cancelled:
+                            break
+                        request.put(wav)
+                finally:
+                    # stops the decoding thread of a cancelled stream
+                    chunks.close()
+            else:
+                request.put(np.asarray(self.model.inference(request.text, **request.voice)))
+        except Exception as e:
+            logging.exception("Synthesis failed")
+            request.fail(e)
+            return
+        request.finish()
+
+    def _serve_batch(self, batch: List[SynthesisRequest]):
+        logging.info(f"Generating a batch of {len(batch)} requests")
+        for request in batch:
+            request.start(batch_size=len(batch))
+        try:
+            wavs = self.model.inference_batch(
+                [request.text for request in batch],
+                [request.voice for request in batch],
+                batch_size=len(batch),
+                bucket_width=self.bucket_width,
+            )
+        except Exception:
+            # one bad request (e.g. an unreadable upload) must not fail the others
+            logging.exception("Batch failed, serving its requests one by one")
+            for request in batch:
+                self._serve(request)
+            return
+        for request, wav in zip(batch, wavs):
+            if wav is None:
+                request.fail(RuntimeError("No speech was generated for the text"))
+                continue
+            request.put(wav)
+            request.finish()
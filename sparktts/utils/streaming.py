@@ -0,0 +1,75 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Helpers for in-process streaming synthesis: a streamer that hands generated
+    token ids from `model.generate` to a consumer thread, and a stopping
+    criterion for cancelled streams.
+"""
+
+import queue
+import threading
+import torch
+
+from typing import Iterator
+from transformers.generation.streamers import BaseStreamer
+from transformers.generation.stopping_criteria import StoppingCriteria
+
+
+class TokenIdStreamer(BaseStreamer):
+    """Streamer that forwards newly generated token ids through a queue.
+
+    `generate` calls `put` once with the prompt and then once per decode step;
+    the prompt is skipped. Errors raised by the producer can be forwarded with
+    `put_error` and are re-raised in the consumer.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.next_tokens_are_prompt = True
+
+    def put(self, value: torch.Tensor):
+        if self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            return
+        self.queue.put(value.reshape(-1).tolist())
+
+    def put_error(self, error: BaseException):
+        self.queue.put(error)
+
+    def end(self):
+        self.queue.put(None)
+
+    def __iter__(self) -> Iterator[int]:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield from item
+
+
+class StopFlagCriteria(StoppingCriteria):
+    """Stops generation once `stop_event` is set, e.g. when a stream is closed."""
+
+    def __init__(self, stop_event: threading.Event):
+        self.stop_event = stop_event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs):
+        return torch.full(
+            (input_ids.shape[0],), self.stop_event.is_set(), dtype=torch.bool, device=input_ids.device
+        )
+
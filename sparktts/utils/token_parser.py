@@ -1,3 +1,9 @@
+import re
+import torch
+import numpy as np
+
+from typing import List
+
 TASK_TOKEN_MAP = {
     "vc": "<|task_vc|>",
     "tts": "<|task_tts|>",
@@ -154,6 +160,168 @@ class TokenParser:
         return f"<|emotion_{emo_id}|>"
 
 
+class AudioTokenMap:
+    """Map LLM vocabulary ids to BiCodec semantic/global indices.
+
+    The lookup tables are built once from the tokenizer vocabulary. Mapping
+    generated ids is then a single gather plus a mask of non-audio ids, with
+    no text decoding or regex over the output.
+
+    Args:
+        tokenizer: HuggingFace tokenizer of the LLM.
+        vocab_size (int, optional): Size of the LLM output vocabulary, which may
+            be larger than the tokenizer's. Ids outside the tables map to -1.
+    """
+
+    def __init__(self, tokenizer, vocab_size: int = None):
+        vocab = tokenizer.get_vocab()
+        size = max(vocab.values()) + 1
+        if vocab_size is not None:
+            size = max(size, vocab_size)
+
+        self.semantic_lut = np.full(size, -1, dtype=np.int64)
+        self.global_lut = np.full(size, -1, dtype=np.int64)
+        for token, token_id in vocab.items():
+            match = re.fullmatch(r"<\|bicodec_(semantic|global)_(\d+)\|>", token)
+            if match is None:
+                continue
+            lut = self.semantic_lut if match.group(1) == "semantic" else self.global_lut
+            lut[token_id] = int(match.group(2))
+        self._torch_luts = {}
+
+        # inverse tables: BiCodec index -> vocab id
+        self.semantic_vocab_ids = self._invert(self.semantic_lut)
+        self.global_vocab_ids = self._invert(self.global_lut)
+
+    @staticmethod
+    def _invert(lut: np.ndarray) -> np.ndarray:
+        token_ids = np.nonzero(lut >= 0)[0]
+        inverse = np.full(lut.max() + 1 if len(token_ids) > 0 else 0, -1, dtype=np.int64)
+        inverse[lut[token_ids]] = token_ids
+        return inverse
+
+    def _lookup(self, lut: np.ndarray, ids):
+        if isinstance(ids, torch.Tensor):
+            key = (id(lut), ids.device)
+            if key not in self._torch_luts:
+                self._torch_luts[key] = torch.from_numpy(lut).to(ids.device)
+            lut = self._torch_luts[key]
+            ids = ids.long()
+            values = lut[ids.clamp(0, len(lut) - 1)]
+            values = values.masked_fill((ids < 0) | (ids >= len(lut)), -1)
+            return values[values >= 0]
+        ids = np.asarray(ids, dtype=np.int64)
+        values = lut[np.clip(ids, 0, len(lut) - 1)]
+        values[(ids < 0) | (ids >= len(lut))] = -1
+        return values[values >= 0]
+
+    def semantic_ids(self, ids):
+        """Return the semantic indices of the audio tokens in `ids`, in order."""
+        return self._lookup(self.semantic_lut, ids)
+
+    def global_ids(self, ids):
+        """Return the global indices of the audio tokens in `ids`, in order."""
+        return self._lookup(self.global_lut, ids)
+
+    def semantic_token_ids(self, indices) -> np.ndarray:
+        """Return the vocab ids of BiCodec semantic indices."""
+        return self.semantic_vocab_ids[np.asarray(indices, dtype=np.int64).reshape(-1)]
+
+    def global_token_ids(self, indices) -> np.ndarray:
+        """Return the vocab ids of BiCodec global indices."""
+        return self.global_vocab_ids[np.asarray(indices, dtype=np.int64).reshape(-1)]
+
+
+class PromptBuilder:
+    """Assemble LLM prompts directly as token ids.
+
+    Task and boundary tokens are converted to ids once, audio tokens come from
+    the `AudioTokenMap` inverse tables, and only the content text goes through
+    the tokenizer. The result matches tokenizing the equivalent prompt string.
+
+    Args:
+        tokenizer: HuggingFace tokenizer of the LLM.
+        token_map (AudioTokenMap, optional): Built from `tokenizer` if not given.
+    """
+
+    def __init__(self, tokenizer, token_map: AudioTokenMap = None):
+        self.tokenizer = tokenizer
+        self.token_map = token_map if token_map is not None else AudioTokenMap(tokenizer)
+        self._ids = {}
+
+    def token_id(self, token: str) -> int:
+        """Return the id of a single special token, cached after the first lookup."""
+        if token not in self._ids:
+            token_id = self.tokenizer.convert_tokens_to_ids(token)
+            assert token_id is not None and token_id != self.tokenizer.unk_token_id, (
+                f"{token} is not in the vocabulary"
+            )
+            self._ids[token] = token_id
+        return self._ids[token]
+
+    def _segment(self, *tokens: str) -> List[int]:
+        return [self.token_id(token) for token in tokens]
+
+    def text_ids(self, text: str) -> List[int]:
+        """Tokenize content text."""
+        return self.tokenizer(text, add_special_tokens=False).input_ids
+
+    def shared_prefix_length(self, prompt_text: str = None) -> int:
+        """Number of leading ids shared by every `tts_prompt` with this transcript:
+        the task and content-start tokens and the transcript, minus its last token,
+        which may merge with the start of the text."""
+        if not prompt_text:
+            return 2
+        return 2 + max(0, len(self.text_ids(prompt_text)) - 1)
+
+    def tts_prompt(
+        self,
+        text: str,
+        global_token_ids,
+        semantic_token_ids=None,
+        prompt_text: str = None,
+    ) -> torch.Tensor:
+        """Prompt ids for voice cloning, see `SparkTTS.process_prompt`.
+
+        Returns:
+            torch.Tensor: input ids. shape: (1, seq_len)
+        """
+        content = text if prompt_text is None else prompt_text + text
+        segments = [
+            self._segment(TASK_TOKEN_MAP["tts"], "<|start_content|>"),
+            self.text_ids(content),
+            self._segment("<|end_content|>", "<|start_global_token|>"),
+            self.token_map.global_token_ids(global_token_ids).tolist(),
+            self._segment("<|end_global_token|>"),
+        ]
+        if prompt_text is not None:
+            segments += [
+                self._segment("<|start_semantic_token|>"),
+                self.token_map.semantic_token_ids(semantic_token_ids).tolist(),
+            ]
+        return torch.tensor([sum(segments, [])], dtype=torch.long)
+
+    def control_prompt(self, gender: str, pitch: str, speed: str, text: str) -> torch.Tensor:
+        """Prompt ids for voice creation, see `SparkTTS.process_prompt_control`.
+
+        Returns:
+            torch.Tensor: input ids. shape: (1, seq_len)
+        """
+        segments = [
+            self._segment(TASK_TOKEN_MAP["controllable_tts"], "<|start_content|>"),
+            self.text_ids(text),
+            self._segment(
+                "<|end_content|>",
+                "<|start_style_label|>",
+                TokenParser.gender(gender),
+                TokenParser.mel_level(pitch),
+                TokenParser.speed_level(speed),
+                "<|end_style_label|>",
+            ),
+        ]
+        return torch.tensor([sum(segments, [])], dtype=torch.long)
+
+
 # test
 if __name__ == "__main__":
     from transformers import AutoTokenizer
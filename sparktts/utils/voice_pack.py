@@ -0,0 +1,142 @@
+# Copyright (c) 2025 SparkAudio
+#               2025 Xinsheng Wang (w.xinshawn@gmail.com)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Description:
+    Precomputed voice packs. A pack is a single safetensors file holding the
+    BiCodec prompt tokens of a whole voice catalog:
+
+        global_tokens      uint16 (num_voices, global_len)
+        semantic_tokens    uint16 (total_semantic_len,)
+        semantic_offsets   int64  (num_voices + 1,)
+
+    plus a JSON index of voice ids and prompt transcripts in the metadata.
+    The file is memory-mapped on load, so resolving a voice is a dict lookup
+    and a slice, with no audio decoding or wav2vec2 at request time.
+"""
+
+import json
+import torch
+import numpy as np
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from safetensors.numpy import save_file
+
+
+def write_voice_pack(
+    pack_path: Path,
+    voice_ids: List[str],
+    global_tokens: List[np.ndarray],
+    semantic_tokens: List[np.ndarray],
+    transcripts: List[Optional[str]] = None,
+) -> None:
+    """Write prompt tokens of many voices into one pack file.
+
+    Args:
+        pack_path (Path): Output path of the pack.
+        voice_ids (List[str]): Unique id of each voice.
+        global_tokens (List[np.ndarray]): Global token ids of each voice.
+        semantic_tokens (List[np.ndarray]): Semantic token ids of each voice.
+        transcripts (List[str], optional): Transcript of each prompt audio.
+    """
+    assert len(voice_ids) == len(set(voice_ids)), "voice ids must be unique"
+    assert len(voice_ids) == len(global_tokens) == len(semantic_tokens)
+    if transcripts is None:
+        transcripts = [None] * len(voice_ids)
+
+    semantic_lengths = [int(np.asarray(s).size) for s in semantic_tokens]
+    offsets = np.zeros(len(voice_ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(semantic_lengths)
+
+    tensors = {
+        "global_tokens": np.stack(
+            [np.asarray(g).reshape(-1) for g in global_tokens]
+        ).astype(np.uint16),
+        "semantic_tokens": np.concatenate(
+            [np.asarray(s).reshape(-1) for s in semantic_tokens]
+        ).astype(np.uint16),
+        "semantic_offsets": offsets,
+    }
+    metadata = {
+        "voice_ids": json.dumps(list(voice_ids), ensure_ascii=False),
+        "transcripts": json.dumps(list(transcripts), ensure_ascii=False),
+    }
+    save_file(tensors, str(pack_path), metadata=metadata)
+
+
+class VoicePack:
+    """Memory-mapped reader of a voice pack.
+
+    Args:
+        pack_path (Path): Path to a pack written by `write_voice_pack`.
+    """
+
+    def __init__(self, pack_path: Path):
+        self.pack_path = pack_path
+
+        # safetensors layout: u64 header size, JSON header, then raw tensor data
+        with open(pack_path, "rb") as f:
+            header_len = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            header = json.loads(f.read(header_len))
+        metadata = header.pop("__metadata__")
+        data_offset = 8 + header_len
+
+        def _memmap(name: str, dtype) -> np.ndarray:
+            begin, end = header[name]["data_offsets"]
+            return np.memmap(
+                pack_path,
+                dtype=dtype,
+                mode="r",
+                offset=data_offset + begin,
+                shape=tuple(header[name]["shape"]),
+            )
+
+        self.global_tokens = _memmap("global_tokens", np.uint16)
+        self.semantic_tokens = _memmap("semantic_tokens", np.uint16)
+        self.semantic_offsets = np.array(_memmap("semantic_offsets", np.int64))
+
+        self.voice_ids = json.loads(metadata["voice_ids"])
+        self.transcripts = json.loads(metadata["transcripts"])
+        self.index: Dict[str, int] = {v: i for i, v in enumerate(self.voice_ids)}
+
+    def __len__(self) -> int:
+        return len(self.voice_ids)
+
+    def __contains__(self, voice_id: str) -> bool:
+        return voice_id in self.index
+
+    def transcript(self, voice_id: str) -> Optional[str]:
+        """Return the prompt transcript of a voice, if any."""
+        return self.transcripts[self.index[voice_id]]
+
+    def get(self, voice_id: str) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Resolve a voice to its prompt tokens.
+
+        Args:
+            voice_id (str): Id of the voice.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: global tokens (1, 1, global_len);
+                semantic tokens (1, semantic_len)
+        """
+        if voice_id not in self.index:
+            raise KeyError(f"Voice '{voice_id}' not found in {self.pack_path}")
+        i = self.index[voice_id]
+        start, end = self.semantic_offsets[i], self.semantic_offsets[i + 1]
+        global_token_ids = torch.from_numpy(self.global_tokens[i].astype(np.int64))
+        semantic_token_ids = torch.from_numpy(
+            np.asarray(self.semantic_tokens[start:end]).astype(np.int64)
+        )
+        return global_token_ids.view(1, 1, -1), semantic_token_ids.unsqueeze(0)
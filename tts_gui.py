@@ -1,21 +1,22 @@
 import sys
 import os
 import csv
-import tempfile
-import subprocess
 import datetime
 import torch
 import re
-import shutil
 import time
+import queue
+import itertools
+import numpy as np
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QLineEdit, QTextEdit, QScrollArea, QGridLayout,
                             QTabWidget, QFrame, QStackedWidget, QComboBox, QPlainTextEdit,
-                            QFileDialog,QMenuBar,QDialog, QSplitter)
-from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal, QEvent, QUrl
+                            QFileDialog,QMenuBar,QDialog, QSplitter, QTableWidget,
+                            QTableWidgetItem, QHeaderView, QAbstractItemView)
+from PyQt5.QtCore import Qt, QSize, QThread, QObject, QTimer, pyqtSignal, QEvent, QUrl
 from PyQt5.QtGui import QPixmap, QIcon, QPainter, QTextCursor, QCursor
 from PyQt5.QtSvg import QSvgRenderer
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
+from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent, QAudioOutput, QAudioFormat
 from qfluentwidgets import (PushButton, TabBar, SearchLineEdit, Slider, 
                            ToggleButton, CardWidget, ToolButton, InfoBar,
                            FluentIcon, ComboBox,Dialog,MessageBox)
@@ -74,8 +75,22 @@ sys.excepthook = excepthook
 
 # Import SparkTTS
 from cli.SparkTTS import SparkTTS
+from sparktts.utils.long_text import CrossfadeStitcher, split_text
 import soundfile as sf
 
+# 长文本分段合成参数
+CHUNK_MAX_CHARS = 150  # 每段最多字符数（按句切分）
+CROSSFADE_MS = 20  # 段与段之间的交叉淡化时长
+
+# 合成队列参数
+MAX_BATCH_SIZE = 8  # 同一音色的短文本任务合并为一次批量合成的最大条数
+JOB_PRIORITIES = {"高": 1, "普通": 0, "低": -1}  # 数值越大越先合成
+JOB_QUEUED = "排队中"
+JOB_RUNNING = "合成中"
+JOB_DONE = "已完成"
+JOB_FAILED = "失败"
+JOB_CANCELLED = "已取消"
+
 # 音色信息类
 class VoiceInfo:
     def __init__(self, voice_id, name, scene, voice_type, language, sample_rate, emotion):
@@ -281,147 +296,224 @@ class LogRedirector:
             self.text_widget.appendPlainText(self.buffer)
             self.buffer = ""
 
-# 创建一个线程类来运行语音合成任务
-class SynthesisThread(QThread):
-    synthesis_complete = pyqtSignal(bool, str)  # 信号：合成完成(成功/失败, 输出文件路径)
-    progress_update = pyqtSignal(str)  # 信号：进度更新
-
-    def __init__(self, text, prompt_text, prompt_speech_path, output_path, model_dir, device):
-        super().__init__()
+# 合成任务参数
+class SynthesisJob:
+    def __init__(self, job_id, text, prompt_text, prompt_speech_path, output_path, priority=0, max_chunk_chars=CHUNK_MAX_CHARS):
+        self.job_id = job_id
         self.text = text
         self.prompt_text = prompt_text
         self.prompt_speech_path = prompt_speech_path
         self.output_path = output_path
-        self.model_dir = model_dir  # 恢复模型目录参数 
-        self.device = device        # 恢复设备参数
-        # 不再接收预加载的模型
+        self.priority = priority
+        self.max_chunk_chars = max_chunk_chars
+        self.cancelled = False  # 由界面线程设置，工作线程在开始前和段与段之间检查
+
+    @property
+    def voice_key(self):
+        """音色相同的任务共享参考音频的 token，可合并为一次批量合成"""
+        return (self.prompt_speech_path, self.prompt_text)
+
+    @property
+    def is_short(self):
+        """不需要分段的短文本，可与其他任务合并批量合成"""
+        return len(split_text(self.text, self.max_chunk_chars)) <= 1
+
+# 常驻模型工作线程：模型只加载一次（可在启动时后台预加载），通过优先级队列接收合成任务，
+# 并把排队中音色相同的短文本任务合并为一次批量合成
+class ModelWorker(QThread):
+    synthesis_complete = pyqtSignal(bool, str)  # 信号：合成完成(成功/失败, 输出文件路径)
+    progress_update = pyqtSignal(str)  # 信号：进度更新
+    model_ready = pyqtSignal(bool)  # 信号：模型加载完成(成功/失败)
+    chunk_ready = pyqtSignal(object)  # 信号：一段已拼接好的音频(np.ndarray)，用于边合成边播放
+    job_status = pyqtSignal(int, str)  # 信号：任务状态变化(任务编号, 状态)
+
+    def __init__(self, model_dir, device, preload=True, max_batch_size=MAX_BATCH_SIZE):
+        super().__init__()
+        self.model_dir = model_dir
+        self.device = device
+        self.preload = preload  # 线程启动后立即加载模型，而不是等到第一个任务
+        self.max_batch_size = max_batch_size
+        self.tts_model = None
+        # 元素为 (-优先级, 提交序号, 任务)：优先级高的先出队，同优先级按提交顺序
+        self.jobs = queue.PriorityQueue()
+        self.sequence = itertools.count()
+
+    def submit(self, job):
+        """提交合成任务，线程未启动时自动启动"""
+        self.jobs.put((-job.priority, next(self.sequence), job))
+        self.job_status.emit(job.job_id, JOB_QUEUED)
+        if not self.isRunning():
+            self.start()
+
+    def cancel(self, job):
+        """取消任务：排队中的任务不再合成，正在分段合成的任务在当前段结束后停止"""
+        job.cancelled = True
+
+    def stop(self):
+        """丢弃排队中的任务，等待当前任务结束后退出线程"""
+        if not self.isRunning():
+            return
+        try:
+            while True:
+                self.jobs.get_nowait()
+        except queue.Empty:
+            pass
+        # 停止标记排在所有任务之前
+        self.jobs.put((float("-inf"), -1, None))
+        self.wait()
 
     def run(self):
-        # Redirect stdout to capture progress
+        if self.preload:
+            self._ensure_model()
+        while True:
+            job = self.jobs.get()[-1]
+            if job is None:
+                break
+            if job.cancelled:
+                self.job_status.emit(job.job_id, JOB_CANCELLED)
+                continue
+            batch = self._coalesce(job)
+            if len(batch) > 1:
+                self._synthesize_batch(batch)
+            else:
+                self._synthesize(job)
+
+    def _coalesce(self, job):
+        """从队列中取出与 job 音色相同的短文本任务（按优先级），与 job 组成一批"""
+        if self.max_batch_size <= 1 or not job.is_short:
+            return [job]
+        batch, others = [job], []
+        try:
+            while len(batch) < self.max_batch_size:
+                entry = self.jobs.get_nowait()
+                queued = entry[-1]
+                if queued is not None and queued.cancelled:
+                    self.job_status.emit(queued.job_id, JOB_CANCELLED)
+                elif queued is not None and queued.voice_key == job.voice_key and queued.is_short:
+                    batch.append(queued)
+                else:
+                    others.append(entry)
+        except queue.Empty:
+            pass
+        # 其余任务放回队列，原有的优先级和顺序不变
+        for entry in others:
+            self.jobs.put(entry)
+        return batch
+
+    def _ensure_model(self):
+        """加载模型（仅第一次），返回模型是否可用"""
+        if self.tts_model is not None:
+            return True
         original_stdout = sys.stdout
         sys.stdout = self
-        
+        try:
+            self.progress_update.emit(f"正在加载 Spark-TTS 模型 (目录: {self.model_dir}, 设备: {self.device})...")
+            model_load_start = time.time()
+            self.tts_model = SparkTTS(model_dir=self.model_dir, device=self.device)
+            model_load_duration = time.time() - model_load_start
+            self.progress_update.emit(f"模型加载完成，耗时 {model_load_duration:.2f} 秒，后续合成将直接复用该模型")
+        except Exception as e:
+            self.progress_update.emit(f"模型加载失败: {e}\n{traceback.format_exc()}")
+        finally:
+            sys.stdout = original_stdout
+        self.model_ready.emit(self.tts_model is not None)
+        return self.tts_model is not None
+
+    def _clean_text(self, text):
+        """特别处理可能会导致语义令牌问题的情况：移除开头的标题或编号（单任务和批量任务共用）"""
+        if text.startswith("每日资讯") or re.search(r'^\d+[、.．]', text):
+            self.progress_update.emit("检测到可能导致问题的文本格式（标题或编号）")
+            # 尝试移除可能导致问题的格式
+            cleaned_text = re.sub(r'^(每日资讯.*?\n|^\d+[、.．])', '', text)
+            self.progress_update.emit(f"已尝试清理文本格式，处理前: {len(text)} 字符，处理后: {len(cleaned_text)} 字符")
+            return cleaned_text
+        return text
+
+    def _synthesize(self, job):
         success = False
         start_time = time.time() # Record start time
         synthesis_duration = 0
         
         # 记录更详细的输入信息
         self.progress_update.emit("---合成任务开始---")
-        self.progress_update.emit(f"文本长度: {len(self.text)} 字符")
-        self.progress_update.emit(f"参考文本长度: {len(self.prompt_text)} 字符")
-        self.progress_update.emit(f"参考音频路径: {self.prompt_speech_path}")
-        self.progress_update.emit(f"输出路径: {self.output_path}")
+        self.progress_update.emit(f"文本长度: {len(job.text)} 字符")
+        self.progress_update.emit(f"参考文本长度: {len(job.prompt_text)} 字符")
+        self.progress_update.emit(f"参考音频路径: {job.prompt_speech_path}")
+        self.progress_update.emit(f"输出路径: {job.output_path}")
+        self.job_status.emit(job.job_id, JOB_RUNNING)
         
+        if not self._ensure_model():
+            self.progress_update.emit("---合成任务结束---")
+            self.job_status.emit(job.job_id, JOB_FAILED)
+            self.synthesis_complete.emit(False, job.output_path)
+            return
+
+        # Redirect stdout to capture progress
+        original_stdout = sys.stdout
+        sys.stdout = self
         try:
-            # 每次创建新的模型实例
-            self.progress_update.emit(f"正在加载 Spark-TTS 模型 (目录: {self.model_dir}, 设备: {self.device})...")
-            model_load_start = time.time()
-            tts_model = SparkTTS(model_dir=self.model_dir, device=self.device)
-            model_load_end = time.time()
-            model_load_duration = model_load_end - model_load_start
-            self.progress_update.emit(f"模型加载完成，耗时 {model_load_duration:.2f} 秒")
-            
             # 输出更多诊断信息
-            text_length = len(self.text) if self.text else 0
-            self.progress_update.emit(f"准备合成文本: 【{self.text[:100]}...】")
+            text = job.text
+            text_length = len(text) if text else 0
+            self.progress_update.emit(f"准备合成文本: 【{text[:100]}...】")
             if text_length < 30:
                 self.progress_update.emit(f"警告: 文本长度较短 ({text_length} 字符)，可能会导致合成失败")
             
             self.progress_update.emit("开始合成...")
             
-            # 特别处理可能会导致语义令牌问题的情况
-            if self.text.startswith("每日资讯") or re.search(r'^\d+[、.．]', self.text):
-                self.progress_update.emit("检测到可能导致问题的文本格式（标题或编号）")
-                # 尝试移除可能导致问题的格式
-                cleaned_text = re.sub(r'^(每日资讯.*?\n|^\d+[、.．])', '', self.text)
-                self.progress_update.emit(f"已尝试清理文本格式，处理前: {len(self.text)} 字符，处理后: {len(cleaned_text)} 字符")
-                self.text = cleaned_text
-                
+            text = self._clean_text(text)
+
             inference_start_time = time.time() # Start timing inference
-            # 使用新创建的模型实例
-            try:
-                self.progress_update.emit(f"开始推理...参考音频: {os.path.basename(self.prompt_speech_path)}")
-                wav = tts_model.inference(
-                    text=self.text,
-                    prompt_text=self.prompt_text,
-                    prompt_speech_path=self.prompt_speech_path
-                )
-                inference_end_time = time.time() # End timing inference
-                synthesis_duration = inference_end_time - inference_start_time
-                
-                if wav is not None:
-                    write_start_time = time.time()
-                    sf.write(self.output_path, wav, 16000)
-                    write_end_time = time.time()
-                    write_duration = write_end_time - write_start_time
-                    success = True
-                    # Include duration in the success message
-                    self.progress_update.emit(f"合成成功！耗时: {synthesis_duration:.2f} 秒 (写入文件: {write_duration:.2f} 秒)。音频已保存到: {self.output_path}")
-                else:
-                    self.progress_update.emit("合成失败：模型未能生成有效音频。")
-            except ValueError as ve:
-                # 特别处理"Semantic tokens are empty"错误
-                if "Semantic tokens are empty" in str(ve):
-                    error_msg = f"【关键错误】语义令牌为空，这通常由于以下原因导致:\n" 
-                    error_msg += f"1. 文本太短或格式不适合合成 (当前长度: {text_length})\n"
-                    error_msg += f"2. 参考音频与文本不匹配\n"
-                    error_msg += f"3. 文本开头有数字编号、特殊符号等\n"
-                    error_msg += f"合成文本内容: '{self.text[:100]}{'...' if len(self.text)>100 else ''}'"
-                    self.progress_update.emit(error_msg)
-                    
-                    # 尝试更强的干预措施 - 修改处理方式，不再截断文本
+            # 按句分段，逐段合成：每段合成后立即拼接（交叉淡化）、写入文件并送去播放，
+            # 播放第 N 段时继续合成第 N+1 段
+            chunks = split_text(text, job.max_chunk_chars)
+            self.progress_update.emit(f"文本分为 {len(chunks)} 段，边合成边播放")
+            sample_rate = self.tts_model.sample_rate
+            stitcher = CrossfadeStitcher(sample_rate * CROSSFADE_MS // 1000)
+            failed_chunks = 0
+            with sf.SoundFile(job.output_path, 'w', samplerate=sample_rate, channels=1) as output_file:
+                for index, chunk in enumerate(chunks):
+                    if job.cancelled:
+                        self.progress_update.emit(f"任务已取消，停止于第 {index + 1}/{len(chunks)} 段")
+                        break
+                    chunk_start_time = time.time()
                     try:
-                        # 简化文本，但保留所有内容
-                        simple_text = self.text.replace("\n", " ") # 将换行替换为空格
-                        simple_text = re.sub(r'\d+[、.．]', '', simple_text) # 移除数字标记
-                        simple_text = re.sub(r'[，。？！；,.!?;]', '，', simple_text) # 统一标点为逗号，保持句子结构
-                        
-                        # 确保文本长度合适，但不截断
-                        if len(simple_text) < 30:
-                            # 如果太短，重复文本
-                            simple_text = simple_text * 2
-                            
-                        self.progress_update.emit(f"尝试使用简化后的完整文本重新合成 (长度: {len(simple_text)} 字符)")
-                        
-                        # 再次尝试合成
-                        wav = tts_model.inference(
-                            text=simple_text,
-                            prompt_text=self.prompt_text,
-                            prompt_speech_path=self.prompt_speech_path
+                        wav = self.tts_model.inference(
+                            text=chunk,
+                            prompt_text=job.prompt_text,
+                            prompt_speech_path=job.prompt_speech_path
                         )
-                        
-                        if wav is not None:
-                            sf.write(self.output_path, wav, 16000)
-                            success = True
-                            self.progress_update.emit(f"使用简化文本合成成功！音频已保存到: {self.output_path}")
-                        else:
-                            self.progress_update.emit("使用简化文本合成仍然失败。")
-                            
-                            # 第三次尝试：使用更简单的文本，但保持一定长度
-                            self.progress_update.emit("尝试最后的方法：使用更简化的文本...")
-                            final_attempt_text = "这是一段测试语音，用于测试语音合成系统。" + simple_text[:100]
-                            wav = tts_model.inference(
-                                text=final_attempt_text,
-                                prompt_text=self.prompt_text,
-                                prompt_speech_path=self.prompt_speech_path
-                            )
-                            
-                            if wav is not None:
-                                sf.write(self.output_path, wav, 16000)
-                                success = True
-                                self.progress_update.emit(f"最终尝试合成成功！但音频可能不完整，请检查结果。")
-                            else:
-                                self.progress_update.emit("所有尝试均失败，无法完成合成。")
-                    except Exception as retry_e:
-                        self.progress_update.emit(f"重试合成时发生错误: {retry_e}")
-                else:
-                    # 其他ValueError错误
-                    error_msg = f"合成值错误: {ve}\n{traceback.format_exc()}"
-                    self.progress_update.emit(error_msg)
-            except Exception as e:
-                # 处理其他异常
-                error_msg = f"合成时发生错误: {e}\n{traceback.format_exc()}"
-                self.progress_update.emit(error_msg)
+                    except Exception as e:
+                        # 单段失败不影响其余段落
+                        self.progress_update.emit(f"第 {index + 1} 段合成时发生错误: {e}\n{traceback.format_exc()}")
+                        wav = None
+                    if wav is None or len(wav) == 0:
+                        failed_chunks += 1
+                        self.progress_update.emit(f"第 {index + 1}/{len(chunks)} 段未生成有效音频，已跳过")
+                        continue
+                    ready = stitcher.push(wav)
+                    output_file.write(ready)
+                    self.chunk_ready.emit(ready)
+                    self.progress_update.emit(
+                        f"第 {index + 1}/{len(chunks)} 段完成，耗时 {time.time() - chunk_start_time:.2f} 秒，"
+                        f"音频 {len(wav) / sample_rate:.2f} 秒"
+                    )
+                tail = stitcher.flush()
+                output_file.write(tail)
+                self.chunk_ready.emit(tail)
+            synthesis_duration = time.time() - inference_start_time
+
+            if job.cancelled:
+                # 已取消的任务不保留未完成的音频
+                os.remove(job.output_path)
+            elif stitcher.num_samples > 0:
+                success = True
+                self.progress_update.emit(
+                    f"合成成功！耗时: {synthesis_duration:.2f} 秒，音频时长 {stitcher.num_samples / sample_rate:.2f} 秒"
+                    f"{f'（{failed_chunks} 段失败）' if failed_chunks else ''}。音频已保存到: {job.output_path}"
+                )
+            else:
+                self.progress_update.emit("合成失败：模型未能生成有效音频。")
 
         except Exception as e:
             # Make sure to log the full traceback in case of inference errors
@@ -429,12 +521,60 @@ class SynthesisThread(QThread):
             self.progress_update.emit(error_msg)
             print(error_msg) # Also print to console/log
         finally:
-            end_time = time.time() # Record end time for the whole process
+            sys.stdout = original_stdout # Restore stdout
+            end_time = time.time() # Record end time for the whole job
             total_duration = end_time - start_time
-            self.progress_update.emit(f"线程总耗时: {total_duration:.2f} 秒") # Log total thread time
+            self.progress_update.emit(f"任务总耗时: {total_duration:.2f} 秒") # Log total job time
             self.progress_update.emit("---合成任务结束---")
-            sys.stdout = original_stdout # Restore stdout
-            self.synthesis_complete.emit(success, self.output_path)
+            if job.cancelled and not success:
+                self.job_status.emit(job.job_id, JOB_CANCELLED)
+            else:
+                self.job_status.emit(job.job_id, JOB_DONE if success else JOB_FAILED)
+                self.synthesis_complete.emit(success, job.output_path)
+
+    def _synthesize_batch(self, batch):
+        """音色相同的短文本任务：一次 inference_batch 批量生成，参考音频只需编码一次；
+        生成后按任务顺序逐个送去播放，与单任务的边合成边播放一致"""
+        start_time = time.time()
+        self.progress_update.emit(f"---批量合成开始：{len(batch)} 个任务，参考音频: {batch[0].prompt_speech_path}---")
+        for job in batch:
+            self.job_status.emit(job.job_id, JOB_RUNNING)
+        if not self._ensure_model():
+            wavs = [None] * len(batch)
+        else:
+            original_stdout = sys.stdout
+            sys.stdout = self
+            try:
+                # 参考音频的 token 由模型的 prompt cache 缓存，同一音色只编码一次
+                wavs = self.tts_model.inference_batch(
+                    [self._clean_text(job.text) for job in batch],
+                    {"prompt_speech_path": batch[0].prompt_speech_path, "prompt_text": batch[0].prompt_text},
+                    batch_size=len(batch),
+                )
+            except Exception as e:
+                self.progress_update.emit(f"批量合成时发生错误: {e}\n{traceback.format_exc()}")
+                wavs = [None] * len(batch)
+            finally:
+                sys.stdout = original_stdout
+
+        for job, wav in zip(batch, wavs):
+            if job.cancelled:
+                self.job_status.emit(job.job_id, JOB_CANCELLED)
+                continue
+            success = wav is not None and len(wav) > 0
+            if success:
+                try:
+                    sf.write(job.output_path, wav, samplerate=self.tts_model.sample_rate)
+                    self.chunk_ready.emit(wav)
+                    self.progress_update.emit(f"任务 {job.job_id} 完成，音频已保存到: {job.output_path}")
+                except Exception as e:
+                    self.progress_update.emit(f"保存任务 {job.job_id} 的音频时出错: {e}")
+                    success = False
+            else:
+                self.progress_update.emit(f"任务 {job.job_id} 未生成有效音频")
+            self.job_status.emit(job.job_id, JOB_DONE if success else JOB_FAILED)
+            self.synthesis_complete.emit(success, job.output_path)
+        self.progress_update.emit(f"---批量合成结束，耗时: {time.time() - start_time:.2f} 秒---")
 
     def write(self, text):
         # 捕获print输出并发送为进度更新
@@ -445,6 +585,58 @@ class SynthesisThread(QThread):
         # 必须有的方法，用于io操作
         pass
 
+# 边合成边播放：把合成好的音频块推入 QAudioOutput
+class StreamingAudioPlayer(QObject):
+    def __init__(self, sample_rate=16000, parent=None):
+        super().__init__(parent)
+        audio_format = QAudioFormat()
+        audio_format.setSampleRate(sample_rate)
+        audio_format.setChannelCount(1)
+        audio_format.setSampleSize(16)
+        audio_format.setCodec("audio/pcm")
+        audio_format.setByteOrder(QAudioFormat.LittleEndian)
+        audio_format.setSampleType(QAudioFormat.SignedInt)
+        self.output = QAudioOutput(audio_format, self)
+        self.device = None  # QAudioOutput 的推送设备
+        self.pending = bytearray()  # 尚未写入设备的 PCM 数据
+        # 定时把缓冲的数据写入设备，写入量以设备空闲空间为准
+        self.timer = QTimer(self)
+        self.timer.setInterval(20)
+        self.timer.timeout.connect(self._feed)
+
+    @property
+    def is_active(self):
+        return self.device is not None
+
+    def start(self):
+        """开始新的一次流式播放"""
+        self.stop()
+        self.device = self.output.start()
+        self.timer.start()
+
+    def append(self, wav):
+        """追加一段音频（float 数组），按顺序无缝播放"""
+        pcm = (np.clip(wav, -1.0, 1.0) * 32767).astype('<i2')
+        self.pending.extend(pcm.tobytes())
+        self._feed()
+
+    def _feed(self):
+        if self.device is None or not self.pending:
+            return
+        size = min(len(self.pending), self.output.bytesFree())
+        size -= size % 2
+        if size > 0:
+            written = self.device.write(bytes(self.pending[:size]))
+            if written > 0:
+                del self.pending[:written]
+
+    def stop(self):
+        """停止播放并丢弃未播放的数据"""
+        self.timer.stop()
+        self.output.stop()
+        self.device = None
+        self.pending.clear()
+
 # TTSApp类定义
 class TTSApp(QWidget):
     def __init__(self):
@@ -475,14 +667,12 @@ class TTSApp(QWidget):
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         self.selected_prompt_audio_path = "" # Path for prompt audio
 
-        # State variables for chunked synthesis
-        self.is_chunked_synthesis = False
-        self.text_chunks = []
-        self.current_chunk_index = 0
-        self.temp_audio_files = []
-        self.final_output_path = "" # Store the path for the final merged file
-        self.ffmpeg_path = None # Store path to ffmpeg executable
-        self.tts_model = None # Placeholder for the loaded TTS model instance
+        # 分段合成时边合成边播放的流式播放器
+        self.stream_player = StreamingAudioPlayer(parent=self)
+
+        # 合成队列：任务编号 -> SynthesisJob
+        self.queued_jobs = {}
+        self.job_ids = itertools.count(1)
         
         # Load voices first as UI might depend on it
         self.voice_list = [] # Initialize voice list
@@ -496,16 +686,13 @@ class TTSApp(QWidget):
         self.log("系统初始化完成")
         self.log(f"检测到设备: {self.device}")
 
-        # Check for ffmpeg at the specified relative path
-        relative_ffmpeg_path = os.path.join("softwares", "ffmpeg", "ffmpeg.exe")
-        absolute_ffmpeg_path = get_resource_path(relative_ffmpeg_path)
-
-        if os.path.exists(absolute_ffmpeg_path) and os.path.isfile(absolute_ffmpeg_path):
-            self.ffmpeg_path = absolute_ffmpeg_path
-            self.log(f"检测到 FFmpeg: {self.ffmpeg_path}，长文本合成已启用。")
-        else:
-            self.log(f"警告：未在预期路径 {relative_ffmpeg_path} 找到 FFmpeg，长文本合并功能将不可用。")
-            self.log(f"(尝试查找的绝对路径: {absolute_ffmpeg_path})")
+        # 常驻模型工作线程：启动时在后台预加载模型，之后的合成直接复用
+        self.model_worker = ModelWorker(self.model_dir, self.device, preload=True)
+        self.model_worker.progress_update.connect(self.log)
+        self.model_worker.synthesis_complete.connect(self.on_synthesis_complete_standard)
+        self.model_worker.chunk_ready.connect(self.on_chunk_ready)
+        self.model_worker.job_status.connect(self.on_job_status)
+        self.model_worker.start()
 
     def load_voice_types(self):
         """从CSV文件加载音色类型"""
@@ -736,14 +923,44 @@ class TTSApp(QWidget):
         self.left_layout.addWidget(self.text_input)
         self.left_layout.addWidget(self.char_count_label)
 
-        # Synthesize button
-        self.synthesize_button = PushButton("开始合成")
+        # Synthesize button：加入合成队列，可连续添加多个任务
+        self.synthesize_layout = QHBoxLayout()
+        self.priority_combo = ComboBox(self)
+        self.priority_combo.addItems(list(JOB_PRIORITIES))
+        self.priority_combo.setCurrentText("普通")
+        self.synthesize_button = PushButton("加入队列")
         self.synthesize_button.setFixedWidth(120)
         self.synthesize_button.setIcon(FluentIcon.PLAY)
         self.synthesize_button.clicked.connect(self.on_synthesize)
+        self.synthesize_layout.addStretch(1)
+        self.synthesize_layout.addWidget(QLabel("优先级:"))
+        self.synthesize_layout.addWidget(self.priority_combo)
+        self.synthesize_layout.addWidget(self.synthesize_button)
+        self.synthesize_layout.addStretch(1)
+        self.left_layout.addSpacing(10)
+        self.left_layout.addLayout(self.synthesize_layout)
+
+        # Job queue：排队/合成中/已结束的任务，双击已完成的任务播放
+        self.queue_label = QLabel("合成队列:")
+        self.queue_table = QTableWidget(0, 5, self)
+        self.queue_table.setHorizontalHeaderLabels(["编号", "文本", "参考音频", "优先级", "状态"])
+        self.queue_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.queue_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.queue_table.verticalHeader().setVisible(False)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queue_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.queue_table.cellDoubleClicked.connect(self.on_queue_item_double_clicked)
+        self.queue_buttons_layout = QHBoxLayout()
+        self.cancel_jobs_button = PushButton("取消所选")
+        self.cancel_jobs_button.clicked.connect(self.on_cancel_jobs)
+        self.clear_jobs_button = PushButton("清除已结束")
+        self.clear_jobs_button.clicked.connect(self.on_clear_finished_jobs)
+        self.queue_buttons_layout.addWidget(self.cancel_jobs_button)
+        self.queue_buttons_layout.addWidget(self.clear_jobs_button)
         self.left_layout.addSpacing(10)
-        self.left_layout.addWidget(self.synthesize_button, 0, Qt.AlignHCenter)
-        self.left_layout.addStretch(1) # Add stretch to push button up
+        self.left_layout.addWidget(self.queue_label)
+        self.left_layout.addWidget(self.queue_table, 1)
+        self.left_layout.addLayout(self.queue_buttons_layout)
         
         self.top_splitter.addWidget(self.left_panel)
 
@@ -1022,14 +1239,11 @@ class TTSApp(QWidget):
         self.volume_label.setText(f"音量: {value}")
     
     def on_synthesize(self):
-        """开始语音合成（支持分块）"""
+        """把当前文本和参考音频作为一个任务加入合成队列"""
         text = self.text_input.toPlainText().strip()
         prompt_text = self.prompt_text_edit.text().strip()
         prompt_audio_path = self.selected_prompt_audio_path
         
-        # 临时更改：尝试不分块，直接合成
-        USE_SIMPLE_MODE = True  # 设置为True来尝试简单模式
-        
         # --- Input Validation --- 
         if not text:
             InfoBar.warning("提示", "请输入要合成的文本", parent=self)
@@ -1045,14 +1259,6 @@ class TTSApp(QWidget):
             return
         # -------------------------
 
-        # --- Reset State for Chunked Synthesis ---
-        self.is_chunked_synthesis = False
-        self.text_chunks = []
-        self.current_chunk_index = 0
-        self.temp_audio_files = []
-        self.final_output_path = ""
-        # ----------------------------------------
-
         self.log(f"准备使用 Spark-TTS 合成文本...")
         self.log(f"参考音频: {prompt_audio_path}")
         self.log(f"参考文本: '{prompt_text}'")
@@ -1060,65 +1266,115 @@ class TTSApp(QWidget):
         
         # 检查文本长度是否过长，如果过长，给予特别提示
         if len(text) > 500:
-            self.log(f"注意：文本较长 ({len(text)} 字符)，这可能导致合成速度变慢")
+            self.log(f"注意：文本较长 ({len(text)} 字符)，将按句分段合成，第一段完成后即开始播放")
             InfoBar.info(
                 title="文本较长",
-                content="检测到较长文本，合成可能需要更多时间",
+                content="检测到较长文本，将分段合成并边合成边播放",
                 parent=self,
                 duration=3000
             )
 
-        # 禁用合成按钮，防止重复点击
-        self.synthesize_button.setEnabled(False)
-        self.synthesize_button.setText("合成中...")
+        # 温和清理文本以提高成功率，但确保保留大部分内容
+        cleaned_text = self._clean_text_for_synthesis(text)
+        self.log(f"清理后文本长度: {len(cleaned_text)} 字符")
+        
+        # 准备输出路径
+        output_dir = get_resource_path("Resources/output")
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            now = datetime.datetime.now()
+            job_id = next(self.job_ids)
+            # 带任务编号，同一秒内加入的多个任务不会互相覆盖
+            output_filename = f"sparktts_{now.strftime('%Y%m%d_%H%M%S')}_{job_id}.wav"
+            output_path = os.path.join(output_dir, output_filename)
+            self.log(f"输出路径: {output_path}")
+        except Exception as e:
+            self.log(f"创建输出目录或文件名时出错: {e}")
+            InfoBar.error("错误", f"无法准备输出路径: {e}", parent=self)
+            return
+        
+        # 显示合成信息
+        if len(cleaned_text) != len(text):
+            self.log(f"注意：清理文本过程中移除了 {len(text) - len(cleaned_text)} 个字符")
+        
+        # 提交给常驻模型线程（模型仍在预加载时任务会排队等待）
+        priority_name = self.priority_combo.currentText()
+        job = SynthesisJob(
+            job_id=job_id,
+            text=cleaned_text,
+            prompt_text=prompt_text,
+            prompt_speech_path=prompt_audio_path,
+            output_path=output_path,
+            priority=JOB_PRIORITIES[priority_name]
+        )
+        self.queued_jobs[job_id] = job
+        row = self.queue_table.rowCount()
+        self.queue_table.insertRow(row)
+        for column, value in enumerate([str(job_id), cleaned_text[:50], os.path.basename(prompt_audio_path), priority_name, JOB_QUEUED]):
+            item = QTableWidgetItem(value)
+            item.setData(Qt.UserRole, job_id)
+            self.queue_table.setItem(row, column, item)
+        self.log(f"任务 {job_id} 已加入合成队列（优先级: {priority_name}）")
+        self.model_worker.submit(job)
 
-        # 使用简单模式（不分块）
-        if USE_SIMPLE_MODE:
-            self.log("使用简单模式（不分块）进行合成...")
-            
-            # 温和清理文本以提高成功率，但确保保留大部分内容
-            cleaned_text = self._clean_text_for_synthesis(text)
-            self.log(f"清理后文本长度: {len(cleaned_text)} 字符")
-            
-            # 准备输出路径
-            output_dir = get_resource_path("Resources/output")
-            try:
-                os.makedirs(output_dir, exist_ok=True)
-                now = datetime.datetime.now()
-                output_filename = f"sparktts_simple_{now.strftime('%Y%m%d_%H%M%S')}.wav"
-                output_path = os.path.join(output_dir, output_filename)
-                self.log(f"输出路径: {output_path}")
-            except Exception as e:
-                self.log(f"创建输出目录或文件名时出错: {e}")
-                InfoBar.error("错误", f"无法准备输出路径: {e}", parent=self)
-                self.synthesize_button.setEnabled(True)
-                self.synthesize_button.setText("开始合成")
-                return
-            
-            # 显示合成信息
-            if len(cleaned_text) != len(text):
-                self.log(f"注意：清理文本过程中移除了 {len(text) - len(cleaned_text)} 个字符")
-            
-            # 创建并启动合成线程
-            self.synthesis_thread = SynthesisThread(
-                text=cleaned_text,
-                prompt_text=prompt_text,
-                prompt_speech_path=prompt_audio_path,
-                output_path=output_path,
-                model_dir=self.model_dir,
-                device=self.device
-            )
-            self.synthesis_thread.progress_update.connect(self.log)
-            self.synthesis_thread.synthesis_complete.connect(self.on_synthesis_complete_standard)
-            self.synthesis_thread.start()
+    def _find_job_row(self, job_id):
+        """队列表格中任务所在的行，不存在时返回 -1"""
+        for row in range(self.queue_table.rowCount()):
+            if self.queue_table.item(row, 0).data(Qt.UserRole) == job_id:
+                return row
+        return -1
+
+    def on_job_status(self, job_id, status):
+        """工作线程报告任务状态变化，更新队列表格"""
+        row = self._find_job_row(job_id)
+        if row < 0:
             return
-            
+        status_item = self.queue_table.item(row, 4)
+        # 正在边合成边播放的任务被取消时停止播放
+        if status == JOB_CANCELLED and status_item.text() != JOB_CANCELLED:
+            self.stream_player.stop()
+        status_item.setText(status)
+
+    def on_cancel_jobs(self):
+        """取消所选的排队中/合成中任务"""
+        rows = sorted({index.row() for index in self.queue_table.selectedIndexes()})
+        for row in rows:
+            job = self.queued_jobs.get(self.queue_table.item(row, 0).data(Qt.UserRole))
+            status_item = self.queue_table.item(row, 4)
+            if job is None or status_item.text() not in (JOB_QUEUED, JOB_RUNNING):
+                continue
+            self.model_worker.cancel(job)
+            if status_item.text() == JOB_QUEUED:
+                status_item.setText(JOB_CANCELLED)
+            else:
+                status_item.setText("取消中...")
+            self.log(f"已取消任务 {job.job_id}")
+
+    def on_clear_finished_jobs(self):
+        """从队列表格中移除已完成、失败和已取消的任务"""
+        for row in reversed(range(self.queue_table.rowCount())):
+            if self.queue_table.item(row, 4).text() in (JOB_DONE, JOB_FAILED, JOB_CANCELLED):
+                self.queued_jobs.pop(self.queue_table.item(row, 0).data(Qt.UserRole), None)
+                self.queue_table.removeRow(row)
+
+    def on_queue_item_double_clicked(self, row, column):
+        """双击已完成的任务播放其音频"""
+        job = self.queued_jobs.get(self.queue_table.item(row, 0).data(Qt.UserRole))
+        if job is not None and self.queue_table.item(row, 4).text() == JOB_DONE:
+            self.play_audio_file(job.output_path)
+
+    def on_chunk_ready(self, wav):
+        """收到一段合成好的音频：第一段到达时开始流式播放"""
+        if len(wav) == 0:
+            return
+        if not self.stream_player.is_active:
+            self.media_player.stop()
+            self.stream_player.start()
+            self.log("第一段音频已就绪，开始播放")
+        self.stream_player.append(wav)
+
     def on_synthesis_complete_standard(self, success, output_path):
-        """标准（单次）合成完成后的处理"""
-        # Re-enable button
-        self.synthesize_button.setEnabled(True)
-        self.synthesize_button.setText("开始合成")
-        
+        """任务合成完成后的处理（分段任务的音频已在合成过程中边合成边播放）"""
         if success and os.path.exists(output_path):
             self.log(f"合成成功，音频文件保存在: {output_path}")
             # Update the audio player controls
@@ -1127,8 +1383,6 @@ class TTSApp(QWidget):
             self.player_slider.setEnabled(True)
             self.player_label.setText(os.path.basename(output_path))
             InfoBar.success("成功", "语音合成完成！", parent=self)
-            # 自动播放合成的音频
-            self.play_audio_file(output_path)
         else:
             self.log(f"合成失败. Success: {success}, Path: {output_path}")
             # Clear player state
@@ -1138,9 +1392,6 @@ class TTSApp(QWidget):
             self.player_slider.setValue(0)
             self.player_label.setText("无音频")
             InfoBar.error("失败", "语音合成失败，请检查日志获取详细信息", parent=self)
-            
-        # Clean up thread reference
-        self.synthesis_thread = None # Allow garbage collection
         
     def _clean_text_for_synthesis(self, text):
         """更温和地清理文本，保留更多原始内容"""
@@ -1192,6 +1443,8 @@ class TTSApp(QWidget):
         try:
             # 保存当前播放的文件
             self.current_audio_file = file_path
+            # 停止边合成边播放的流式播放
+            self.stream_player.stop()
             
             # 使用媒体播放器播放
             media_content = QMediaContent(QUrl.fromLocalFile(file_path))
@@ -1353,121 +1606,11 @@ class TTSApp(QWidget):
                 InfoBar.warning("提示", "请选择有效的WAV或MP3文件", parent=self)
                 self.log(f"选择了无效的文件类型: {file_path}")
 
-    # --- New Methods for Chunked Synthesis --- 
-    def _concatenate_audio_chunks(self):
-        """Uses FFmpeg to concatenate temporary audio files into the final output."""
-        if not self.is_chunked_synthesis or not self.temp_audio_files:
-            self.log("没有临时文件需要合并。")
-            self._cleanup_synthesis("无需合并") # Still cleanup
-            return
-
-        if not self.ffmpeg_path:
-            self.log("错误：找不到 FFmpeg，无法合并音频块。")
-            self._cleanup_synthesis("缺少 FFmpeg") # Cleanup temporary files
-            return
-
-        # Create a temporary file list for FFmpeg
-        list_file_path = os.path.join(get_resource_path("Resources/output"), "ffmpeg_list.txt")
-        try:
-            with open(list_file_path, 'w', encoding='utf-8') as f:
-                for temp_file in self.temp_audio_files:
-                    # Ensure paths are suitable for FFmpeg (use forward slashes maybe?)
-                    # Or rely on subprocess handling it correctly on Windows.
-                    # Using absolute paths is generally safer.
-                    abs_path = os.path.abspath(temp_file)
-                    f.write(f"file '{abs_path}'\n") # Use single quotes for paths
-            self.log(f"创建 FFmpeg 文件列表: {list_file_path}")
-        except Exception as e:
-            self.log(f"创建 FFmpeg 文件列表失败: {e}")
-            self._cleanup_synthesis("创建列表文件失败")
-            return
-
-        # Construct FFmpeg command
-        # Use -safe 0 because we are providing absolute paths which might be considered unsafe otherwise.
-        command = [
-            self.ffmpeg_path,
-            '-f', 'concat',
-            '-safe', '0',
-            '-i', list_file_path,
-            '-c', 'copy', # Copy codec, assuming all chunks are wav
-            self.final_output_path
-        ]
-
-        self.log(f"执行 FFmpeg 命令: {' '.join(command)}")
-        concat_success = False
-        try:
-            # Run FFmpeg
-            # Use CREATE_NO_WINDOW on Windows to prevent console popup
-            startupinfo = None
-            if sys.platform == "win32":
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                startupinfo.wShowWindow = subprocess.SW_HIDE
-
-            result = subprocess.run(command, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore', startupinfo=startupinfo)
-            
-            if result.returncode == 0 and os.path.exists(self.final_output_path):
-                self.log(f"FFmpeg 合并成功！最终文件: {self.final_output_path}")
-                # Update player with the final merged file
-                self.player_file_path = self.final_output_path
-                self.play_button.setEnabled(True)
-                self.player_slider.setEnabled(True)
-                self.player_label.setText(os.path.basename(self.final_output_path))
-                InfoBar.success("成功", "分块语音合成并合并完成！", parent=self)
-                concat_success = True
-            else:
-                self.log(f"FFmpeg 合并失败。返回码: {result.returncode}")
-                self.log(f"FFmpeg 标准输出:\n{result.stdout}")
-                self.log(f"FFmpeg 错误输出:\n{result.stderr}")
-                InfoBar.error("失败", "合并音频块失败，请检查日志", parent=self)
-        except Exception as e:
-            self.log(f"执行 FFmpeg 时发生异常: {e}\n{traceback.format_exc()}")
-            InfoBar.error("错误", f"执行 FFmpeg 失败: {e}", parent=self)
-        finally:
-             # Always attempt cleanup, regardless of concatenation success
-             self._cleanup_synthesis("合并完成" if concat_success else "合并失败")
-             # Also try to remove the ffmpeg list file
-             try:
-                 if os.path.exists(list_file_path):
-                     os.remove(list_file_path)
-             except Exception as e:
-                 self.log(f"删除 FFmpeg 列表文件失败: {e}")
-
-    def _cleanup_synthesis(self, reason="未知原因"):
-        """Cleans up temporary files and resets synthesis state."""
-        self.log(f"开始清理合成状态 ({reason})...")
-        
-        # Delete temporary audio files
-        deleted_count = 0
-        failed_count = 0
-        if self.temp_audio_files:
-            self.log(f"尝试删除 {len(self.temp_audio_files)} 个临时文件...")
-            for temp_file in self.temp_audio_files:
-                try:
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                        deleted_count += 1
-                        # self.log(f"已删除: {temp_file}") # Optional: verbose logging
-                except Exception as e:
-                    failed_count += 1
-                    self.log(f"删除临时文件失败 {temp_file}: {e}")
-            self.log(f"临时文件清理完成：成功删除 {deleted_count} 个，失败 {failed_count} 个。")
-        else:
-            self.log("没有临时文件需要删除。")
-            
-        # Reset state variables
-        self.is_chunked_synthesis = False
-        self.text_chunks = []
-        self.current_chunk_index = 0
-        self.temp_audio_files = [] # Clear the list
-        self.final_output_path = ""
-        self.synthesis_thread = None # Clear thread reference
-
-        # Re-enable the synthesis button
-        self.synthesize_button.setEnabled(True)
-        self.synthesize_button.setText("开始合成")
-        self.log("合成状态已重置，按钮已启用。")
-    # -----------------------------------------
+    def closeEvent(self, event):
+        """关闭窗口时结束模型工作线程"""
+        self.model_worker.stop()
+        self.stream_player.stop()
+        super().closeEvent(event)
 
 # 启动应用
 if __name__ == '__main__':
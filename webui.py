@@ -14,30 +14,32 @@
 # limitations under the License.
 
 import os
-import torch
+import uuid
+import numpy as np
 import soundfile as sf
 import logging
 import argparse
 import gradio as gr
 from datetime import datetime
 from cli.SparkTTS import SparkTTS
+from sparktts.utils.request_queue import InferenceQueue
 from sparktts.utils.token_parser import LEVELS_MAP_UI
 
 
-def initialize_model(model_dir="pretrained_models/Spark-TTS-0.5B", device=0):
+def initialize_model(model_dir="pretrained_models/Spark-TTS-0.5B", device=0, prompt_cache_dir=None):
     """Load the model once at the beginning."""
     # 如果设备为'cpu'或不是数字，则使用CPU
     if device == 'cpu' or not isinstance(device, int):
         device = 'cpu'
     
     logging.info(f"Loading model from: {model_dir}")
-    model = SparkTTS(model_dir, device)
+    model = SparkTTS(model_dir, device, prompt_cache_dir=prompt_cache_dir)
     return model
 
 
 def run_tts(
     text,
-    model,
+    inference_queue,
     prompt_text=None,
     prompt_speech=None,
     gender=None,
@@ -45,43 +47,58 @@ def run_tts(
     speed=None,
     save_dir="example/results",
 ):
-    """Perform TTS inference and save the generated audio."""
-    logging.info(f"Saving audio to: {save_dir}")
-
+    """Stream TTS audio chunks as they are generated, then save the whole audio."""
     if prompt_text is not None:
         prompt_text = None if len(prompt_text) <= 1 else prompt_text
 
-    # Ensure the save directory exists
-    os.makedirs(save_dir, exist_ok=True)
+    if gender is not None:
+        voice = {"gender": gender, "pitch": pitch, "speed": speed}
+    else:
+        voice = {"prompt_speech_path": prompt_speech, "prompt_text": prompt_text}
 
-    # Generate unique filename using timestamp
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    save_path = os.path.join(save_dir, f"{timestamp}.wav")
+    logging.info(f"Queued request, {inference_queue.pending} ahead")
 
-    logging.info("Starting inference...")
+    # The request is served by the model worker; leaving early (e.g. the client
+    # disconnected) cancels it
+    sample_rate = inference_queue.model.sample_rate
+    chunks = []
+    for wav in inference_queue.submit(text, voice):
+        chunks.append(wav)
+        yield sample_rate, wav
+    if len(chunks) == 0:
+        logging.warning("No audio was generated")
+        return
 
-    # Perform inference and save the output audio
-    with torch.no_grad():
-        wav = model.inference(
-            text,
-            prompt_speech,
-            prompt_text,
-            gender,
-            pitch,
-            speed,
-        )
+    # Ensure the save directory exists
+    os.makedirs(save_dir, exist_ok=True)
 
-        sf.write(save_path, wav, samplerate=16000)
+    # Timestamp for ordering plus a random suffix, so concurrent requests never collide
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    save_path = os.path.join(save_dir, f"{timestamp}_{uuid.uuid4().hex[:8]}.wav")
+    sf.write(save_path, np.concatenate(chunks), samplerate=sample_rate)
 
     logging.info(f"Audio saved at: {save_path}")
 
-    return save_path
-
 
-def build_ui(model_dir, device=0):
+def build_ui(
+    model_dir,
+    device=0,
+    max_batch_size=4,
+    batch_wait=0.0,
+    prompt_cache_dir=None,
+    low_latency=False,
+    chunk_duration=1.0,
+):
     
-    # Initialize model
-    model = initialize_model(model_dir, device=device)
+    # Initialize model; all requests share it through one queue and worker
+    model = initialize_model(model_dir, device=device, prompt_cache_dir=prompt_cache_dir)
+    inference_queue = InferenceQueue(
+        model,
+        max_batch_size=max_batch_size,
+        batch_wait=batch_wait,
+        low_latency=low_latency,
+        chunk_duration=chunk_duration,
+    )
 
     # Define callback function for voice cloning
     def voice_clone(text, prompt_text, prompt_wav_upload, prompt_wav_record):
@@ -94,13 +111,12 @@ def build_ui(model_dir, device=0):
         prompt_speech = prompt_wav_upload if prompt_wav_upload else prompt_wav_record
         prompt_text_clean = None if len(prompt_text) < 2 else prompt_text
 
-        audio_output_path = run_tts(
+        yield from run_tts(
             text,
-            model,
+            inference_queue,
             prompt_text=prompt_text_clean,
             prompt_speech=prompt_speech
         )
-        return audio_output_path
 
     # Define callback function for creating new voices
     def voice_creation(text, gender, pitch, speed):
@@ -112,14 +128,13 @@ def build_ui(model_dir, device=0):
         """
         pitch_val = LEVELS_MAP_UI[int(pitch)]
         speed_val = LEVELS_MAP_UI[int(speed)]
-        audio_output_path = run_tts(
+        yield from run_tts(
             text,
-            model,
+            inference_queue,
             gender=gender,
             pitch=pitch_val,
             speed=speed_val
         )
-        return audio_output_path
 
     with gr.Blocks() as demo:
         # Use HTML for centered title
@@ -234,6 +249,47 @@ def parse_arguments():
         default=7860,
         help="Server port for Gradio app."
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Requests handled at once; they share the model through the request queue."
+    )
+    parser.add_argument(
+        "--max_queue_size",
+        type=int,
+        default=64,
+        help="Requests waiting beyond the concurrency limit before new ones are rejected."
+    )
+    parser.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=4,
+        help="Maximum queued requests generated together in one batch; 1 disables batching."
+    )
+    parser.add_argument(
+        "--batch_wait_ms",
+        type=float,
+        default=0.0,
+        help="Time to wait for more requests before starting a batch."
+    )
+    parser.add_argument(
+        "--prompt_cache_dir",
+        type=str,
+        default=None,
+        help="On-disk cache of reference prompt tokens, keyed by audio content."
+    )
+    parser.add_argument(
+        "--low_latency",
+        action="store_true",
+        help="Stream with reduced vocoder lookahead (0.32 s instead of ~1.4 s) and crossfaded chunks."
+    )
+    parser.add_argument(
+        "--chunk_duration",
+        type=float,
+        default=1.0,
+        help="Audio length in seconds of the first streamed chunk."
+    )
     args = parser.parse_args()
     return args
 
@@ -244,11 +300,19 @@ if __name__ == "__main__":
     # Build the Gradio demo by specifying the model directory and GPU device
     demo = build_ui(
         model_dir=args.model_dir,
-        device=args.device
+        device=args.device,
+        max_batch_size=args.max_batch_size,
+        batch_wait=args.batch_wait_ms / 1000,
+        prompt_cache_dir=args.prompt_cache_dir,
+        low_latency=args.low_latency,
+        chunk_duration=args.chunk_duration,
     )
 
     # Launch Gradio with the specified server name and port
-    demo.launch(
+    demo.queue(
+        default_concurrency_limit=args.concurrency,
+        max_size=args.max_queue_size
+    ).launch(
         server_name=args.server_name,
         server_port=args.server_port
     )
\ No newline at end of file